@@ -0,0 +1,70 @@
+"""
+Benchmark dos backends de transcrição (real-time factor)
+
+RTF = tempo de processamento / duração do áudio; abaixo de 1 transcreve mais
+rápido que o tempo real. A primeira execução de cada backend é descartada
+(aquecimento: carga do modelo no pool local, conexão TLS na API).
+
+Uso:
+    python scripts/benchmark_transcription.py audio1.ogg audio2.ogg \\
+        --backends local,openai --repeticoes 3
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.transcription_service import audio_duration, create_backend  # noqa: E402
+
+
+def benchmark(backend_name: str, audios: list, repeticoes: int) -> dict:
+    backend = create_backend(backend_name)
+    try:
+        backend.transcribe(audios[0])
+
+        tempos = []
+        duracao_total = 0.0
+        falhas = 0
+        for audio in audios:
+            duracao = audio_duration(audio)
+            if not duracao:
+                print(f"  ignorado (sem duração, instale o ffprobe): {audio}")
+                continue
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                if backend.transcribe(audio) is None:
+                    falhas += 1
+                tempos.append(time.perf_counter() - inicio)
+                duracao_total += duracao
+
+        return {
+            "backend": backend.name,
+            "execucoes": len(tempos),
+            "falhas": falhas,
+            "rtf": sum(tempos) / duracao_total if duracao_total else None,
+            "mediana_s": statistics.median(tempos) if tempos else None
+        }
+    finally:
+        backend.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audios", nargs="+")
+    parser.add_argument("--backends", default="local,openai")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'execuções':>9} {'falhas':>6} {'RTF':>8} {'mediana (s)':>12}")
+    for nome in args.backends.split(","):
+        resultado = benchmark(nome.strip(), args.audios, args.repeticoes)
+        rtf = f"{resultado['rtf']:.3f}" if resultado["rtf"] is not None else "-"
+        mediana = f"{resultado['mediana_s']:.2f}" if resultado["mediana_s"] is not None else "-"
+        print(f"{resultado['backend']:<10} {resultado['execucoes']:>9} {resultado['falhas']:>6} {rtf:>8} {mediana:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,45 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query, Body, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Body, Request, Response, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
+import json
+import random
+import asyncio
+import hashlib
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Awaitable, Callable
 import uuid
 from datetime import datetime, timezone, timedelta
 from services.cnj_service import cnj_service
 from services.whatsapp_service import whatsapp_service
-from services.storage_service import storage_service
 from services.transcription_service import transcription_service
+from services.transcription_queue import transcription_queue
 from services.auth_service import auth_service
-import shutil
+from services.pipeline import Pipeline
+from services.dedup_service import message_deduplicator
+from services.client_directory import client_directory
+from services.conversation_log import conversation_log, FSYNC_INTERVAL as CONVERSATION_FSYNC_INTERVAL
+from services.storage_service import storage_service
+from services.async_storage import async_storage
+from services.blob_store import blob_store, BlobTooLarge
+from services.download_service import (
+    download_service, DOWNLOAD_FIELDS, InvalidSignedUrl, SIGNED_URL_TTL, SIGNED_URL_MAX_TTL
+)
+from services.file_index import file_index, CATEGORIAS
+from services.tiering_service import tiering_service
+from services.search_service import search_service, search_entry, TIPOS_BUSCA
+from services.dashboard_counters import dashboard_counters
+from services.notification_hub import notification_hub, unread_counters, format_sse, read_expiry, PREVIEW_SIZE
+from services.upload_service import (
+    resumable_uploads, check_upload_size, check_request_size, receive_multipart,
+    MultipartError, UploadOffsetMismatch
+)
 import requests as http_requests
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
@@ -470,6 +494,7 @@ async def adicionar_processo_monitoramento(
         }
         
         result = await db.processos_monitorados.insert_one(processo_doc)
+        await dashboard_counters.processo(db.admin_resumo)
         
         return {
             "success": True,
@@ -506,6 +531,138 @@ async def listar_processos_monitorados(user_id: str = Query(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ========================================
+# OUTBOX WHATSAPP - REGISTRO DE ENVIOS
+# ========================================
+
+# Status de entrega do Z-API em ordem de progresso
+WHATSAPP_STATUS_ORDEM = {"SENT": 1, "RECEIVED": 2, "DELIVERED": 2, "READ": 3, "PLAYED": 4}
+
+
+async def registrar_envio_whatsapp(envio: Dict):
+    """
+    Registra mensagem enviada no outbox (collection whatsapp_outbox)
+    
+    Com message_id é um upsert: o callback de status (ou o webhook fromMe)
+    pode chegar antes do retorno do envio e já ter criado o registro.
+    """
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        status = "SENT" if envio.get("success") else "FAILED"
+        ordem = WHATSAPP_STATUS_ORDEM["SENT"] if envio.get("success") else 0
+        dados_envio = {
+            "phone": envio.get("phone"),
+            "template": envio.get("template"),
+            "zaap_id": envio.get("zaap_id"),
+            "simulado": envio.get("simulado", False),
+            "latency_ms": envio.get("latency_ms"),
+            "error": envio.get("error")
+        }
+        
+        message_id = envio.get("message_id")
+        if not message_id:
+            await db.whatsapp_outbox.insert_one({
+                "id": str(uuid.uuid4()),
+                **dados_envio,
+                "status": status,
+                "status_ordem": ordem,
+                "status_em": {status: now},
+                "criado_em": now
+            })
+            return
+        
+        await db.whatsapp_outbox.bulk_write([
+            UpdateOne(
+                {"message_id": message_id},
+                {
+                    "$set": {**dados_envio, f"status_em.{status}": now},
+                    "$max": {"status_ordem": ordem},
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "criado_em": now}
+                },
+                upsert=True
+            ),
+            # Status textual só se nenhum callback já tiver avançado além
+            UpdateOne(
+                {"message_id": message_id, "status_ordem": ordem},
+                {"$set": {"status": status}}
+            )
+        ], ordered=True)
+    except Exception as e:
+        logger.error(f"Erro ao registrar envio WhatsApp: {str(e)}")
+
+
+async def registrar_status_whatsapp(payload: Dict) -> int:
+    """
+    Aplica callback de status do Z-API (MessageStatusCallback) no outbox
+    
+    Um único bulk_write com upserts por messageId; o status só avança
+    (READ não volta para RECEIVED se os callbacks chegarem fora de ordem).
+    """
+    status = str(payload.get("status", "")).upper()
+    ids = payload.get("ids") or ([payload["messageId"]] if payload.get("messageId") else [])
+    
+    if not status or not ids:
+        return 0
+    
+    momento = payload.get("momment")
+    status_em = (
+        datetime.fromtimestamp(momento / 1000, tz=timezone.utc).isoformat()
+        if isinstance(momento, (int, float))
+        else datetime.now(timezone.utc).isoformat()
+    )
+    ordem = WHATSAPP_STATUS_ORDEM.get(status, 0)
+    
+    operacoes = []
+    for message_id in ids:
+        operacoes.append(UpdateOne(
+            {"message_id": message_id},
+            {
+                "$max": {"status_ordem": ordem},
+                "$set": {f"status_em.{status}": status_em},
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "phone": payload.get("phone"),
+                    "criado_em": status_em
+                }
+            },
+            upsert=True
+        ))
+        # Atualiza o status textual apenas se for um avanço
+        operacoes.append(UpdateOne(
+            {"message_id": message_id, "status_ordem": ordem},
+            {"$set": {"status": status}}
+        ))
+    
+    result = await db.whatsapp_outbox.bulk_write(operacoes, ordered=True)
+    return result.upserted_count + result.modified_count
+
+
+@api_router.get("/admin/whatsapp/metricas")
+async def metricas_whatsapp():
+    """
+    Métricas de envio do WhatsApp: latência/falhas por template e taxa de entrega (Admin)
+    """
+    try:
+        por_status = await db.whatsapp_outbox.aggregate([
+            {"$group": {"_id": {"template": "$template", "status": "$status"}, "total": {"$sum": 1}}}
+        ]).to_list(1000)
+        
+        entrega = {}
+        for item in por_status:
+            template = item["_id"].get("template") or "externo"
+            entrega.setdefault(template, {})[item["_id"].get("status") or "desconhecido"] = item["total"]
+        
+        return {
+            "success": True,
+            "envio": whatsapp_service.get_metrics(),
+            "entrega": entrega
+        }
+    
+    except Exception as e:
+        logger.error(f"Erro ao obter métricas do WhatsApp: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ========================================
 # SISTEMA DE AGENDAMENTOS
 # ========================================
@@ -743,6 +900,7 @@ async def criar_agendamento(agendamento: Dict = Body(...)):
         # Cria o agendamento
         agendamento_obj = Agendamento(**agendamento)
         await db.agendamentos.insert_one(agendamento_obj.dict())
+        await dashboard_counters.agendamento(db.admin_resumo, None, agendamento_obj.dict())
         
         # Marca o horário como ocupado
         await db.horarios_disponiveis.update_one(
@@ -762,7 +920,7 @@ async def criar_agendamento(agendamento: Dict = Body(...)):
             except:
                 pass
             
-            whatsapp_service.enviar_confirmacao_agendamento(
+            envio = whatsapp_service.enviar_confirmacao_agendamento(
                 nome=agendamento.get('user_name', ''),
                 phone=telefone,
                 data=data_formatada,
@@ -770,6 +928,7 @@ async def criar_agendamento(agendamento: Dict = Body(...)):
                 tipo=agendamento["tipo"],
                 processo=agendamento.get('processo_numero', '')
             )
+            await registrar_envio_whatsapp(envio)
         
         return {
             "success": True,
@@ -833,25 +992,28 @@ async def atualizar_status_agendamento(agendamento_id: str, dados: Dict = Body(.
     try:
         dados["atualizado_em"] = datetime.now(timezone.utc).isoformat()
         
-        result = await db.agendamentos.update_one(
+        # Documento anterior: o resumo do admin desconta o status antigo
+        anterior = await db.agendamentos.find_one_and_update(
             {"id": agendamento_id},
-            {"$set": dados}
+            {"$set": dados},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count == 0:
+        if not anterior:
             raise HTTPException(status_code=404, detail="Agendamento não encontrado")
         
+        agendamento = {**anterior, **dados}
+        await dashboard_counters.agendamento(db.admin_resumo, anterior, agendamento)
+        
         # Se foi cancelado, libera o horário
         if dados.get("status") == "cancelado":
-            agendamento = await db.agendamentos.find_one({"id": agendamento_id})
-            if agendamento:
-                await db.horarios_disponiveis.update_one(
-                    {
-                        "data": agendamento["data"],
-                        "hora_inicio": agendamento["hora_inicio"]
-                    },
-                    {"$set": {"disponivel": True}}
-                )
+            await db.horarios_disponiveis.update_one(
+                {
+                    "data": agendamento["data"],
+                    "hora_inicio": agendamento["hora_inicio"]
+                },
+                {"$set": {"disponivel": True}}
+            )
         
         return {"success": True, "message": "Agendamento atualizado com sucesso"}
     
@@ -873,6 +1035,7 @@ async def criar_agendamento_manual(dados: Dict = Body(...)):
         
         agendamento_obj = Agendamento(**dados)
         await db.agendamentos.insert_one(agendamento_obj.dict())
+        await dashboard_counters.agendamento(db.admin_resumo, None, agendamento_obj.dict())
         
         # Marca horário como ocupado
         await db.horarios_disponiveis.update_one(
@@ -925,6 +1088,7 @@ class Documento(BaseModel):
     filepath: str
     file_size: int
     file_type: str
+    sha256: Optional[str] = None
     observacoes: Optional[str] = None
     enviado_em: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
@@ -937,6 +1101,8 @@ async def criar_solicitacao_documento(dados: Dict = Body(...)):
     try:
         solicitacao = SolicitacaoDocumento(**dados)
         await db.solicitacoes_documento.insert_one(solicitacao.dict())
+        await dashboard_counters.solicitacao(db.admin_resumo, None, solicitacao.dict())
+        await indexar_busca(_entrada_busca_solicitacao(solicitacao.dict()))
         
         # Buscar telefone do cliente para enviar WhatsApp
         # Em produção, buscar do banco de dados
@@ -945,13 +1111,14 @@ async def criar_solicitacao_documento(dados: Dict = Body(...)):
         
         if telefone:
             # Enviar notificação via WhatsApp
-            whatsapp_service.enviar_solicitacao_documentos(
+            envio = whatsapp_service.enviar_solicitacao_documentos(
                 nome=dados.get('user_name', ''),
                 phone=telefone,
                 titulo=solicitacao.titulo,
                 descricao=solicitacao.descricao,
                 prazo=solicitacao.prazo
             )
+            await registrar_envio_whatsapp(envio)
         
         return {
             "success": True,
@@ -1005,57 +1172,108 @@ async def listar_todas_solicitacoes():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def registrar_documento(
+    solicitacao_id: str,
+    user_id: str,
+    user_name: str,
+    filename: str,
+    file_path: Path,
+    file_type: Optional[str],
+    blob: Dict,
+    observacoes: Optional[str] = None
+) -> Documento:
+    """
+    Cria o registro do documento, a referência ao blob e marca a solicitação como enviada
+    """
+    documento = Documento(
+        solicitacao_id=solicitacao_id,
+        user_id=user_id,
+        user_name=user_name,
+        filename=filename,
+        filepath=str(file_path),
+        file_size=blob["size"],
+        file_type=file_type or "unknown",
+        sha256=blob["sha256"],
+        observacoes=observacoes
+    )
+    
+    await db.documentos.insert_one(documento.dict())
+    await blob_store.add_ref(db.blobs, blob["sha256"], blob["size"], documento.id)
+    
+    # Atualizar status da solicitação
+    anterior = await db.solicitacoes_documento.find_one_and_update(
+        {"id": solicitacao_id},
+        {
+            "$set": {
+                "status": "enviado",
+                "atualizado_em": datetime.now(timezone.utc).isoformat()
+            }
+        },
+        return_document=ReturnDocument.BEFORE
+    )
+    if anterior:
+        await dashboard_counters.solicitacao(db.admin_resumo, anterior, {**anterior, "status": "enviado"})
+    
+    return documento
+
+
+def _caminho_upload(user_id: str, filename: str) -> Path:
+    """Gera nome único para o arquivo na pasta do usuário"""
+    return UPLOAD_DIR / user_id / f"{uuid.uuid4()}{Path(filename).suffix}"
+
+
 @api_router.post("/documentos/upload")
-async def upload_documento(
-    solicitacao_id: str = Form(...),
-    user_id: str = Form(...),
-    user_name: str = Form(...),
-    observacoes: Optional[str] = Form(None),
-    file: UploadFile = File(...)
-):
+async def upload_documento(request: Request):
     """
-    Cliente envia documento
+    Cliente envia documento (multipart: solicitacao_id, user_id, user_name,
+    observacoes opcional e file)
+    
+    O corpo é lido do socket em streaming: a parte do arquivo vai direto para
+    o blob store e o limite do content-type dela é aplicado ao Content-Length
+    e aos bytes recebidos, sem spool intermediário do formulário.
+    Para arquivos grandes ou conexões instáveis use /documentos/uploads (retomável).
     """
     try:
-        # Criar pasta do usuário
-        user_folder = UPLOAD_DIR / user_id
-        user_folder.mkdir(exist_ok=True)
-        
-        # Gerar nome único para o arquivo
-        file_extension = Path(file.filename).suffix
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = user_folder / unique_filename
-        
-        # Salvar arquivo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Obter tamanho do arquivo
-        file_size = file_path.stat().st_size
-        
-        # Criar registro do documento
-        documento = Documento(
-            solicitacao_id=solicitacao_id,
-            user_id=user_id,
-            user_name=user_name,
-            filename=file.filename,
-            filepath=str(file_path),
-            file_size=file_size,
-            file_type=file.content_type or "unknown",
-            observacoes=observacoes
-        )
-        
-        await db.documentos.insert_one(documento.dict())
-        
-        # Atualizar status da solicitação
-        await db.solicitacoes_documento.update_one(
-            {"id": solicitacao_id},
-            {
-                "$set": {
-                    "status": "enviado",
-                    "atualizado_em": datetime.now(timezone.utc).isoformat()
-                }
-            }
+        try:
+            content_length = check_request_size(request.headers.get("content-length"))
+        except ValueError:
+            raise HTTPException(status_code=411, detail="Header Content-Length obrigatório")
+        
+        try:
+            upload = await receive_multipart(
+                request.stream(), request.headers.get("content-type"), content_length
+            )
+        except MultipartError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        
+        try:
+            solicitacao_id = upload.fields.get("solicitacao_id")
+            user_id = upload.fields.get("user_id")
+            user_name = upload.fields.get("user_name")
+            observacoes = upload.fields.get("observacoes")
+            if not (solicitacao_id and user_id and user_name):
+                raise HTTPException(
+                    status_code=422,
+                    detail="Campos obrigatórios: solicitacao_id, user_id, user_name e file"
+                )
+            
+            file_path = _caminho_upload(user_id, upload.filename)
+            
+            # Mover para o blob store (deduplicado por SHA-256, fora do event loop)
+            blob = await async_storage.save_upload(upload, file_path)
+        except BaseException:
+            upload.discard()
+            raise
+        
+        documento = await registrar_documento(
+            solicitacao_id,
+            user_id,
+            user_name,
+            upload.filename,
+            file_path,
+            upload.content_type,
+            blob,
+            observacoes
         )
         
         return {
@@ -1064,11 +1282,173 @@ async def upload_documento(
             "documento": documento.dict()
         }
     
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao fazer upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ========================================
+# UPLOAD RETOMÁVEL (estilo tus)
+# ========================================
+
+class UploadSessionCreate(BaseModel):
+    solicitacao_id: str
+    user_id: str
+    user_name: str
+    filename: str
+    content_type: Optional[str] = None
+    size: int
+    observacoes: Optional[str] = None
+
+
+@api_router.post("/documentos/uploads")
+async def criar_sessao_upload(dados: UploadSessionCreate):
+    """
+    Cria sessão de upload retomável
+    
+    Fluxo: POST cria a sessão -> PATCH com header Upload-Offset envia cada parte
+    -> HEAD informa o offset para retomar após queda de conexão.
+    """
+    try:
+        check_upload_size(dados.size, dados.content_type)
+        
+        sessao = {
+            "id": str(uuid.uuid4()),
+            **dados.dict(),
+            "offset": 0,
+            "status": "em_andamento",
+            "criado_em": datetime.now(timezone.utc).isoformat(),
+            "expira_em": datetime.now(timezone.utc) + timedelta(days=1)
+        }
+        
+        await asyncio.to_thread(resumable_uploads.create, sessao["id"])
+        await db.upload_sessions.insert_one(sessao)
+        
+        return {
+            "success": True,
+            "upload_id": sessao["id"],
+            "offset": 0,
+            "max_size": max_upload_size(dados.content_type)
+        }
+    
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao criar sessão de upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.head("/documentos/uploads/{upload_id}")
+async def offset_sessao_upload(upload_id: str):
+    """
+    Retorna o offset atual da sessão no header Upload-Offset
+    """
+    sessao = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0, "size": 1})
+    if not sessao:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada")
+    
+    offset = await asyncio.to_thread(resumable_uploads.current_offset, upload_id)
+    return Response(
+        status_code=200,
+        headers={
+            "Upload-Offset": str(offset),
+            "Upload-Length": str(sessao["size"]),
+            "Cache-Control": "no-store"
+        }
+    )
+
+
+@api_router.patch("/documentos/uploads/{upload_id}")
+async def enviar_parte_upload(upload_id: str, request: Request):
+    """
+    Recebe uma parte do arquivo (corpo bruto) a partir do header Upload-Offset
+    
+    Quando o último byte chega, o documento é registrado e a resposta traz o documento.
+    """
+    try:
+        sessao = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+        if not sessao or sessao["status"] != "em_andamento":
+            raise HTTPException(status_code=404, detail="Sessão de upload não encontrada")
+        
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Header Upload-Offset obrigatório")
+        
+        novo_offset = await resumable_uploads.write_chunks(
+            upload_id, offset, sessao["size"], request.stream()
+        )
+        
+        if novo_offset < sessao["size"]:
+            await db.upload_sessions.update_one({"id": upload_id}, {"$set": {"offset": novo_offset}})
+            return JSONResponse(
+                {"success": True, "upload_id": upload_id, "offset": novo_offset, "concluido": False},
+                headers={"Upload-Offset": str(novo_offset)}
+            )
+        
+        # Upload completo: mover para o blob store e registrar
+        file_path = _caminho_upload(sessao["user_id"], sessao["filename"])
+        blob = await resumable_uploads.finalize(upload_id, sessao["size"], file_path)
+        
+        documento = await registrar_documento(
+            sessao["solicitacao_id"],
+            sessao["user_id"],
+            sessao["user_name"],
+            sessao["filename"],
+            file_path,
+            sessao.get("content_type"),
+            blob,
+            sessao.get("observacoes")
+        )
+        
+        await db.upload_sessions.update_one(
+            {"id": upload_id},
+            {"$set": {"offset": novo_offset, "status": "concluido", "documento_id": documento.id}}
+        )
+        
+        return JSONResponse(
+            {
+                "success": True,
+                "upload_id": upload_id,
+                "offset": novo_offset,
+                "concluido": True,
+                "documento": documento.dict()
+            },
+            headers={"Upload-Offset": str(novo_offset)}
+        )
+    
+    except UploadOffsetMismatch as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e),
+            headers={"Upload-Offset": str(e.expected)}
+        )
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao receber parte do upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.delete("/documentos/uploads/{upload_id}")
+async def cancelar_sessao_upload(upload_id: str):
+    """
+    Cancela a sessão e remove o arquivo parcial
+    """
+    result = await db.upload_sessions.delete_one({"id": upload_id, "status": "em_andamento"})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada")
+    
+    await asyncio.to_thread(resumable_uploads.discard, upload_id)
+    return {"success": True, "message": "Upload cancelado"}
+
+
 @api_router.get("/documentos/solicitacao/{solicitacao_id}")
 async def listar_documentos_solicitacao(solicitacao_id: str):
     """
@@ -1094,6 +1474,9 @@ async def listar_documentos_solicitacao(solicitacao_id: str):
 async def listar_documentos_usuario(user_id: str):
     """
     Lista todos os documentos de um usuário
+    
+    Cada documento vem com um link de download assinado e temporário
+    (download_url/download_expira_em), para o painel do cliente baixar sem token.
     """
     try:
         documentos = await db.documentos.find(
@@ -1101,6 +1484,11 @@ async def listar_documentos_usuario(user_id: str):
             {"_id": 0}
         ).sort("enviado_em", -1).to_list(1000)
         
+        for documento in documentos:
+            link = download_service.sign(documento)
+            documento["download_url"] = f"/api/documentos/arquivo/{link['token']}"
+            documento["download_expira_em"] = link["expira_em"]
+        
         return {
             "success": True,
             "total": len(documentos),
@@ -1111,32 +1499,176 @@ async def listar_documentos_usuario(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.get("/documentos/download/{documento_id}")
-async def download_documento(documento_id: str):
+async def _ref_documento_arquivado(filepath: str, sha256: str):
+    """Documento foi para a camada fria: o blob deixa de ser referenciado por ele"""
+    documento = await db.documentos.find_one({"filepath": filepath}, {"_id": 0, "id": 1})
+    if documento:
+        await blob_store.release_ref(db.blobs, sha256, documento["id"])
+
+
+async def _ref_documento_restaurado(filepath: str, sha256: str, size: int):
+    """Documento voltou ao disco quente: referencia o blob de novo"""
+    documento = await db.documentos.find_one({"filepath": filepath}, {"_id": 0, "id": 1})
+    if documento:
+        await blob_store.add_ref(db.blobs, sha256, size, documento["id"])
+
+
+async def restaurar_da_camada_fria(filepath: str) -> bool:
     """
-    Faz download de um documento
+    Read-through da camada fria: devolve o arquivo ao disco quente se ele foi arquivado
     """
     try:
-        documento = await db.documentos.find_one({"id": documento_id})
-        
+        return await tiering_service.read_through(
+            db.cold_files, filepath, db.client_files, on_restored=_ref_documento_restaurado
+        )
+    except Exception as e:
+        logger.error(f"Erro ao restaurar {filepath} da camada fria: {str(e)}")
+        return False
+
+
+async def _documento_autorizado(documento_id: str, token: str) -> Dict:
+    """
+    Metadados de download do documento (cache ou banco) se o token for do dono ou de admin
+    """
+    payload = auth_service.decode_token(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    
+    documento = download_service.get_cached(documento_id)
+    if documento is None:
+        documento = await db.documentos.find_one({"id": documento_id}, DOWNLOAD_FIELDS)
         if not documento:
             raise HTTPException(status_code=404, detail="Documento não encontrado")
+        download_service.cache(documento)
+    
+    if payload.get("role") != "admin" and payload.get("sub") != documento.get("user_id"):
+        raise HTTPException(status_code=403, detail="Acesso negado ao documento")
+    return documento
+
+
+@api_router.get("/documentos/download/{documento_id}")
+async def download_documento(
+    documento_id: str,
+    request: Request,
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Faz download de um documento (dono do documento ou admin)
+    
+    O JWT vai no header Authorization (Bearer), nunca na query string,
+    para não aparecer em logs de acesso.
+    
+    Suporta ETag/Last-Modified (304 sem consultar banco ou disco quando os
+    metadados estão em cache) e Range para navegação em PDFs e áudios.
+    Para compartilhar sem token use /documentos/{documento_id}/link.
+    """
+    try:
+        documento = await _documento_autorizado(documento_id, token)
+        
+        try:
+            return download_service.build_response(documento, request.headers)
+        except FileNotFoundError:
+            if not await restaurar_da_camada_fria(documento["filepath"]):
+                download_service.invalidate(documento_id)
+                raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+        
+        try:
+            return download_service.build_response(documento, request.headers)
+        except FileNotFoundError:
+            # Removido de novo entre a restauração e a leitura
+            download_service.invalidate(documento_id)
+            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao fazer download: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get("/documentos/{documento_id}/link")
+async def gerar_link_download(
+    documento_id: str,
+    token: str = Depends(oauth2_scheme),
+    validade: int = Query(SIGNED_URL_TTL, ge=10, le=SIGNED_URL_MAX_TTL, description="Validade em segundos")
+):
+    """
+    Gera link de download assinado e temporário (dono do documento ou admin)
+    
+    JWT no header Authorization (Bearer).
+    """
+    try:
+        documento = await _documento_autorizado(documento_id, token)
         
-        file_path = Path(documento["filepath"])
+        link = download_service.sign(documento, validade)
         
-        if not file_path.exists():
+        return {
+            "success": True,
+            "url": f"/api/documentos/arquivo/{link['token']}",
+            "expira_em": link["expira_em"]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao gerar link de download: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get("/documentos/arquivo/{token}")
+async def download_documento_assinado(token: str, request: Request):
+    """
+    Serve o arquivo de um link assinado, sem acesso ao banco de dados
+    """
+    try:
+        documento = download_service.verify(token)
+    except InvalidSignedUrl as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    
+    try:
+        return download_service.build_response(documento, request.headers)
+    except FileNotFoundError:
+        if not await restaurar_da_camada_fria(documento["filepath"]):
             raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    
+    try:
+        return download_service.build_response(documento, request.headers)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+
+@api_router.get("/admin/documentos/{documento_id}/verificar")
+async def verificar_integridade_documento(documento_id: str):
+    """
+    Confere o arquivo do documento com o SHA-256 registrado no upload (Admin)
+    """
+    try:
+        documento = await db.documentos.find_one(
+            {"id": documento_id},
+            {"_id": 0, "filepath": 1, "sha256": 1}
+        )
+        
+        if not documento:
+            raise HTTPException(status_code=404, detail="Documento não encontrado")
         
-        return FileResponse(
-            path=str(file_path),
-            filename=documento["filename"],
-            media_type=documento["file_type"]
+        if not documento.get("sha256"):
+            return {"success": True, "verificado": False, "message": "Documento sem hash registrado"}
+        
+        integro = await asyncio.to_thread(
+            blob_store.verify, documento["sha256"], Path(documento["filepath"])
         )
+        
+        return {
+            "success": True,
+            "verificado": True,
+            "integro": integro,
+            "sha256": documento["sha256"]
+        }
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Erro ao fazer download: {str(e)}")
+        logger.error(f"Erro ao verificar documento: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1148,14 +1680,17 @@ async def atualizar_status_solicitacao(solicitacao_id: str, dados: Dict = Body(.
     try:
         dados["atualizado_em"] = datetime.now(timezone.utc).isoformat()
         
-        result = await db.solicitacoes_documento.update_one(
+        anterior = await db.solicitacoes_documento.find_one_and_update(
             {"id": solicitacao_id},
-            {"$set": dados}
+            {"$set": dados},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count == 0:
+        if not anterior:
             raise HTTPException(status_code=404, detail="Solicitação não encontrada")
         
+        await dashboard_counters.solicitacao(db.admin_resumo, anterior, {**anterior, **dados})
+        
         return {"success": True, "message": "Status atualizado com sucesso"}
     
     except HTTPException:
@@ -1174,6 +1709,10 @@ async def webhook_whatsapp(payload: Dict = Body(...)):
     """
     Webhook para receber mensagens do WhatsApp via Z-API
     
+    Valida, persiste o evento bruto em webhook_events e responde imediatamente.
+    Download, transcrição, armazenamento e notificação rodam no pipeline
+    (ver whatsapp_pipeline), com concorrência limitada por estágio.
+    
     Tipos de mensagem suportados:
     - Texto
     - Áudio (com transcrição automática)
@@ -1188,210 +1727,543 @@ async def webhook_whatsapp(payload: Dict = Body(...)):
         message_type = payload.get('type', '')
         from_me = payload.get('fromMe', False)
         
-        # Ignorar mensagens enviadas por nós
-        if from_me:
-            return {"success": True, "message": "Mensagem própria ignorada"}
-        
-        # Buscar cliente pelo telefone
-        # Remove todos os caracteres não numéricos e tenta encontrar
-        phone_clean = ''.join(filter(str.isdigit, phone))
-        
-        # Remover código do país se presente
-        if phone_clean.startswith('55') and len(phone_clean) > 11:
-            phone_clean = phone_clean[2:]
-        
-        # Buscar cliente no banco
-        # Formato: (XX) XXXXX-XXXX ou (XX) XXXX-XXXX
-        phone_patterns = [
-            f"({phone_clean[:2]}) {phone_clean[2:7]}-{phone_clean[7:]}",
-            f"({phone_clean[:2]}) {phone_clean[2:6]}-{phone_clean[6:]}",
-            phone
-        ]
-        
-        client = None
-        for pattern in phone_patterns:
-            client = await db.users.find_one({"phone": pattern})
-            if client:
-                break
-        
-        if not client:
-            logger.warning(f"Cliente não encontrado para telefone: {phone}")
-            # Salvar como mensagem não identificada
-            return {"success": False, "message": "Cliente não encontrado"}
-        
-        client_id = client.get("id") or str(client.get("_id"))
-        client_name = client.get("name", "Cliente")
-        
-        # Salvar mensagem no backup
-        storage_service.save_whatsapp_message(client_id, client_name, payload)
+        # Callback de status de entrega/leitura
+        if message_type == "MessageStatusCallback":
+            atualizados = await registrar_status_whatsapp(payload)
+            return {"success": True, "message": "Status registrado", "atualizados": atualizados}
         
-        # Processar por tipo de mensagem
-        if message_type == "chat":
-            # Mensagem de texto
-            text = payload.get('body', '')
-            logger.info(f"Mensagem de texto de {client_name}: {text}")
-            
-            # Criar notificação para o admin
-            await db.notifications.insert_one({
-                "type": "whatsapp_message",
-                "client_id": client_id,
-                "client_name": client_name,
-                "message": text,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            })
+        # Mensagens enviadas por nós: apenas registrar no outbox
+        if from_me:
+            message_id = payload.get('messageId')
+            if message_id:
+                await db.whatsapp_outbox.update_one(
+                    {"message_id": message_id},
+                    {
+                        "$setOnInsert": {
+                            "id": str(uuid.uuid4()),
+                            "phone": phone,
+                            "template": None,
+                            "status": "SENT",
+                            "status_ordem": WHATSAPP_STATUS_ORDEM["SENT"],
+                            "criado_em": datetime.now(timezone.utc).isoformat()
+                        }
+                    },
+                    upsert=True
+                )
+            return {"success": True, "message": "Mensagem própria registrada"}
         
-        elif message_type == "audio" or message_type == "ptt":
-            # Mensagem de áudio
-            audio_url = payload.get('url', '')
-            
-            if audio_url:
-                # Download do áudio
-                audio_response = http_requests.get(audio_url, timeout=30)
-                if audio_response.status_code == 200:
-                    audio_data = audio_response.content
-                    filename = f"audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ogg"
-                    
-                    # Salvar áudio temporariamente para transcrição
-                    temp_path = f"/tmp/{filename}"
-                    with open(temp_path, 'wb') as f:
-                        f.write(audio_data)
-                    
-                    # Transcrever áudio
-                    transcription = transcription_service.transcribe_audio(temp_path)
-                    
-                    # Salvar áudio e transcrição
-                    storage_service.save_whatsapp_audio(
-                        client_id, 
-                        client_name, 
-                        audio_data, 
-                        filename,
-                        transcription
-                    )
-                    
-                    # Criar notificação
-                    await db.notifications.insert_one({
-                        "type": "whatsapp_audio",
-                        "client_id": client_id,
-                        "client_name": client_name,
-                        "transcription": transcription,
-                        "audio_filename": filename,
-                        "created_at": datetime.now(timezone.utc).isoformat()
-                    })
-                    
-                    logger.info(f"Áudio processado de {client_name}")
+        if not phone:
+            return {"success": False, "message": "Telefone ausente no payload"}
         
-        elif message_type == "image":
-            # Imagem
-            image_url = payload.get('url', '')
-            caption = payload.get('caption', '')
-            
-            if image_url:
-                # Download da imagem
-                image_response = http_requests.get(image_url, timeout=30)
-                if image_response.status_code == 200:
-                    image_data = image_response.content
-                    
-                    # Determinar extensão
-                    content_type = image_response.headers.get('content-type', '')
-                    ext = 'jpg'
-                    if 'png' in content_type:
-                        ext = 'png'
-                    elif 'gif' in content_type:
-                        ext = 'gif'
-                    
-                    filename = f"image_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
-                    
-                    # Salvar imagem
-                    image_path = storage_service.save_whatsapp_image(
-                        client_id, 
-                        client_name, 
-                        image_data, 
-                        filename
-                    )
-                    
-                    # Criar solicitação de documento automaticamente
-                    solicitacao = SolicitacaoDocumento(
-                        user_id=client_id,
-                        user_name=client_name,
-                        solicitado_por="whatsapp",
-                        titulo=f"Documento via WhatsApp - {filename}",
-                        descricao=f"Imagem enviada via WhatsApp{': ' + caption if caption else ''}",
-                        status="enviado"
-                    )
-                    
-                    await db.solicitacoes_documento.insert_one(solicitacao.dict())
-                    
-                    # Criar notificação
-                    await db.notifications.insert_one({
-                        "type": "whatsapp_image",
-                        "client_id": client_id,
-                        "client_name": client_name,
-                        "filename": filename,
-                        "caption": caption,
-                        "created_at": datetime.now(timezone.utc).isoformat()
-                    })
-                    
-                    logger.info(f"Imagem recebida de {client_name}")
+        # Descartar retentativas do Z-API antes de qualquer processamento
+        message_id = payload.get('messageId')
+        if message_id and await message_deduplicator.is_duplicate(db.webhook_dedup, message_id):
+            return {"success": True, "message": "Mensagem duplicada ignorada"}
         
-        elif message_type == "document":
-            # Documento
-            doc_url = payload.get('url', '')
-            doc_filename = payload.get('filename', 'document.pdf')
-            
-            if doc_url:
-                # Download do documento
-                doc_response = http_requests.get(doc_url, timeout=30)
-                if doc_response.status_code == 200:
-                    doc_data = doc_response.content
-                    
-                    # Salvar documento
-                    doc_path = storage_service.save_whatsapp_document(
-                        client_id, 
-                        client_name, 
-                        doc_data, 
-                        doc_filename
-                    )
-                    
-                    # Criar solicitação de documento automaticamente
-                    solicitacao = SolicitacaoDocumento(
-                        user_id=client_id,
-                        user_name=client_name,
-                        solicitado_por="whatsapp",
-                        titulo=f"Documento via WhatsApp - {doc_filename}",
-                        descricao=f"Documento enviado via WhatsApp",
-                        status="enviado"
-                    )
-                    
-                    await db.solicitacoes_documento.insert_one(solicitacao.dict())
-                    
-                    # Criar notificação
-                    await db.notifications.insert_one({
-                        "type": "whatsapp_document",
-                        "client_id": client_id,
-                        "client_name": client_name,
-                        "filename": doc_filename,
-                        "created_at": datetime.now(timezone.utc).isoformat()
-                    })
-                    
-                    logger.info(f"Documento recebido de {client_name}")
-        
-        return {"success": True, "message": "Mensagem processada com sucesso"}
+        # Persistir evento bruto antes de responder
+        evento = {
+            "id": str(uuid.uuid4()),
+            "message_id": message_id,
+            "payload": payload,
+            "status": "recebido",
+            "tentativas": 0,
+            "recebido_em": datetime.now(timezone.utc).isoformat()
+        }
+        try:
+            await db.webhook_events.insert_one(evento)
+        except Exception as e:
+            if message_id:
+                await message_deduplicator.forget(db.webhook_dedup, message_id)
+            # 5xx: o Z-API só reenvia a mensagem quando a resposta não é 2xx
+            logger.error(f"Erro ao persistir evento do webhook: {str(e)}")
+            raise HTTPException(status_code=503, detail="Evento não persistido, reenvie")
+        
+        whatsapp_pipeline.submit({"id": evento["id"], "payload": payload})
+        
+        return {"success": True, "message": "Mensagem recebida", "event_id": evento["id"]}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao processar webhook: {str(e)}")
         return {"success": False, "error": str(e)}
 
 
+# ========================================
+# PIPELINE WHATSAPP - PROCESSAMENTO DOS EVENTOS
+# ========================================
+
+whatsapp_pipeline = Pipeline("whatsapp")
+
+# Retentativas de eventos com erro (backoff exponencial a partir do estágio que falhou)
+WEBHOOK_MAX_TENTATIVAS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', '60'))
+
+# Tipos de mídia que passam pelo download
+WHATSAPP_TIPOS_MIDIA = {"audio", "ptt", "image", "document"}
+
+
+async def publicar_notificacao(
+    filtro: Dict,
+    campos: Dict,
+    na_criacao: Optional[Dict] = None,
+    operadores: Optional[Dict] = None
+) -> Optional[Dict]:
+    """
+    Grava a notificação (upsert por `filtro`) com uma nova sequência e a
+    publica nos streams SSE conectados
+    
+    Returns:
+        A notificação publicada, ou None se uma gravação concorrente na mesma
+        notificação já a substituiu
+    
+    Args:
+        campos: Sempre gravados
+        na_criacao: Gravados só quando a notificação é criada
+        operadores: Operadores extras do update (ex: $inc/$push ao agrupar)
+    """
+    seq = await notification_hub.next_seq(db.counters)
+    now = datetime.now(timezone.utc).isoformat()
+    
+    iniciais = {
+        "id": str(uuid.uuid4()), "created_at": now, "lida_por": [], "aberta": True,
+        **(na_criacao or {})
+    }
+    update = {
+        "$set": {**campos, "seq": seq, "atualizado_em": now},
+        "$setOnInsert": {k: v for k, v in iniciais.items() if k not in filtro},
+        **(operadores or {})
+    }
+    try:
+        anterior = await db.notifications.find_one_and_update(
+            filtro, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # Upsert concorrente criou a notificação agrupada: agora é update
+        anterior = await db.notifications.find_one_and_update(
+            filtro, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    
+    # Sem estado anterior: esta chamada inseriu a notificação
+    if anterior is None:
+        await unread_counters.increment(db.notification_counters)
+    
+    notificacao = await db.notifications.find_one({"seq": seq}, {"_id": 0})
+    if notificacao is None:
+        # Uma gravação concorrente na mesma notificação já trocou a sequência
+        # e publica o estado mais novo
+        return None
+    
+    notification_hub.publish(notificacao)
+    return notificacao
+
+
+async def _uma_vez(job: Dict, passo: str, acao: Callable[[], Awaitable[Any]]):
+    """
+    Executa um efeito colateral do estágio só uma vez por evento
+
+    Os passos concluídos ficam em job["passos"], que vai para o estado salvo
+    em webhook_events: a retentativa de um estágio pula o que já foi feito.
+    """
+    if passo in job.get("passos", []):
+        return
+    await acao()
+    job.setdefault("passos", []).append(passo)
+
+
+async def _etapa_identificar(job: Dict):
+    """
+    Estágio 1: identifica o cliente, salva backup e trata mensagens de texto
+    """
+    payload = job["payload"]
+    phone = payload.get('phone', '').replace('@c.us', '')
+    message_type = payload.get('type', '')
+    
+    # Buscar cliente pelo telefone normalizado (índice phone_e164 + cache)
+    cliente = await client_directory.resolve(db.users, phone)
+    
+    if not cliente:
+        logger.warning(f"Cliente não encontrado para telefone: {phone}")
+        job["resultado"] = "cliente_nao_encontrado"
+        return None
+    
+    job["client_id"], job["client_name"] = cliente
+    job["message_type"] = message_type
+    
+    # Salvar mensagem no backup (o mesmo horário identifica a mensagem na busca)
+    job.setdefault("gravado_em", datetime.now().isoformat())
+    await _uma_vez(job, "backup", lambda: async_storage.save_whatsapp_message(
+        job["client_id"], job["client_name"], payload, datetime.fromisoformat(job["gravado_em"])
+    ))
+    
+    if message_type == "chat":
+        # Mensagem de texto
+        text = payload.get('body', '')
+        logger.info(f"Mensagem de texto de {job['client_name']}: {text}")
+        
+        # Agrupa na notificação ainda não lida do cliente ("5 novas mensagens de X")
+        await _uma_vez(job, "notificacao", lambda: publicar_notificacao(
+            {"type": "whatsapp_message", "client_id": job["client_id"], "aberta": True},
+            {"client_name": job["client_name"], "message": text},
+            operadores={
+                "$inc": {"quantidade": 1},
+                "$push": {"mensagens": {
+                    "$each": [{"texto": text, "em": datetime.now(timezone.utc).isoformat()}],
+                    "$slice": -PREVIEW_SIZE
+                }}
+            }
+        ))
+        await indexar_busca(_entrada_busca_mensagem(
+            job["client_id"], job["client_name"], payload, job["gravado_em"]
+        ))
+        return None
+    
+    if message_type in WHATSAPP_TIPOS_MIDIA and payload.get('url'):
+        return ("download", job)
+    
+    return None
+
+
+def _baixar_midia_para_blob(url: str) -> Dict:
+    """
+    Baixa a mídia em streaming direto para o blob store
+    
+    O SHA-256 é calculado durante a gravação (um único write por byte, sem
+    arquivo em /tmp nem o conteúdo inteiro em memória).
+    
+    Returns:
+        Blob gravado ({"sha256", "size", "path", "novo"}) + content_type
+    """
+    with http_requests.get(url, stream=True, timeout=30) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Download da mídia falhou com status {response.status_code}")
+        
+        content_type = response.headers.get('content-type', '')
+        response.raw.decode_content = True
+        blob = blob_store.put(response.raw, max_size=max_upload_size(content_type))
+    
+    return {**blob, "content_type": content_type}
+
+
+async def _etapa_download(job: Dict):
+    """
+    Estágio 2: baixa a mídia sem bloquear o event loop
+    """
+    payload = job["payload"]
+    message_type = job["message_type"]
+    # Sufixo do evento evita colisão de nomes entre mídias do mesmo segundo
+    timestamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job['id'][:8]}"
+    
+    media = await asyncio.to_thread(_baixar_midia_para_blob, payload['url'])
+    job["media"] = media
+    
+    if message_type in ("audio", "ptt"):
+        job["filename"] = f"audio_{timestamp}.ogg"
+        return ("armazenamento", job)
+    
+    if message_type == "image":
+        # Determinar extensão
+        content_type = media["content_type"]
+        ext = 'jpg'
+        if 'png' in content_type:
+            ext = 'png'
+        elif 'gif' in content_type:
+            ext = 'gif'
+        job["filename"] = f"image_{timestamp}.{ext}"
+    else:
+        job["filename"] = payload.get('filename', 'document.pdf')
+    
+    return ("armazenamento", job)
+
+
+async def _etapa_armazenamento(job: Dict):
+    """
+    Estágio 3: grava a mídia na pasta do cliente
+    
+    Áudios vão para a fila persistente de transcrição, que completa a
+    notificação quando o texto fica pronto.
+    """
+    # Retentativa: o blob baixado pode ter sido coletado enquanto o evento esperava
+    if not await asyncio.to_thread(blob_store.blob_path(job["media"]["sha256"]).exists):
+        return ("download", job)
+    
+    args = (job["client_id"], job["client_name"], job["media"], job["filename"])
+    
+    if job["message_type"] in ("audio", "ptt"):
+        if "transcricao_id" not in job:
+            salvo = await async_storage.save_whatsapp_audio(*args)
+            transcricao = await transcription_queue.enqueue(salvo["audio_path"], {
+                "client_id": job["client_id"],
+                "client_name": job["client_name"],
+                "audio_filename": job["filename"]
+            }, audio_sha256=salvo["sha256"])
+            job["transcricao_id"] = transcricao["id"]
+    elif job["message_type"] == "image":
+        await async_storage.save_whatsapp_image(*args)
+    else:
+        await async_storage.save_whatsapp_document(*args)
+    
+    job.pop("media")
+    return ("notificacao", job)
+
+
+async def _etapa_notificacao(job: Dict):
+    """
+    Estágio 4: cria solicitações de documento e notificações para o admin
+    """
+    client_id = job["client_id"]
+    client_name = job["client_name"]
+    filename = job["filename"]
+    message_type = job["message_type"]
+    
+    if message_type in ("audio", "ptt"):
+        # Upsert: a transcrição pode terminar antes da notificação ser criada
+        await publicar_notificacao(
+            {"transcricao_id": job["transcricao_id"]},
+            {
+                "type": "whatsapp_audio",
+                "client_id": client_id,
+                "client_name": client_name,
+                "audio_filename": filename
+            },
+            {"transcription": None, "transcricao_status": "pendente"}
+        )
+        logger.info(f"Áudio processado de {client_name}")
+        return None
+    
+    if message_type == "image":
+        caption = job["payload"].get('caption', '')
+        descricao = f"Imagem enviada via WhatsApp{': ' + caption if caption else ''}"
+    else:
+        caption = None
+        descricao = "Documento enviado via WhatsApp"
+    
+    # Criar solicitação de documento automaticamente
+    if "solicitacao_id" not in job:
+        solicitacao = SolicitacaoDocumento(
+            user_id=client_id,
+            user_name=client_name,
+            solicitado_por="whatsapp",
+            titulo=f"Documento via WhatsApp - {filename}",
+            descricao=descricao,
+            status="enviado"
+        )
+        await db.solicitacoes_documento.insert_one(solicitacao.dict())
+        job["solicitacao_id"] = solicitacao.id
+        await dashboard_counters.solicitacao(db.admin_resumo, None, solicitacao.dict())
+        await indexar_busca(_entrada_busca_solicitacao(solicitacao.dict()))
+    
+    # Criar notificação
+    notificacao = {
+        "type": "whatsapp_image" if message_type == "image" else "whatsapp_document",
+        "client_id": client_id,
+        "client_name": client_name,
+        "filename": filename
+    }
+    if message_type == "image":
+        notificacao["caption"] = caption
+    # Id fixo por evento: a retentativa atualiza a mesma notificação
+    job.setdefault("notificacao_id", str(uuid.uuid4()))
+    await publicar_notificacao({"id": job["notificacao_id"]}, notificacao)
+    
+    logger.info(f"{'Imagem' if message_type == 'image' else 'Documento'} recebido de {client_name}")
+    return None
+
+
+async def _evento_concluido(job: Dict):
+    await db.webhook_events.update_one(
+        {"id": job["id"]},
+        {"$set": {
+            "status": "processado",
+            "resultado": job.get("resultado", "ok"),
+            "processado_em": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+
+
+def _estado_do_job(job: Dict) -> Dict:
+    """
+    Campos acumulados pelos estágios, gravados para retomar o job no estágio
+    que falhou (os estágios só acrescentam campos, então as entradas dele estão aqui)
+    """
+    estado = {k: v for k, v in job.items() if k not in ("id", "payload")}
+    if estado.get("media"):
+        estado["media"] = {k: str(v) if isinstance(v, Path) else v for k, v in estado["media"].items()}
+    return estado
+
+
+async def _evento_com_erro(job: Dict, etapa: str, erro: Exception):
+    """
+    Agenda nova tentativa com backoff; após WEBHOOK_MAX_TENTATIVAS o evento fica como falhou
+    """
+    evento = await db.webhook_events.find_one_and_update(
+        {"id": job["id"]},
+        {
+            "$set": {"status": "erro", "etapa": etapa, "erro": str(erro), "estado": _estado_do_job(job)},
+            "$inc": {"tentativas": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if not evento:
+        return
+    
+    tentativas = evento.get("tentativas", 1)
+    if tentativas >= WEBHOOK_MAX_TENTATIVAS:
+        await db.webhook_events.update_one({"id": job["id"]}, {"$set": {"status": "falhou"}})
+        logger.error(f"Evento {job['id']} falhou após {tentativas} tentativas (etapa {etapa})")
+        return
+    
+    atraso = WEBHOOK_RETRY_BASE_SECONDS * 2 ** (tentativas - 1) * random.uniform(0.8, 1.2)
+    await db.webhook_events.update_one({"id": job["id"]}, {"$set": {
+        "proxima_tentativa_em": (datetime.now(timezone.utc) + timedelta(seconds=atraso)).isoformat()
+    }})
+
+
+whatsapp_pipeline.add_stage("identificar", _etapa_identificar, concurrency=8, max_queue=1000)
+whatsapp_pipeline.add_stage("download", _etapa_download, concurrency=4)
+whatsapp_pipeline.add_stage("armazenamento", _etapa_armazenamento, concurrency=4)
+whatsapp_pipeline.add_stage("notificacao", _etapa_notificacao, concurrency=4)
+whatsapp_pipeline.on_done = _evento_concluido
+whatsapp_pipeline.on_error = _evento_com_erro
+
+
+async def _transcricao_concluida(job: Dict):
+    """
+    Grava o texto ao lado do áudio e completa a notificação do admin
+    """
+    contexto = job["contexto"]
+    await async_storage.save_audio_transcription(
+        contexto["client_id"], contexto["client_name"], job["audio_path"], job["transcription"]
+    )
+    await publicar_notificacao(
+        {"transcricao_id": job["id"]},
+        {"transcription": job["transcription"], "transcricao_status": "concluido"}
+    )
+    await indexar_busca(_entrada_busca_transcricao(job))
+
+
+async def _transcricao_falhou(job: Dict):
+    await publicar_notificacao({"transcricao_id": job["id"]}, {"transcricao_status": "falhou"})
+
+
+transcription_queue.on_complete = _transcricao_concluida
+transcription_queue.on_failed = _transcricao_falhou
+
+
+async def reenfileirar_eventos_pendentes(idade_minima_segundos: int = 0) -> int:
+    """
+    Reenfileira eventos persistidos que ainda não foram processados
+    (reinício do servidor ou fila cheia no momento do webhook) e eventos com
+    erro cuja próxima tentativa venceu, retomando do estágio que falhou
+    """
+    now = datetime.now(timezone.utc)
+    limite = (now - timedelta(seconds=idade_minima_segundos)).isoformat()
+    eventos = await db.webhook_events.find(
+        {"$or": [
+            {"status": "recebido", "recebido_em": {"$lte": limite}},
+            {"status": "erro", "proxima_tentativa_em": {"$lte": now.isoformat()}}
+        ]},
+        {"_id": 0, "id": 1, "payload": 1, "status": 1, "etapa": 1, "estado": 1}
+    ).sort("recebido_em", 1).to_list(500)
+    
+    total = 0
+    for evento in eventos:
+        job = {"id": evento["id"], "payload": evento["payload"]}
+        etapa = None
+        if evento["status"] == "erro":
+            job.update(evento.get("estado") or {})
+            etapa = evento.get("etapa")
+        if whatsapp_pipeline.submit(job, etapa):
+            total += 1
+    return total
+
+
+async def _varredura_eventos_pendentes():
+    while True:
+        await asyncio.sleep(60)
+        try:
+            total = await reenfileirar_eventos_pendentes(idade_minima_segundos=60)
+            if total:
+                logger.info(f"{total} eventos do webhook reenfileirados")
+        except Exception as e:
+            logger.error(f"Erro ao reenfileirar eventos do webhook: {str(e)}")
+
+
+@api_router.get("/admin/webhook/pipeline")
+async def status_pipeline_webhook():
+    """
+    Tamanho das filas e contadores de cada estágio do pipeline (Admin)
+    """
+    return {
+        "success": True,
+        "em_processamento": len(whatsapp_pipeline.in_flight),
+        "duplicadas_descartadas": message_deduplicator.duplicadas,
+        "estagios": whatsapp_pipeline.get_stats()
+    }
+
+
+@api_router.get("/admin/transcricoes")
+async def status_fila_transcricao():
+    """
+    Jobs de transcrição por status e configuração da fila (Admin)
+    """
+    try:
+        return {"success": True, **await transcription_queue.get_stats()}
+    except Exception as e:
+        logger.error(f"Erro ao consultar fila de transcrição: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get("/admin/transcricoes/{job_id}")
+async def status_transcricao(job_id: str):
+    """
+    Status de um job de transcrição (Admin)
+    """
+    job = await transcription_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Transcrição não encontrada")
+    return {"success": True, "transcricao": job}
+
+
+def _admin_do_token(token: str) -> str:
+    """
+    Valida o token JWT de admin e retorna o id do admin
+    """
+    payload = auth_service.decode_token(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    if payload.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Acesso restrito ao admin")
+    return payload.get("sub")
+
+
 @api_router.get("/admin/notifications")
-async def listar_notificacoes():
+async def listar_notificacoes(
+    token: Optional[str] = Query(None, description="Token do admin (inclui estado de leitura)"),
+    nao_lidas: bool = Query(False, description="Somente não lidas (requer token)"),
+    limit: int = Query(50, ge=1, le=200)
+):
     """
     Lista notificações recentes do WhatsApp (Admin)
+    
+    Para receber em tempo real use /admin/notifications/stream.
     """
     try:
+        admin_id = _admin_do_token(token) if token else None
+        
+        query = {}
+        if nao_lidas and admin_id:
+            query["lida_por"] = {"$ne": admin_id}
+        
         notifications = await db.notifications.find(
-            {},
+            query,
             {"_id": 0}
-        ).sort("created_at", -1).limit(50).to_list(50)
+        ).sort("seq", -1).limit(limit).to_list(limit)
+        
+        for notificacao in notifications:
+            lida_por = notificacao.pop("lida_por", [])
+            if admin_id:
+                notificacao["lida"] = admin_id in lida_por
         
         return {
             "success": True,
@@ -1399,30 +2271,249 @@ async def listar_notificacoes():
             "notifications": notifications
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao listar notificações: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Sequências lembradas por conexão SSE para não reenviar ao reler o banco
+ENVIADAS_MAX = 1000
+
+
+@api_router.get("/admin/notifications/stream")
+async def stream_notificacoes(
+    request: Request,
+    token: str = Query(..., description="Token do admin (EventSource não envia headers)"),
+    last_event_id: Optional[int] = Query(None, description="Alternativa ao header Last-Event-ID")
+):
+    """
+    Stream SSE de notificações (Admin)
+    
+    Retoma de Last-Event-ID (reconexão automática do EventSource) ou, na
+    primeira conexão, do cursor salvo para o admin; as perdidas vêm do
+    banco e as novas chegam pelo pub/sub em memória.
+    """
+    admin_id = _admin_do_token(token)
+    
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        cursor = int(header_id)
+    elif last_event_id is not None:
+        cursor = last_event_id
+    else:
+        estado = await db.admin_notification_cursors.find_one({"_id": admin_id})
+        cursor = estado["seq"] if estado else 0
+    
+    async def _salvar_cursor(seq: int):
+        await db.admin_notification_cursors.update_one(
+            {"_id": admin_id}, {"$max": {"seq": seq}}, upsert=True
+        )
+    
+    async def eventos():
+        nonlocal cursor
+        # Sequências já enviadas nesta conexão (as últimas ENVIADAS_MAX)
+        enviadas: Dict[int, None] = {}
+        
+        def _marcar_enviada(seq: int):
+            enviadas[seq] = None
+            if len(enviadas) > ENVIADAS_MAX:
+                del enviadas[next(iter(enviadas))]
+        
+        # Inscreve antes de ler o banco para não perder eventos no intervalo
+        subscription = notification_hub.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            atualizar_do_banco = True
+            
+            while True:
+                if atualizar_do_banco or subscription.overflowed:
+                    subscription.drain()
+                    atualizar_do_banco = False
+                    perdidas = await db.notifications.find(
+                        {"seq": {"$gt": cursor}}, {"_id": 0}
+                    ).sort("seq", 1).limit(500).to_list(500)
+                    for notificacao in perdidas:
+                        if notificacao["seq"] not in enviadas:
+                            yield format_sse(notificacao, admin_id)
+                            _marcar_enviada(notificacao["seq"])
+                        cursor = notificacao["seq"]
+                    if perdidas:
+                        await _salvar_cursor(cursor)
+                        # Ainda pode haver mais de 500 pendentes
+                        atualizar_do_banco = len(perdidas) == 500
+                        continue
+                
+                if await request.is_disconnected():
+                    break
+                
+                try:
+                    notificacao = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Mantém a conexão aberta através de proxies
+                    yield ": ping\n\n"
+                    continue
+                
+                seq = notificacao["seq"]
+                if seq in enviadas:
+                    continue
+                if seq > cursor + 1:
+                    # Lacuna: sequências menores foram alocadas por gravações
+                    # concorrentes que podem já estar no banco sem ter sido
+                    # publicadas ainda; relê do banco em vez de pular
+                    atualizar_do_banco = True
+                    continue
+                # seq <= cursor: publicação atrasada de uma lacuna já ultrapassada
+                yield format_sse(notificacao, admin_id)
+                _marcar_enviada(seq)
+                if seq > cursor:
+                    cursor = seq
+                    await _salvar_cursor(cursor)
+        finally:
+            notification_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.get("/admin/notifications/nao-lidas")
+async def contar_notificacoes_nao_lidas(token: str = Query(...)):
+    """
+    Total de notificações não lidas do admin (badge do painel)
+    """
+    try:
+        admin_id = _admin_do_token(token)
+        total = await unread_counters.get(db.notification_counters, db.notifications, admin_id)
+        return {"success": True, "nao_lidas": total}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao contar notificações não lidas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _marcar_lida(admin_id: str) -> Dict:
+    """
+    Update que marca a notificação como lida pelo admin
+
+    Fecha o agrupamento (próximas mensagens do cliente abrem outra
+    notificação); a remoção pelo TTL é agendada por _agendar_expiracao.
+    """
+    return {
+        "$addToSet": {"lida_por": admin_id},
+        "$set": {"aberta": False}
+    }
+
+
+async def _agendar_expiracao(filtro: Dict):
+    """
+    Agenda a remoção (índice TTL) das notificações que todos os admins já leram
+
+    Enquanto algum admin não leu, a notificação fica sem expira_em e
+    continua na lista de não lidas dele.
+    """
+    admins = await db.admins.distinct("id")
+    if not admins:
+        return
+    await db.notifications.update_many(
+        {**filtro, "lida_por": {"$all": admins}, "expira_em": {"$exists": False}},
+        {"$set": {"expira_em": read_expiry()}}
+    )
+
+
+@api_router.post("/admin/notifications/{notification_id}/lida")
+async def marcar_notificacao_lida(notification_id: str, token: str = Query(...)):
+    """
+    Marca a notificação como lida para o admin
+    """
+    try:
+        admin_id = _admin_do_token(token)
+        result = await db.notifications.update_one(
+            {"id": notification_id, "lida_por": {"$ne": admin_id}},
+            _marcar_lida(admin_id)
+        )
+        if result.modified_count:
+            await unread_counters.decrement(db.notification_counters, admin_id)
+            await _agendar_expiracao({"id": notification_id})
+        elif not await db.notifications.find_one({"id": notification_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Notificação não encontrada")
+        return {"success": True}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao marcar notificação como lida: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/admin/notifications/lidas")
+async def marcar_notificacoes_lidas(
+    token: str = Query(...),
+    ate_seq: Optional[int] = Query(None, description="Marca até esta sequência (padrão: todas)")
+):
+    """
+    Marca todas as notificações (até `ate_seq`) como lidas para o admin
+    """
+    try:
+        admin_id = _admin_do_token(token)
+        query = {"lida_por": {"$ne": admin_id}}
+        if ate_seq is not None:
+            query["seq"] = {"$lte": ate_seq}
+        result = await db.notifications.update_many(query, _marcar_lida(admin_id))
+        await unread_counters.decrement(db.notification_counters, admin_id, result.modified_count)
+        await _agendar_expiracao({"seq": {"$lte": ate_seq}} if ate_seq is not None else {})
+        return {"success": True, "marcadas": result.modified_count}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao marcar notificações como lidas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @api_router.get("/admin/client/{client_id}/files")
-async def listar_arquivos_cliente(client_id: str):
+async def listar_arquivos_cliente(
+    client_id: str,
+    categoria: Optional[str] = Query(None, description="Ex: whatsapp_audios, reunioes"),
+    pagina: int = Query(1, ge=1),
+    por_pagina: int = Query(50, ge=1, le=500),
+    ordem: str = Query("recentes", description="recentes, antigos, nome ou tamanho")
+):
     """
-    Lista todos os arquivos de um cliente (Admin)
+    Lista os arquivos de um cliente a partir do índice de metadados (Admin)
+    
+    "arquivos" traz nome, tamanho, data, tipo e hash; "files" mantém o formato
+    antigo (nomes agrupados por categoria) para a página atual.
     """
     try:
         # Buscar nome do cliente
-        client = await db.users.find_one({"id": client_id})
+        client = await db.users.find_one({"id": client_id}, {"_id": 0, "name": 1})
         if not client:
             raise HTTPException(status_code=404, detail="Cliente não encontrado")
         
         client_name = client.get("name", "Cliente")
         
-        files = storage_service.list_client_files(client_id, client_name)
+        resultado = await file_index.list_files(
+            db.client_files, client_id, categoria, pagina, por_pagina, ordem
+        )
+        
+        files = {categoria_nome: [] for categoria_nome in CATEGORIAS.values()}
+        for arquivo in resultado["arquivos"]:
+            files[arquivo["categoria"]].append(arquivo["nome"])
         
         return {
             "success": True,
             "client_id": client_id,
             "client_name": client_name,
+            "total": resultado["total"],
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "arquivos": resultado["arquivos"],
             "files": files
         }
     
@@ -1433,6 +2524,313 @@ async def listar_arquivos_cliente(client_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/admin/client/{client_id}/conversas")
+async def listar_conversas_cliente(
+    client_id: str,
+    data_inicio: Optional[str] = Query(None, alias="from", description="Data/hora inicial (ISO)"),
+    data_fim: Optional[str] = Query(None, alias="to", description="Data/hora final (ISO)"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor da página anterior")
+):
+    """
+    Histórico de conversas WhatsApp de um cliente, mais recentes primeiro (Admin)
+    
+    Exemplo: /api/admin/client/{id}/conversas?from=2025-01-01&to=2025-01-31&limit=50
+    """
+    try:
+        client = await db.users.find_one({"id": client_id}, {"_id": 0, "name": 1})
+        if not client:
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        
+        # Datas sem horário cobrem o dia inteiro
+        if data_fim and len(data_fim) == 10:
+            data_fim = f"{data_fim}T23:59:59.999999"
+        
+        pagina = await async_storage.read_whatsapp_messages(
+            client_id,
+            client.get("name", "Cliente"),
+            data_inicio,
+            data_fim,
+            limit,
+            cursor
+        )
+        
+        return {
+            "success": True,
+            "client_id": client_id,
+            "total": len(pagina["mensagens"]),
+            "mensagens": pagina["mensagens"],
+            "next_cursor": pagina["next_cursor"]
+        }
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao listar conversas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/admin/armazenamento/camada-fria")
+async def executar_migracao_camada_fria(
+    dias: Optional[int] = Query(None, ge=1, description="Dias sem acesso (padrão: COLD_TIER_DAYS)")
+):
+    """
+    Executa a migração dos arquivos frios imediatamente (Admin)
+    """
+    try:
+        resumo = await migrar_camada_fria(dias)
+        return {"success": True, **resumo}
+    except Exception as e:
+        logger.error(f"Erro na migração para a camada fria: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ========================================
+# BUSCA TEXTUAL
+# ========================================
+
+def _entrada_busca_mensagem(client_id: str, client_name: str, mensagem: Dict, gravado_em: str) -> Dict:
+    """
+    Entrada de uma mensagem de texto (webhook e reindex usam a mesma chave e data)
+    
+    Args:
+        gravado_em: timestamp da mensagem no backup de conversas (hora local)
+    """
+    # Horário do WhatsApp (momment, epoch ms); sem ele, o horário da gravação no backup
+    momento = mensagem.get("momment")
+    if isinstance(momento, (int, float)):
+        data = datetime.fromtimestamp(momento / 1000, tz=timezone.utc).isoformat()
+    else:
+        data = datetime.fromisoformat(gravado_em).astimezone(timezone.utc).isoformat()
+    return search_entry(
+        "mensagem", mensagem.get("messageId") or f"{client_id}:{gravado_em}",
+        client_id, client_name, f"Mensagem de {client_name}", mensagem.get("body", ""), data
+    )
+
+
+def _entrada_busca_solicitacao(solicitacao: Dict) -> Dict:
+    return search_entry(
+        "solicitacao", solicitacao["id"], solicitacao["user_id"], solicitacao["user_name"],
+        solicitacao["titulo"], solicitacao.get("descricao", ""), solicitacao.get("criado_em")
+    )
+
+
+def _entrada_busca_transcricao(job: Dict) -> Dict:
+    contexto = job["contexto"]
+    return search_entry(
+        "transcricao", job["id"], contexto.get("client_id"), contexto.get("client_name"),
+        f"Áudio {contexto.get('audio_filename', '')}".strip(), job["transcription"] or "",
+        job.get("criado_em")
+    )
+
+
+async def indexar_busca(entrada: Dict):
+    """Atualiza o índice de busca sem interromper a ingestão em caso de erro"""
+    try:
+        await search_service.index(db.search_index, entrada)
+    except Exception as e:
+        logger.error(f"Erro ao indexar {entrada['_id']} para busca: {str(e)}")
+
+
+def _mensagens_do_backup(client_id: str, client_name: str, pasta: Path) -> List[Dict]:
+    """Mensagens de texto do backup de conversas do cliente (fonte completa)"""
+    entradas = []
+    for registro in conversation_log.iter_range(pasta / "backup_conversas"):
+        mensagem = registro["data"]
+        if mensagem.get("type") != "chat" or not mensagem.get("body"):
+            continue
+        entradas.append(_entrada_busca_mensagem(client_id, client_name, mensagem, registro["timestamp"]))
+    return entradas
+
+
+async def reindexar_busca() -> Dict:
+    """
+    Reconstrói o índice de busca a partir das fontes (backups, transcrições e solicitações)
+    """
+    resumo = {tipo: 0 for tipo in TIPOS_BUSCA}
+    
+    nomes = {
+        user["id"]: user.get("name", "Cliente")
+        async for user in db.users.find({}, {"_id": 0, "id": 1, "name": 1})
+    }
+    pastas = await asyncio.to_thread(lambda: list(storage_service.iter_client_folders()))
+    for client_id, pasta in pastas:
+        entradas = await asyncio.to_thread(
+            _mensagens_do_backup, client_id, nomes.get(client_id, "Cliente"), pasta
+        )
+        resumo["mensagem"] += await search_service.index_many(db.search_index, entradas)
+    
+    lote = []
+    async for job in db.transcription_jobs.find({"status": "concluido"}, {"_id": 0}):
+        lote.append(_entrada_busca_transcricao(job))
+        if len(lote) >= 500:
+            resumo["transcricao"] += await search_service.index_many(db.search_index, lote)
+            lote = []
+    resumo["transcricao"] += await search_service.index_many(db.search_index, lote)
+    
+    lote = []
+    async for solicitacao in db.solicitacoes_documento.find({}, {"_id": 0}):
+        lote.append(_entrada_busca_solicitacao(solicitacao))
+        if len(lote) >= 500:
+            resumo["solicitacao"] += await search_service.index_many(db.search_index, lote)
+            lote = []
+    resumo["solicitacao"] += await search_service.index_many(db.search_index, lote)
+    
+    return resumo
+
+
+@api_router.get("/admin/search")
+async def buscar(
+    q: str = Query(..., min_length=2, description="Termos da busca"),
+    pagina: int = Query(1, ge=1),
+    por_pagina: int = Query(20, ge=1, le=100),
+    tipo: Optional[str] = Query(None, description="mensagem, transcricao ou solicitacao"),
+    client_id: Optional[str] = Query(None)
+):
+    """
+    Busca textual ranqueada em mensagens, transcrições e solicitações (Admin)
+    
+    Stemming em português e sem diferença de acentos: "audiencia" encontra
+    "audiências". Use aspas para frase exata e -termo para excluir.
+    """
+    try:
+        if tipo and tipo not in TIPOS_BUSCA:
+            raise HTTPException(status_code=400, detail=f"Tipo inválido. Use: {', '.join(TIPOS_BUSCA)}")
+        
+        resultado = await search_service.search(db.search_index, q, pagina, por_pagina, tipo, client_id)
+        
+        return {
+            "success": True,
+            "q": q,
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            **resultado
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro na busca: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/admin/search/reindexar")
+async def reindexar_indice_busca():
+    """
+    Reconstrói o índice de busca a partir dos dados existentes (Admin)
+    """
+    try:
+        resumo = await reindexar_busca()
+        return {"success": True, "indexados": resumo}
+    except Exception as e:
+        logger.error(f"Erro ao reindexar busca: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def reconciliar_resumo_admin() -> Dict:
+    """Recalcula o resumo do painel admin a partir das collections"""
+    return await dashboard_counters.reconcile(
+        db.admin_resumo, db.agendamentos, db.solicitacoes_documento, db.processos_monitorados
+    )
+
+
+@api_router.get("/admin/resumo")
+async def resumo_admin(
+    token: Optional[str] = Query(None, description="Token do admin (inclui mensagens não lidas)"),
+    hoje: Optional[str] = Query(None, description="Data local YYYY-MM-DD (padrão: data UTC)"),
+    dias: int = Query(14, ge=1, le=90, description="Dias da agenda a partir de hoje")
+):
+    """
+    Totais do painel admin em uma única leitura (Admin)
+    """
+    try:
+        admin_id = _admin_do_token(token) if token else None
+        
+        doc = await dashboard_counters.get(db.admin_resumo)
+        if doc is None:
+            doc = await reconciliar_resumo_admin()
+        
+        resumo = dashboard_counters.format(
+            doc, hoje or datetime.now(timezone.utc).strftime("%Y-%m-%d"), dias
+        )
+        if admin_id:
+            resumo["mensagens_nao_lidas"] = await unread_counters.get(
+                db.notification_counters, db.notifications, admin_id
+            )
+        
+        return {"success": True, "resumo": resumo}
+    
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Parâmetro hoje deve estar no formato YYYY-MM-DD")
+    except Exception as e:
+        logger.error(f"Erro ao gerar resumo do admin: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ========================================
+# PAINEL DO CLIENTE
+# ========================================
+
+# Itens por lista no painel do cliente
+PAINEL_LIMITE = 100
+
+# Campos exibidos pelo ClientDashboard
+PAINEL_CAMPOS_AGENDAMENTO = {"_id": 0, "id": 1, "data": 1, "hora_inicio": 1, "hora_fim": 1,
+                             "tipo": 1, "status": 1, "processo_numero": 1, "observacoes": 1}
+PAINEL_CAMPOS_SOLICITACAO = {"_id": 0, "id": 1, "titulo": 1, "descricao": 1, "status": 1,
+                             "prazo": 1, "criado_em": 1}
+PAINEL_CAMPOS_DOCUMENTO = {"_id": 0, "id": 1, "solicitacao_id": 1, "filename": 1, "file_size": 1,
+                           "file_type": 1, "enviado_em": 1}
+PAINEL_CAMPOS_PROCESSO = {"_id": 0, "numero_processo": 1, "tribunal": 1, "ultima_atualizacao": 1,
+                          "dados_processo.classe": 1, "dados_processo.assunto": 1,
+                          "dados_processo.orgaoJulgador": 1, "dados_processo.movimentos": {"$slice": -2}}
+
+
+@api_router.get("/cliente/{user_id}/painel")
+async def painel_cliente(user_id: str, request: Request):
+    """
+    Dados do portal do cliente em uma única resposta
+    
+    Agendamentos, solicitações, documentos e processos monitorados são
+    consultados em paralelo, só com os campos exibidos. Suporta
+    If-None-Match: sem mudanças a resposta é 304 sem corpo.
+    """
+    try:
+        agendamentos, solicitacoes, documentos, processos = await asyncio.gather(
+            db.agendamentos.find({"user_id": user_id}, PAINEL_CAMPOS_AGENDAMENTO)
+                .sort("data", -1).to_list(PAINEL_LIMITE),
+            db.solicitacoes_documento.find({"user_id": user_id}, PAINEL_CAMPOS_SOLICITACAO)
+                .sort("criado_em", -1).to_list(PAINEL_LIMITE),
+            db.documentos.find({"user_id": user_id}, PAINEL_CAMPOS_DOCUMENTO)
+                .sort("enviado_em", -1).to_list(PAINEL_LIMITE),
+            db.processos_monitorados.find({"user_id": user_id, "ativo": True}, PAINEL_CAMPOS_PROCESSO)
+                .to_list(PAINEL_LIMITE)
+        )
+        
+        painel = {
+            "agendamentos": agendamentos,
+            "solicitacoes": solicitacoes,
+            "documentos": documentos,
+            "processos": processos
+        }
+        corpo = json.dumps(painel, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+        etag = f'"{hashlib.sha256(corpo).hexdigest()[:32]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        
+        if download_service.is_not_modified(request.headers, etag, None):
+            return Response(status_code=304, headers=headers)
+        
+        return Response(content=corpo, media_type="application/json", headers=headers)
+    
+    except Exception as e:
+        logger.error(f"Erro ao montar painel do cliente: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -1451,6 +2849,262 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def _unificar_outbox_duplicado():
+    """
+    Junta registros do outbox duplicados por message_id (envio + callback
+    gravados separadamente antes do upsert), mantendo o registro do envio
+    """
+    duplicados = db.whatsapp_outbox.aggregate([
+        {"$match": {"message_id": {"$type": "string"}}},
+        {"$group": {"_id": "$message_id", "docs": {"$push": "$$ROOT"}, "total": {"$sum": 1}}},
+        {"$match": {"total": {"$gt": 1}}}
+    ])
+    async for grupo in duplicados:
+        docs = sorted(grupo["docs"], key=lambda d: d.get("template") is None)
+        principal = docs[0]
+        mais_avancado = max(docs, key=lambda d: d.get("status_ordem", 0))
+        status_em = {}
+        for doc in docs:
+            status_em.update(doc.get("status_em") or {})
+        
+        await db.whatsapp_outbox.update_one({"_id": principal["_id"]}, {"$set": {
+            "status_em": status_em,
+            "status_ordem": mais_avancado.get("status_ordem", 0),
+            "status": mais_avancado.get("status")
+        }})
+        await db.whatsapp_outbox.delete_many({"_id": {"$in": [doc["_id"] for doc in docs[1:]]}})
+
+async def _numerar_notificacoes_antigas():
+    """Atribui id e sequência às notificações gravadas antes do stream SSE"""
+    antigas = await db.notifications.find(
+        {"seq": {"$exists": False}}, {"_id": 1, "id": 1}
+    ).sort("created_at", 1).to_list(None)
+    for inicio in range(0, len(antigas), 1000):
+        lote = antigas[inicio:inicio + 1000]
+        # Um único $inc reserva a sequência do lote inteiro
+        ultimo = await notification_hub.next_seq(db.counters, len(lote))
+        operacoes = []
+        for seq, antiga in enumerate(lote, start=ultimo - len(lote) + 1):
+            campos = {"seq": seq}
+            if not antiga.get("id"):
+                campos["id"] = str(uuid.uuid4())
+            operacoes.append(UpdateOne({"_id": antiga["_id"]}, {"$set": campos}))
+        await db.notifications.bulk_write(operacoes, ordered=False)
+    # Lidas antes da retenção por TTL
+    await db.notifications.update_many(
+        {"lida_por.0": {"$exists": True}, "aberta": {"$ne": False}},
+        {"$set": {"aberta": False}}
+    )
+    # Expiração agendada na primeira leitura (antes de exigir a leitura de
+    # todos os admins) volta a esperar os admins que ainda não leram
+    admins = await db.admins.distinct("id")
+    if admins:
+        await db.notifications.update_many(
+            {"expira_em": {"$exists": True}, "lida_por": {"$not": {"$all": admins}}},
+            {"$unset": {"expira_em": ""}}
+        )
+    await _agendar_expiracao({})
+
+@app.on_event("startup")
+async def create_indexes():
+    await _unificar_outbox_duplicado()
+    indices_outbox = await db.whatsapp_outbox.index_information()
+    if "message_id_1" in indices_outbox and not indices_outbox["message_id_1"].get("unique"):
+        await db.whatsapp_outbox.drop_index("message_id_1")
+    await db.whatsapp_outbox.create_index(
+        "message_id", unique=True, partialFilterExpression={"message_id": {"$type": "string"}}
+    )
+    await db.whatsapp_outbox.create_index([("template", 1), ("status", 1)])
+    await db.webhook_events.create_index([("status", 1), ("recebido_em", 1)])
+    await db.webhook_events.create_index([("status", 1), ("proxima_tentativa_em", 1)])
+    await message_deduplicator.ensure_indexes(db.webhook_dedup)
+    await client_directory.ensure_indexes(db.users)
+    await db.documentos.create_index("sha256")
+    await db.documentos.create_index("filepath")
+    await db.documentos.create_index([("user_id", 1), ("enviado_em", -1)])
+    await db.agendamentos.create_index([("user_id", 1), ("data", -1)])
+    await db.solicitacoes_documento.create_index([("user_id", 1), ("criado_em", -1)])
+    await db.processos_monitorados.create_index([("user_id", 1), ("ativo", 1)])
+    await db.upload_sessions.create_index("id")
+    await db.upload_sessions.create_index("expira_em", expireAfterSeconds=0)
+    await file_index.ensure_indexes(db.client_files)
+    await tiering_service.ensure_indexes(db.cold_files)
+    await transcription_queue.ensure_indexes(db.transcription_jobs)
+    await search_service.ensure_indexes(db.search_index)
+    await db.notifications.create_index("seq")
+    await db.notifications.create_index("id")
+    await db.notifications.create_index("transcricao_id", sparse=True)
+    await db.notifications.create_index(
+        [("type", 1), ("client_id", 1)],
+        unique=True,
+        partialFilterExpression={"type": "whatsapp_message", "aberta": True}
+    )
+    await db.notifications.create_index("expira_em", expireAfterSeconds=0)
+    await _numerar_notificacoes_antigas()
+
+async def reconciliar_indice_arquivos() -> Dict:
+    """
+    Sincroniza client_files com o disco para todas as pastas de clientes
+    """
+    pastas = await asyncio.to_thread(lambda: list(storage_service.iter_client_folders()))
+    resumo = {"clientes": 0, "verificados": 0, "alterados": 0}
+    
+    for client_id, pasta in pastas:
+        disco = await asyncio.to_thread(file_index.scan_client_folder, client_id, pasta)
+        resultado = await file_index.reconcile(db.client_files, client_id, disco)
+        resumo["clientes"] += 1
+        resumo["verificados"] += resultado["verificados"]
+        resumo["alterados"] += resultado["alterados"]
+    
+    return resumo
+
+
+async def _manutencao_indice_arquivos():
+    """Flush das gravações a cada segundo e reconciliação com o disco a cada 6h"""
+    proxima_reconciliacao = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await file_index.flush(db.client_files)
+            if loop.time() >= proxima_reconciliacao:
+                resumo = await reconciliar_indice_arquivos()
+                logger.info(f"Índice de arquivos reconciliado: {resumo}")
+                proxima_reconciliacao = loop.time() + 6 * 60 * 60
+        except Exception as e:
+            logger.error(f"Erro na manutenção do índice de arquivos: {str(e)}")
+        await asyncio.sleep(1)
+
+def _pastas_armazenamento() -> List[tuple]:
+    """(client_id, pasta) do storage dos clientes e dos uploads do site"""
+    pastas = list(storage_service.iter_client_folders())
+    pastas.extend(
+        (entry.name, Path(entry.path))
+        for entry in os.scandir(UPLOAD_DIR) if entry.is_dir()
+    )
+    return pastas
+
+
+async def migrar_camada_fria(dias: Optional[int] = None) -> Dict:
+    """
+    Move para a camada fria os arquivos sem acesso há `dias` dias
+    """
+    pastas = await asyncio.to_thread(_pastas_armazenamento)
+    return await tiering_service.migrate(
+        db.cold_files, pastas, dias, db.client_files,
+        blobs_collection=db.blobs, on_archived=_ref_documento_arquivado
+    )
+
+
+async def _tiering_periodico():
+    """Migração diária dos arquivos frios"""
+    while True:
+        await asyncio.sleep(24 * 60 * 60)
+        try:
+            await migrar_camada_fria()
+        except Exception as e:
+            logger.error(f"Erro na migração para a camada fria: {str(e)}")
+
+
+async def _reconciliar_contadores_periodico():
+    """Corrige os contadores de não lidas a cada hora"""
+    while True:
+        await asyncio.sleep(60 * 60)
+        try:
+            ajustes = await unread_counters.reconcile(db.notification_counters, db.notifications)
+            if ajustes:
+                logger.info(f"Contadores de notificações reconciliados: {ajustes}")
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar contadores de notificações: {str(e)}")
+
+
+async def _reconciliar_resumo_periodico():
+    """Recalcula o resumo do painel admin na inicialização e a cada hora"""
+    while True:
+        try:
+            await reconciliar_resumo_admin()
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar resumo do admin: {str(e)}")
+        await asyncio.sleep(60 * 60)
+
+
+async def _fsync_conversas_periodico():
+    """fsync das conversas gravadas em rajada por clientes que ficaram em silêncio"""
+    while True:
+        await asyncio.sleep(CONVERSATION_FSYNC_INTERVAL)
+        try:
+            await asyncio.to_thread(conversation_log.flush)
+        except Exception as e:
+            logger.error(f"Erro no fsync do log de conversas: {str(e)}")
+
+
+async def _limpar_uploads_abandonados():
+    """Remove a cada hora os arquivos parciais de sessões expiradas pelo TTL"""
+    while True:
+        await asyncio.sleep(60 * 60)
+        try:
+            ativas = {
+                sessao["id"] async for sessao in db.upload_sessions.find(
+                    {"status": "em_andamento"}, {"_id": 0, "id": 1}
+                )
+            }
+            await resumable_uploads.sweep(ativas)
+        except Exception as e:
+            logger.error(f"Erro na limpeza de uploads abandonados: {str(e)}")
+
+
+@app.on_event("startup")
+async def start_transcription_queue():
+    await transcription_queue.start(db.transcription_jobs, db.transcription_cache)
+
+@app.on_event("startup")
+async def start_whatsapp_pipeline():
+    global varredura_task
+    await whatsapp_pipeline.start()
+    await reenfileirar_eventos_pendentes()
+    varredura_task = asyncio.create_task(_varredura_eventos_pendentes())
+
+@app.on_event("startup")
+async def start_file_index():
+    global indice_arquivos_task
+    indice_arquivos_task = asyncio.create_task(_manutencao_indice_arquivos())
+
+@app.on_event("startup")
+async def start_tiering():
+    global tiering_task
+    tiering_task = asyncio.create_task(_tiering_periodico())
+
+@app.on_event("startup")
+async def start_notification_counters():
+    global contadores_notificacoes_task
+    contadores_notificacoes_task = asyncio.create_task(_reconciliar_contadores_periodico())
+
+@app.on_event("startup")
+async def start_admin_summary():
+    global resumo_admin_task
+    resumo_admin_task = asyncio.create_task(_reconciliar_resumo_periodico())
+
+@app.on_event("startup")
+async def start_conversation_fsync():
+    global fsync_conversas_task
+    fsync_conversas_task = asyncio.create_task(_fsync_conversas_periodico())
+
+@app.on_event("startup")
+async def start_upload_cleanup():
+    global limpeza_uploads_task
+    limpeza_uploads_task = asyncio.create_task(_limpar_uploads_abandonados())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    varredura_task.cancel()
+    indice_arquivos_task.cancel()
+    tiering_task.cancel()
+    contadores_notificacoes_task.cancel()
+    resumo_admin_task.cancel()
+    fsync_conversas_task.cancel()
+    limpeza_uploads_task.cancel()
+    await whatsapp_pipeline.stop()
+    await transcription_queue.stop()
+    transcription_service.shutdown()
+    conversation_log.flush()
+    async_storage.shutdown()
     client.close()
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+API assíncrona de armazenamento para uso nos handlers do FastAPI
+
+As operações de disco do StorageService rodam em um pool de threads
+dedicado (separado do pool padrão do asyncio), com limite de operações
+simultâneas, para que discos lentos não travem o event loop.
+"""
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+from services.storage_service import MediaSource, StorageService, storage_service
+from services.upload_service import StreamedUpload
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncStorageService:
+    """Versão awaitable das operações do StorageService"""
+
+    def __init__(self, storage: StorageService):
+        self.storage = storage
+        self.io_workers = int(os.environ.get('STORAGE_IO_WORKERS', '8'))
+        self.max_concurrent = int(os.environ.get('STORAGE_MAX_CONCURRENT', '32'))
+        self._pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="storage-io")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _run(self, func, *args, **kwargs):
+        """Executa a função bloqueante no pool de I/O respeitando o limite"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        """Encerra o pool aguardando as gravações em andamento"""
+        self._pool.shutdown(wait=True)
+
+    async def save_whatsapp_message(
+        self, client_id: str, client_name: str, message_data: Dict, timestamp: Optional[datetime] = None
+    ) -> str:
+        return await self._run(self.storage.save_whatsapp_message, client_id, client_name, message_data, timestamp)
+
+    async def read_whatsapp_messages(self, client_id: str, client_name: str, *args) -> Dict:
+        return await self._run(self.storage.read_whatsapp_messages, client_id, client_name, *args)
+
+    async def save_whatsapp_audio(
+        self,
+        client_id: str,
+        client_name: str,
+        audio_data: MediaSource,
+        filename: str,
+        transcription: Optional[str] = None
+    ) -> Dict[str, str]:
+        return await self._run(
+            self.storage.save_whatsapp_audio, client_id, client_name, audio_data, filename, transcription
+        )
+
+    async def save_audio_transcription(self, client_id: str, client_name: str, audio_path: str, transcription: str) -> str:
+        return await self._run(
+            self.storage.save_audio_transcription, client_id, client_name, audio_path, transcription
+        )
+
+    async def save_whatsapp_image(self, client_id: str, client_name: str, image_data: MediaSource, filename: str) -> str:
+        return await self._run(self.storage.save_whatsapp_image, client_id, client_name, image_data, filename)
+
+    async def save_whatsapp_document(self, client_id: str, client_name: str, document_data: MediaSource, filename: str) -> str:
+        return await self._run(self.storage.save_whatsapp_document, client_id, client_name, document_data, filename)
+
+    async def save_meeting_record(self, client_id: str, client_name: str, meeting_data: Dict) -> str:
+        return await self._run(self.storage.save_meeting_record, client_id, client_name, meeting_data)
+
+    async def list_client_files(self, client_id: str, client_name: str) -> Dict[str, List[str]]:
+        return await self._run(self.storage.list_client_files, client_id, client_name)
+
+    async def save_upload(self, upload: StreamedUpload, dest: Path) -> Dict:
+        """
+        Move um upload recebido em streaming para o blob store e liga a dest
+
+        Returns:
+            {"sha256", "size", "novo"}
+        """
+        blob = await self._run(upload.commit, dest)
+        return {"sha256": blob["sha256"], "size": blob["size"], "novo": blob["novo"]}
+
+    async def read_file(self, path: Path) -> bytes:
+        return await self._run(Path(path).read_bytes)
+
+
+# Instância global
+async_storage = AsyncStorageService(storage_service)
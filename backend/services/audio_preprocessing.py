@@ -0,0 +1,199 @@
+"""
+Pré-processamento de áudio para transcrição
+
+Decodifica o áudio (ogg/opus do Z-API) para PCM 16 kHz mono com ffmpeg,
+remove silêncios com um VAD por energia, divide gravações longas em
+trechos com sobreposição e recodifica cada trecho em opus (menos bytes
+enviados à API). Os textos dos trechos são costurados em ordem,
+descartando as palavras repetidas na sobreposição.
+"""
+import os
+import re
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def decode_audio(audio_file_path: str) -> np.ndarray:
+    """
+    Decodifica qualquer formato suportado pelo ffmpeg para int16 16 kHz mono
+    """
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", audio_file_path,
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        capture_output=True, timeout=300, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+
+def encode_chunk(samples: np.ndarray, dest: Path, bitrate: str = "24k"):
+    """
+    Grava um trecho PCM como ogg/opus
+    """
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y",
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "-",
+         "-c:a", "libopus", "-b:a", bitrate, "-application", "voip", str(dest)],
+        input=samples.tobytes(), capture_output=True, timeout=300, check=True
+    )
+
+
+def speech_mask(samples: np.ndarray, padding_ms: int = 300) -> np.ndarray:
+    """
+    Marca os quadros de FRAME_MS com fala
+
+    Limiar adaptativo: 10 dB acima do ruído de fundo (percentil 10 da
+    energia dos quadros), nunca abaixo de -50 dBFS. Cada trecho de fala é
+    estendido por `padding_ms` para não cortar início e fim das palavras.
+    """
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+
+    frames = samples[:n_frames * frame].astype(np.float32).reshape(n_frames, frame) / 32768.0
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    threshold = max(np.percentile(energy_db, 10) + 10, -50.0)
+    mask = energy_db > threshold
+
+    padding = padding_ms // FRAME_MS
+    if padding and mask.any():
+        mask = np.convolve(mask.astype(np.int8), np.ones(2 * padding + 1, dtype=np.int8), mode="same") > 0
+    return mask
+
+
+def trim_silence(samples: np.ndarray, padding_ms: int = 300) -> np.ndarray:
+    """
+    Remove silêncios do início, do fim e pausas internas longas
+
+    Returns:
+        Apenas os quadros com fala (vazio se não houver fala)
+    """
+    mask = speech_mask(samples, padding_ms)
+    if not mask.any():
+        return samples[:0]
+
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    return samples[:len(mask) * frame].reshape(len(mask), frame)[mask].reshape(-1)
+
+
+def split_chunks(samples: np.ndarray, chunk_seconds: float, overlap_seconds: float) -> List[np.ndarray]:
+    """
+    Divide em trechos de `chunk_seconds` com `overlap_seconds` repetidos
+    entre trechos consecutivos (evita cortar palavras na fronteira)
+
+    Raises:
+        ValueError: trecho vazio ou sobreposição negativa / do tamanho do trecho
+    """
+    size = int(chunk_seconds * SAMPLE_RATE)
+    step = size - int(overlap_seconds * SAMPLE_RATE)
+    if size <= 0 or overlap_seconds < 0 or step <= 0:
+        raise ValueError(
+            f"Trechos inválidos: {chunk_seconds}s com sobreposição de {overlap_seconds}s"
+        )
+    if len(samples) <= size:
+        return [samples]
+
+    chunks = []
+    for start in range(0, len(samples), step):
+        chunks.append(samples[start:start + size])
+        if start + size >= len(samples):
+            break
+    return chunks
+
+
+def merge_transcripts(texts: List[str], max_overlap_words: int = 12) -> str:
+    """
+    Junta os textos dos trechos em ordem, removendo do início de cada trecho
+    as palavras que repetem o fim do anterior (sobreposição de áudio)
+    """
+    merged: List[str] = []
+    for text in texts:
+        words = text.split()
+        if merged and words:
+            tail = [_normalize_word(w) for w in merged[-max_overlap_words:]]
+            head = [_normalize_word(w) for w in words[:max_overlap_words]]
+            for k in range(min(len(tail), len(head)), 0, -1):
+                if tail[-k:] == head[:k]:
+                    words = words[k:]
+                    break
+        merged.extend(words)
+    return " ".join(merged)
+
+
+def _normalize_word(word: str) -> str:
+    return "".join(_WORD_RE.findall(word.lower()))
+
+
+class AudioPreprocessor:
+    """Prepara os trechos de áudio enviados ao backend de transcrição"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('TRANSCRIPTION_PREPROCESS', '1') == '1'
+        self.chunk_seconds = float(os.environ.get('TRANSCRIPTION_CHUNK_SECONDS', '30'))
+        self.overlap_seconds = float(os.environ.get('TRANSCRIPTION_CHUNK_OVERLAP_SECONDS', '2'))
+        if self.chunk_seconds <= 0:
+            logger.warning(f"TRANSCRIPTION_CHUNK_SECONDS={self.chunk_seconds} inválido, usando 30")
+            self.chunk_seconds = 30.0
+        if not 0 <= self.overlap_seconds < self.chunk_seconds:
+            # Sobreposição >= trecho faria split_chunks não avançar
+            overlap = 0.0 if self.overlap_seconds < 0 else self.chunk_seconds / 2
+            logger.warning(
+                f"TRANSCRIPTION_CHUNK_OVERLAP_SECONDS={self.overlap_seconds} fora de "
+                f"[0, {self.chunk_seconds}), usando {overlap}"
+            )
+            self.overlap_seconds = overlap
+        self._ffmpeg: Optional[bool] = None
+
+    @property
+    def available(self) -> bool:
+        if self._ffmpeg is None:
+            self._ffmpeg = ffmpeg_available()
+            if self.enabled and not self._ffmpeg:
+                logger.warning("ffmpeg não encontrado: áudios serão transcritos sem pré-processamento")
+        return self.enabled and self._ffmpeg
+
+    def prepare(self, audio_file_path: str, workdir: Path) -> List[Path]:
+        """
+        Decodifica, remove silêncio e grava os trechos em workdir
+
+        Returns:
+            Trechos em ordem (lista vazia se o áudio não tem fala)
+        """
+        samples = decode_audio(audio_file_path)
+        speech = trim_silence(samples)
+
+        if len(speech) == 0:
+            logger.info(f"Nenhuma fala detectada em {Path(audio_file_path).name}")
+            return []
+
+        chunks = split_chunks(speech, self.chunk_seconds, self.overlap_seconds)
+        paths = []
+        for i, chunk in enumerate(chunks):
+            path = workdir / f"trecho_{i:04d}.ogg"
+            encode_chunk(chunk, path)
+            paths.append(path)
+
+        logger.info(
+            f"{Path(audio_file_path).name}: {len(samples) / SAMPLE_RATE:.1f}s -> "
+            f"{len(speech) / SAMPLE_RATE:.1f}s de fala em {len(paths)} trecho(s)"
+        )
+        return paths
+
+
+# Instância global
+audio_preprocessor = AudioPreprocessor()
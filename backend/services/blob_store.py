@@ -0,0 +1,291 @@
+"""
+Armazenamento endereçado por conteúdo (SHA-256) com deduplicação
+
+Cada conteúdo é gravado uma única vez em blobs/{aa}/{bb}/{sha256}. Os
+caminhos visíveis (pasta do cliente, uploads) são hardlinks para o blob,
+então o mesmo PDF enviado pelo site e pelo WhatsApp ocupa espaço uma vez.
+Um blob só é removido pela coleta de lixo quando não tem nenhum hardlink
+(st_nlink == 1) e nenhum documento o referencia na collection blobs.
+"""
+import os
+import shutil
+import hashlib
+import logging
+import uuid
+import time
+import asyncio
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import BinaryIO, Collection, Dict, List, Optional, Tuple, Union
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobTooLarge(Exception):
+    """Conteúdo excede o tamanho máximo permitido"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"Arquivo excede o limite de {max_size // (1024 * 1024)} MB")
+
+
+class BlobWriter:
+    """Arquivo temporário com SHA-256 e limite de tamanho calculados na escrita"""
+
+    def __init__(self, tmp_dir: Path, max_size: Optional[int] = None):
+        self.max_size = max_size
+        self.path = tmp_dir / uuid.uuid4().hex
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, 'wb')
+
+    def write(self, data: Union[bytes, bytearray, memoryview]):
+        if self.max_size is not None and self.size + len(data) > self.max_size:
+            raise BlobTooLarge(self.max_size)
+        self.size += len(data)
+        self._digest.update(data)
+        self._file.write(data)
+
+    def finish(self) -> Tuple[Path, str, int]:
+        """
+        Returns:
+            (arquivo temporário, sha256, tamanho)
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self.path, self._digest.hexdigest(), self.size
+
+    def abort(self):
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class BlobStore:
+    """Blobs deduplicados por SHA-256 em diretórios fragmentados"""
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = Path(base_dir or os.environ.get('BLOB_DIR', '/app/backend/blobs'))
+        self.tmp_dir = self.base_dir / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        # Serializa adopt+link com a coleta de lixo: sem isso a coleta pode
+        # remover um blob entre "já existe" e o hardlink do novo caminho
+        self._lock = threading.Lock()
+
+    def blob_path(self, sha256: str) -> Path:
+        """Caminho fragmentado do blob: {aa}/{bb}/{sha256}"""
+        return self.base_dir / sha256[:2] / sha256[2:4] / sha256
+
+    def _write_temp(
+        self, source: Union[bytes, bytearray, memoryview, BinaryIO], max_size: Optional[int] = None
+    ) -> Tuple[Path, str, int]:
+        """
+        Grava o conteúdo em tmp/ calculando o hash durante a escrita
+
+        Returns:
+            (arquivo temporário, sha256, tamanho)
+        """
+        writer = self.writer(max_size)
+        try:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                writer.write(source)
+            else:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+            return writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def writer(self, max_size: Optional[int] = None) -> "BlobWriter":
+        """
+        Gravação incremental em tmp/ (ex: partes de um multipart lidas do
+        socket); finish() devolve os argumentos de adopt()
+        """
+        return BlobWriter(self.tmp_dir, max_size)
+
+    def put(self, source: Union[bytes, bytearray, memoryview, BinaryIO], max_size: Optional[int] = None) -> Dict:
+        """
+        Grava o conteúdo calculando o hash durante a escrita
+
+        Args:
+            max_size: Tamanho máximo aceito; acima disso lança BlobTooLarge
+                sem terminar de ler a origem
+
+        Returns:
+            {"sha256", "size", "path", "novo"} - novo=False quando já existia
+        """
+        temp_path, sha256, size = self._write_temp(source, max_size)
+        return self.adopt(temp_path, sha256, size)
+
+    def adopt(self, temp_path: Path, sha256: str, size: int, dest: Optional[Path] = None) -> Dict:
+        """
+        Move um arquivo já gravado (e com hash conhecido) para o blob store;
+        se o conteúdo já existe, o arquivo temporário é descartado
+
+        Args:
+            dest: Se informado, cria o hardlink sob a mesma trava, sem
+                janela para a coleta de lixo remover o blob
+        """
+        path = self.blob_path(sha256)
+
+        try:
+            with self._lock:
+                if path.exists():
+                    temp_path.unlink()
+                    # Renova o mtime: o reaproveitamento conta como uso recente
+                    # para a carência da coleta de lixo
+                    os.utime(path)
+                    novo = False
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(temp_path, path)
+                    novo = True
+                if dest is not None:
+                    self._link_unlocked(path, dest)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        return {"sha256": sha256, "size": size, "path": path, "novo": novo}
+
+    def link(self, sha256: str, dest: Path):
+        """
+        Cria dest apontando para o blob (hardlink; cópia se estiver em outro disco)
+
+        Raises:
+            FileNotFoundError: o blob não existe (ex: removido pela coleta de lixo)
+        """
+        with self._lock:
+            self._link_unlocked(self.blob_path(sha256), dest)
+
+    def _link_unlocked(self, blob: Path, dest: Path):
+        dest.parent.mkdir(parents=True, exist_ok=True)
+
+        temp_dest = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            try:
+                os.link(blob, temp_dest)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(blob, temp_dest)
+            os.replace(temp_dest, dest)
+        except BaseException:
+            # Um hardlink temporário esquecido manteria st_nlink > 1 e o blob
+            # nunca seria coletado
+            temp_dest.unlink(missing_ok=True)
+            raise
+
+    def store(self, source: Union[bytes, BinaryIO], dest: Path, max_size: Optional[int] = None) -> Dict:
+        """
+        Grava (ou reaproveita) o blob e cria dest ligado a ele
+        """
+        temp_path, sha256, size = self._write_temp(source, max_size)
+        blob = self.adopt(temp_path, sha256, size, dest)
+        if not blob["novo"]:
+            logger.info(f"Conteúdo duplicado reaproveitado: {sha256[:12]} -> {dest.name}")
+        return blob
+
+    def verify(self, sha256: str, path: Optional[Path] = None) -> bool:
+        """
+        Recalcula o hash do arquivo e confere com o esperado
+        """
+        path = Path(path) if path else self.blob_path(sha256)
+        if not path.exists():
+            return False
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest() == sha256
+
+    def collect_garbage(self, referenced: Collection[str] = (), min_age_seconds: int = 3600) -> List[str]:
+        """
+        Remove blobs sem nenhum hardlink e sem documento que os referencie
+
+        Args:
+            referenced: SHA-256 com refs > 0 na collection blobs (mantidos
+                mesmo sem hardlink, ex: documento copiado para outro disco)
+            min_age_seconds: Blobs gravados ou reaproveitados há menos que
+                isso são mantidos (ex: mídia baixada pelo webhook que ainda
+                vai ser ligada à pasta do cliente)
+
+        Returns:
+            SHA-256 dos blobs removidos
+        """
+        limite = time.time() - min_age_seconds
+        removidos = []
+        for path in self.base_dir.glob("??/??/*"):
+            if path.name in referenced:
+                continue
+            # stat e unlink sob a trava: um adopt/link concorrente não perde o blob
+            with self._lock:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if stat.st_nlink == 1 and stat.st_mtime < limite:
+                    path.unlink()
+                    removidos.append(path.name)
+        if removidos:
+            logger.info(f"{len(removidos)} blobs sem referência removidos")
+        return removidos
+
+    async def collect(self, collection, min_age_seconds: int = 3600) -> int:
+        """
+        Coleta de lixo guiada pela collection blobs
+
+        Returns:
+            Quantidade de blobs removidos
+        """
+        referenced = {
+            doc["_id"] async for doc in collection.find({"refs": {"$gt": 0}}, {"_id": 1})
+        }
+        removidos = await asyncio.to_thread(self.collect_garbage, referenced, min_age_seconds)
+        if removidos:
+            await collection.delete_many({"_id": {"$in": removidos}, "refs": {"$lte": 0}})
+        return len(removidos)
+
+    async def add_ref(self, collection, sha256: str, size: int, documento_id: str):
+        """
+        Registra a referência de um documento ao blob (collection blobs);
+        repetir a chamada para o mesmo documento não conta duas vezes
+        """
+        try:
+            await collection.update_one(
+                {"_id": sha256, "documentos": {"$ne": documento_id}},
+                {
+                    "$inc": {"refs": 1},
+                    "$addToSet": {"documentos": documento_id},
+                    "$setOnInsert": {
+                        "size": size,
+                        "criado_em": datetime.now(timezone.utc).isoformat()
+                    }
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # O blob já existe e o documento já está na lista
+            pass
+
+    async def release_ref(self, collection, sha256: str, documento_id: str):
+        """
+        Remove a referência de um documento ao blob
+        """
+        await collection.update_one(
+            {"_id": sha256, "documentos": documento_id},
+            {"$inc": {"refs": -1}, "$pull": {"documentos": documento_id}}
+        )
+
+
+# Instância global
+blob_store = BlobStore()
@@ -0,0 +1,121 @@
+"""
+Resolução de clientes pelo telefone (campo phone_e164 indexado + cache LRU)
+"""
+import os
+import logging
+from typing import Optional, Tuple
+from cachetools import TTLCache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from services.message_templates import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Nomes/telefones alterados direto na collection users aparecem após este prazo
+CLIENT_CACHE_TTL_SECONDS = int(os.environ.get('CLIENT_CACHE_TTL_SECONDS', '300'))
+
+
+class ClientDirectory:
+    """
+    Mapeia telefone -> (client_id, nome) do cliente
+
+    Os usuários guardam o telefone normalizado em phone_e164 (índice único),
+    então a resolução é uma consulta indexada, ou nenhuma quando o telefone
+    está no cache. Quem altera nome ou telefone de um usuário deve chamar
+    invalidate(); o TTL cobre alterações feitas fora do servidor.
+    """
+
+    def __init__(self, max_cache: int = 4096, ttl_seconds: int = CLIENT_CACHE_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=max_cache, ttl=ttl_seconds)
+
+    async def ensure_indexes(self, users):
+        """
+        Preenche phone_e164 dos usuários antigos e cria o índice único
+        """
+        pendentes = [
+            user async for user in users.find(
+                {"phone": {"$exists": True, "$ne": ""}, "phone_e164": {"$exists": False}},
+                {"_id": 1, "phone": 1}
+            )
+        ]
+        operacoes = [
+            UpdateOne({"_id": user["_id"]}, {"$set": {"phone_e164": normalize_phone(user["phone"])}})
+            for user in pendentes
+        ]
+
+        if operacoes:
+            try:
+                await users.bulk_write(operacoes, ordered=False)
+                logger.info(f"phone_e164 preenchido para {len(operacoes)} usuários")
+            except BulkWriteError as e:
+                # Telefone normalizado já usado por outro usuário (índice único
+                # existente): os demais foram gravados (ordered=False)
+                conflitos = [pendentes[erro["index"]]["_id"] for erro in e.details.get("writeErrors", [])]
+                logger.error(
+                    f"phone_e164 não preenchido para {len(conflitos)} usuários com telefone duplicado: "
+                    f"{', '.join(str(c) for c in conflitos)}"
+                )
+
+        try:
+            await users.create_index(
+                "phone_e164",
+                unique=True,
+                partialFilterExpression={"phone_e164": {"$type": "string"}}
+            )
+        except OperationFailure as e:
+            # Telefones duplicados na base: manter índice simples até a correção
+            logger.error(f"Não foi possível criar índice único em phone_e164: {str(e)}")
+            await users.create_index("phone_e164")
+
+    async def resolve(self, users, phone: str) -> Optional[Tuple[str, str]]:
+        """
+        Retorna (client_id, nome) do cliente com o telefone ou None
+        """
+        phone_e164 = normalize_phone(phone)
+
+        cached = self._cache.get(phone_e164)
+        if cached:
+            return cached
+
+        user = await users.find_one(
+            {"phone_e164": phone_e164},
+            {"_id": 1, "id": 1, "name": 1}
+        )
+
+        if not user:
+            user = await self._resolve_legacy(users, phone, phone_e164)
+            if not user:
+                return None
+
+        entry = (user.get("id") or str(user.get("_id")), user.get("name", "Cliente"))
+        self._cache[phone_e164] = entry
+        return entry
+
+    async def _resolve_legacy(self, users, phone: str, phone_e164: str):
+        """
+        Busca pelos formatos antigos do campo phone, para usuários gravados
+        sem phone_e164, e preenche o campo encontrado
+        """
+        # Formato: (XX) XXXXX-XXXX ou (XX) XXXX-XXXX
+        local = phone_e164[2:]
+        user = await users.find_one(
+            {"phone": {"$in": [
+                f"({local[:2]}) {local[2:7]}-{local[7:]}",
+                f"({local[:2]}) {local[2:6]}-{local[6:]}",
+                phone
+            ]}},
+            {"_id": 1, "id": 1, "name": 1}
+        )
+
+        if user:
+            await users.update_one({"_id": user["_id"]}, {"$set": {"phone_e164": phone_e164}})
+
+        return user
+
+    def invalidate(self, phone: str):
+        """Remove o telefone do cache (ex: após alterar nome ou telefone)"""
+        self._cache.pop(normalize_phone(phone), None)
+
+
+# Instância global
+client_directory = ClientDirectory()
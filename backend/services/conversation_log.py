@@ -0,0 +1,403 @@
+"""
+Log de conversas append-only em segmentos mensais (JSONL)
+
+Estrutura em backup_conversas/:
+    conversas-YYYY-MM.jsonl   uma mensagem por linha
+    conversas-YYYY-MM.idx     índice esparso: timestamp -> offset em bytes
+"""
+import os
+import json
+import mmap
+import time
+import bisect
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "conversas-"
+LEGACY_FILE = "conversas.json"
+# Separador do cursor de paginação: "<timestamp>~<offset da linha no segmento>"
+CURSOR_SEP = "~"
+
+# Tamanho dos segmentos antes da migração em andamento (para desfazê-la após falha)
+MIGRATION_MARKER = "conversas.json.migrando"
+
+# Uma entrada no índice a cada bloco de 64 KB do segmento
+INDEX_BLOCK_SIZE = 64 * 1024
+
+# fsync em lote: a cada N mensagens ou T segundos por segmento
+FSYNC_EVERY = 32
+FSYNC_INTERVAL = 1.0
+
+
+def normalize_timestamp(value: Optional[str]) -> Optional[str]:
+    """
+    Converte um limite ISO do cliente para o formato gravado no log
+    (horário local sem fuso, como datetime.now()); datas sem horário são
+    mantidas, pois comparam como prefixo
+
+    Raises:
+        ValueError: valor que não é uma data/hora ISO
+    """
+    if not value or len(value) == 10:
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+        return value
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def _parse_cursor(cursor: str) -> Tuple[str, int]:
+    ts, sep, offset = cursor.rpartition(CURSOR_SEP)
+    if not sep or not offset.isdigit():
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return ts, int(offset)
+
+
+class ConversationLog:
+    """Grava e lê o histórico de conversas de cada cliente"""
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # Por segmento: último bloco indexado, escritas pendentes de fsync, último fsync
+        self._segment_state: Dict[str, Dict] = {}
+
+    def _lock_for(self, folder: Path) -> threading.Lock:
+        key = str(folder)
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    @staticmethod
+    def segment_path(folder: Path, month: str) -> Path:
+        return folder / f"{SEGMENT_PREFIX}{month}.jsonl"
+
+    @staticmethod
+    def index_path(segment: Path) -> Path:
+        return segment.with_suffix(".idx")
+
+    def list_segments(self, folder: Path) -> List[Path]:
+        """Segmentos do cliente em ordem cronológica"""
+        return sorted(folder.glob(f"{SEGMENT_PREFIX}*.jsonl"))
+
+    def load_index(self, segment: Path) -> List[Dict]:
+        """
+        Carrega o índice esparso [{"ts": ..., "offset": ...}] do segmento
+        """
+        index_file = self.index_path(segment)
+        if not index_file.exists():
+            return [{"ts": "", "offset": 0}]
+
+        with open(index_file, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return entries or [{"ts": "", "offset": 0}]
+
+    def _state_for(self, segment: Path) -> Dict:
+        key = str(segment)
+        state = self._segment_state.get(key)
+        if state is None:
+            last_block = -1
+            if self.index_path(segment).exists():
+                last_block = self.load_index(segment)[-1]["offset"] // INDEX_BLOCK_SIZE
+            state = self._segment_state[key] = {
+                "last_block": last_block,
+                "pending": 0,
+                "last_fsync": time.monotonic()
+            }
+        return state
+
+    def append(self, folder: Path, data: Dict, timestamp: Optional[datetime] = None) -> Path:
+        """
+        Acrescenta uma mensagem ao segmento do mês (O(1), sem reler o histórico)
+
+        Returns:
+            Caminho do segmento gravado
+        """
+        with self._lock_for(folder):
+            self._migrate_legacy(folder)
+            return self._append_locked(folder, data, timestamp or datetime.now())
+
+    def _append_locked(self, folder: Path, data: Dict, timestamp: datetime) -> Path:
+        ts = timestamp.isoformat()
+        segment = self.segment_path(folder, ts[:7])
+        line = json.dumps({"timestamp": ts, "data": data}, ensure_ascii=False) + "\n"
+        state = self._state_for(segment)
+
+        with open(segment, 'ab') as f:
+            offset = f.tell()
+            f.write(line.encode('utf-8'))
+            f.flush()
+
+            state["pending"] += 1
+            now = time.monotonic()
+            if state["pending"] >= FSYNC_EVERY or now - state["last_fsync"] >= FSYNC_INTERVAL:
+                os.fsync(f.fileno())
+                state["pending"] = 0
+                state["last_fsync"] = now
+
+        block = offset // INDEX_BLOCK_SIZE
+        if block > state["last_block"]:
+            with open(self.index_path(segment), 'a', encoding='utf-8') as idx:
+                idx.write(json.dumps({"ts": ts, "offset": offset}) + "\n")
+            state["last_block"] = block
+
+        return segment
+
+    def flush(self):
+        """
+        fsync dos segmentos com escritas pendentes (periódico e no desligamento;
+        o limite de FSYNC_INTERVAL em append só é avaliado na escrita seguinte)
+        """
+        for key, state in list(self._segment_state.items()):
+            if not state["pending"]:
+                continue
+            with self._lock_for(Path(key).parent):
+                if state["pending"] and os.path.exists(key):
+                    _fsync_path(key)
+                    state["pending"] = 0
+                    state["last_fsync"] = time.monotonic()
+
+    def _migrate_legacy(self, folder: Path):
+        """
+        Converte o conversas.json antigo em segmentos (uma única vez)
+
+        Antes de gravar, o tamanho dos segmentos existentes vai para um
+        marcador; se o processo cair no meio, a próxima chamada trunca os
+        segmentos de volta e refaz a migração do zero, sem duplicar mensagens.
+        """
+        legacy = folder / LEGACY_FILE
+        if not legacy.exists():
+            return
+
+        marker = folder / MIGRATION_MARKER
+        if marker.exists():
+            with open(marker, 'r', encoding='utf-8') as f:
+                self._rollback_segments(folder, json.load(f))
+        else:
+            sizes = {segment.name: segment.stat().st_size for segment in self.list_segments(folder)}
+            temp_marker = marker.with_name(f".{marker.name}.tmp")
+            with open(temp_marker, 'w', encoding='utf-8') as f:
+                json.dump(sizes, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_marker, marker)
+
+        with open(legacy, 'r', encoding='utf-8') as f:
+            conversas = json.load(f)
+
+        for conversa in conversas:
+            try:
+                timestamp = datetime.fromisoformat(conversa["timestamp"])
+            except (KeyError, ValueError):
+                timestamp = datetime.now()
+            self._append_locked(folder, conversa.get("data", {}), timestamp)
+
+        # Segmentos duráveis antes de marcar a migração como concluída
+        for segment in self.list_segments(folder):
+            _fsync_path(str(segment))
+            state = self._segment_state.get(str(segment))
+            if state:
+                state["pending"] = 0
+
+        legacy.rename(folder / f"{LEGACY_FILE}.migrado")
+        marker.unlink(missing_ok=True)
+        logger.info(f"{len(conversas)} mensagens migradas para o log segmentado em {folder}")
+
+    def _rollback_segments(self, folder: Path, sizes: Dict[str, int]):
+        """
+        Desfaz uma migração interrompida: segmentos voltam ao tamanho anterior
+        (ou são removidos) e o índice perde as entradas além desse tamanho
+        """
+        for segment in self.list_segments(folder):
+            size = sizes.get(segment.name)
+            index_file = self.index_path(segment)
+            self._segment_state.pop(str(segment), None)
+
+            if size is None:
+                segment.unlink()
+                index_file.unlink(missing_ok=True)
+                continue
+
+            os.truncate(segment, size)
+            if index_file.exists():
+                entries = [entry for entry in self.load_index(segment) if entry["offset"] < size]
+                with open(index_file, 'w', encoding='utf-8') as idx:
+                    idx.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+        logger.warning(f"Migração interrompida do conversas.json desfeita em {folder}")
+
+    def iter_range(
+        self,
+        folder: Path,
+        start: Optional[str] = None,
+        end: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """
+        Itera as mensagens entre start e end (timestamps ISO, inclusivos)
+        em ordem cronológica, lendo apenas os segmentos e blocos necessários
+        """
+        start, end = normalize_timestamp(start), normalize_timestamp(end)
+        with self._lock_for(folder):
+            self._migrate_legacy(folder)
+
+        for segment in self.list_segments(folder):
+            month = segment.stem[len(SEGMENT_PREFIX):]
+            if start and month < start[:7]:
+                continue
+            if end and month > end[:7]:
+                break
+
+            offset = 0
+            if start:
+                index = self.load_index(segment)
+                pos = bisect.bisect_left([entry["ts"] for entry in index], start) - 1
+                offset = index[max(pos, 0)]["offset"]
+
+            with open(segment, 'rb') as f:
+                f.seek(offset)
+                for raw in f:
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        # Linha incompleta (gravação interrompida)
+                        continue
+                    ts = record["timestamp"]
+                    if start and ts < start:
+                        continue
+                    if end and ts > end:
+                        return
+                    yield record
+
+    def read_page(
+        self,
+        folder: Path,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 50,
+        before: Optional[str] = None
+    ) -> Dict:
+        """
+        Retorna até `limit` mensagens do período, da mais recente para a mais antiga
+
+        Cada segmento é mapeado com mmap e lido de trás para frente apenas na
+        faixa de bytes delimitada pelo índice; o restante do arquivo não é lido.
+
+        Args:
+            start, end: Limites do período (ISO, inclusivos; com fuso ou Z são
+                convertidos para o horário local gravado)
+            before: Cursor de paginação (next_cursor da página anterior)
+
+        Returns:
+            {"mensagens": [...], "next_cursor": "<timestamp>~<offset>" ou None}
+
+        O cursor é a posição da última mensagem entregue (segmento + offset
+        da linha), então mensagens com o mesmo timestamp na fronteira da
+        página não são puladas.
+
+        Raises:
+            ValueError: start/end ou cursor inválidos
+        """
+        start, end = normalize_timestamp(start), normalize_timestamp(end)
+        cursor_month, cursor_offset = None, None
+        if before:
+            cursor_ts, cursor_offset = _parse_cursor(before)
+            cursor_month = cursor_ts[:7]
+
+        with self._lock_for(folder):
+            self._migrate_legacy(folder)
+
+        mensagens: List[Dict] = []
+        for segment in reversed(self.list_segments(folder)):
+            month = segment.stem[len(SEGMENT_PREFIX):]
+            if end and month > end[:7]:
+                continue
+            if cursor_month and month > cursor_month:
+                continue
+            if start and month < start[:7]:
+                break
+
+            max_offset = cursor_offset if month == cursor_month else None
+            for offset, record in self._iter_segment_reverse(segment, start, end, max_offset):
+                mensagens.append(record)
+                if len(mensagens) >= limit:
+                    return {
+                        "mensagens": mensagens,
+                        "next_cursor": f"{record['timestamp']}{CURSOR_SEP}{offset}"
+                    }
+
+        return {"mensagens": mensagens, "next_cursor": None}
+
+    def _iter_segment_reverse(
+        self,
+        segment: Path,
+        start: Optional[str],
+        end: Optional[str],
+        max_offset: Optional[int] = None
+    ) -> Iterator[Tuple[int, Dict]]:
+        """
+        (offset da linha, mensagem) de trás para frente, só linhas antes de max_offset
+        """
+        size = segment.stat().st_size
+        if size == 0:
+            return
+
+        index = self.load_index(segment)
+        timestamps = [entry["ts"] for entry in index]
+
+        lo = 0
+        if start:
+            lo = index[max(bisect.bisect_left(timestamps, start) - 1, 0)]["offset"]
+
+        hi = size
+        if end:
+            # Blocos que começam depois de `end` não precisam ser lidos
+            pos = bisect.bisect_right(timestamps, end)
+            if pos < len(index) and index[pos]["ts"] > end:
+                hi = index[pos]["offset"]
+        if max_offset is not None:
+            hi = min(hi, max_offset)
+
+        with open(segment, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            line_end = hi
+            # Ignora a última linha se estiver incompleta
+            if line_end > lo and mm[line_end - 1:line_end] != b"\n":
+                line_end = mm.rfind(b"\n", lo, line_end) + 1
+
+            while line_end > lo:
+                line_start = mm.rfind(b"\n", lo, line_end - 1) + 1
+                if line_start < lo:
+                    line_start = lo
+                try:
+                    record = json.loads(mm[line_start:line_end])
+                except ValueError:
+                    line_end = line_start
+                    continue
+                line_end = line_start
+
+                ts = record["timestamp"]
+                if end and ts > end:
+                    continue
+                if start and ts < start:
+                    return
+                yield line_start, record
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Instância global
+conversation_log = ConversationLog()
@@ -0,0 +1,184 @@
+"""
+Contadores do resumo do painel admin (collection admin_resumo)
+
+Um único documento com os totais do painel, mantido com $inc em cada
+gravação de agendamentos, solicitações de documento e processos
+monitorados: o painel carrega com uma leitura em vez de listar tudo e
+contar no navegador. Uma reconciliação periódica recalcula os totais com
+agregações (corrige incrementos perdidos, ex: gravações feitas direto no banco).
+
+Cada $inc também incrementa o campo versao: a reconciliação só substitui o
+documento se a versão não mudou durante as agregações, então incrementos
+concorrentes não se perdem.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RESUMO_ID = "resumo"
+
+# Reconciliações refeitas quando um $inc concorrente muda a versão
+RECONCILE_TENTATIVAS = 3
+
+
+def _chave(valor) -> str:
+    """Valor usado como nome de campo (sem '.' e '$')"""
+    return str(valor or "indefinido").replace(".", "_").replace("$", "_")
+
+
+def _sem_zeros(contagens: Dict) -> Dict:
+    """Remove contagens zeradas (status que deixaram de existir)"""
+    limpo = {}
+    for chave, valor in contagens.items():
+        if isinstance(valor, dict):
+            valor = _sem_zeros(valor)
+            if valor:
+                limpo[chave] = valor
+        elif valor:
+            limpo[chave] = valor
+    return limpo
+
+
+class DashboardCounters:
+    """Totais do painel admin atualizados de forma incremental"""
+
+    async def _inc(self, collection, incrementos: Dict[str, int]):
+        incrementos = {campo: n for campo, n in incrementos.items() if n}
+        if not incrementos:
+            return
+        await collection.update_one(
+            {"_id": RESUMO_ID},
+            {
+                "$inc": {**incrementos, "versao": 1},
+                "$set": {"atualizado_em": datetime.now(timezone.utc).isoformat()}
+            },
+            upsert=True
+        )
+
+    async def agendamento(self, collection, antes: Optional[Dict], depois: Optional[Dict]):
+        """
+        Ajusta os totais de um agendamento criado (antes=None) ou alterado
+        """
+        incrementos: Dict[str, int] = defaultdict(int)
+        for doc, delta in ((antes, -1), (depois, 1)):
+            if doc:
+                status = _chave(doc.get("status"))
+                incrementos[f"agendamentos.status.{status}"] += delta
+                incrementos[f"agendamentos.dia.{_chave(doc.get('data'))}.{status}"] += delta
+        await self._inc(collection, incrementos)
+
+    async def solicitacao(self, collection, antes: Optional[Dict], depois: Optional[Dict]):
+        """
+        Ajusta os totais de uma solicitação criada (antes=None) ou alterada
+        """
+        incrementos: Dict[str, int] = defaultdict(int)
+        for doc, delta in ((antes, -1), (depois, 1)):
+            if doc:
+                incrementos[f"solicitacoes.status.{_chave(doc.get('status'))}"] += delta
+        await self._inc(collection, incrementos)
+
+    async def processo(self, collection, delta: int = 1):
+        await self._inc(collection, {"processos_monitorados": delta})
+
+    async def get(self, collection) -> Optional[Dict]:
+        doc = await collection.find_one({"_id": RESUMO_ID})
+        if doc:
+            doc.pop("_id", None)
+            doc.pop("versao", None)
+        return doc
+
+    async def reconcile(self, collection, agendamentos, solicitacoes, processos) -> Dict:
+        """
+        Recalcula todos os totais com agregações e substitui o documento
+
+        A substituição é condicionada à versão lida antes das agregações; se
+        um $inc chegou no meio, recalcula (até RECONCILE_TENTATIVAS vezes).
+        """
+        for _ in range(RECONCILE_TENTATIVAS):
+            anterior = await collection.find_one({"_id": RESUMO_ID})
+            versao = anterior.get("versao") if anterior else None
+            resumo = await self._agregar(agendamentos, solicitacoes, processos)
+
+            novo = {
+                **resumo,
+                "versao": (versao or 0) + 1,
+                "atualizado_em": datetime.now(timezone.utc).isoformat()
+            }
+            if anterior is None:
+                try:
+                    await collection.insert_one({"_id": RESUMO_ID, **novo})
+                except DuplicateKeyError:
+                    continue
+                return resumo
+
+            # versao None também casa com documentos antigos sem o campo
+            result = await collection.replace_one({"_id": RESUMO_ID, "versao": versao}, novo)
+            if result.matched_count:
+                for campo in ("_id", "versao", "atualizado_em"):
+                    anterior.pop(campo, None)
+                if _sem_zeros(anterior) != _sem_zeros(resumo):
+                    logger.info("Resumo do painel admin divergia das collections e foi recalculado")
+                return resumo
+
+        logger.warning("Resumo do painel admin mudou durante a reconciliação; fica para o próximo ciclo")
+        return resumo
+
+    async def _agregar(self, agendamentos, solicitacoes, processos) -> Dict:
+        por_status: Dict[str, int] = {}
+        por_dia: Dict[str, Dict[str, int]] = defaultdict(dict)
+        async for grupo in agendamentos.aggregate([
+            {"$group": {"_id": {"data": "$data", "status": "$status"}, "total": {"$sum": 1}}}
+        ]):
+            status = _chave(grupo["_id"].get("status"))
+            por_status[status] = por_status.get(status, 0) + grupo["total"]
+            por_dia[_chave(grupo["_id"].get("data"))][status] = grupo["total"]
+
+        solicitacoes_status: Dict[str, int] = {}
+        async for grupo in solicitacoes.aggregate([
+            {"$group": {"_id": "$status", "total": {"$sum": 1}}}
+        ]):
+            status = _chave(grupo["_id"])
+            solicitacoes_status[status] = solicitacoes_status.get(status, 0) + grupo["total"]
+
+        return {
+            "agendamentos": {"status": por_status, "dia": dict(por_dia)},
+            "solicitacoes": {"status": solicitacoes_status},
+            "processos_monitorados": await processos.count_documents({"ativo": True})
+        }
+
+    def format(self, doc: Dict, hoje: str, dias: int) -> Dict:
+        """
+        Resposta do endpoint: zeros removidos e agenda a partir de hoje
+        """
+        doc = _sem_zeros(doc)
+        agendamentos = doc.get("agendamentos", {})
+        solicitacoes_status = doc.get("solicitacoes", {}).get("status", {})
+        # Dias do calendário hoje <= dia < hoje + dias (não os N primeiros com agenda)
+        inicio = date.fromisoformat(hoje)
+        proximos_dias = [(inicio + timedelta(days=n)).isoformat() for n in range(dias)]
+        agenda = agendamentos.get("dia", {})
+
+        return {
+            "agendamentos": {
+                "por_status": agendamentos.get("status", {}),
+                "por_dia": {dia: agenda[dia] for dia in proximos_dias if dia in agenda},
+                "hoje": sum(
+                    total for status, total in agendamentos.get("dia", {}).get(hoje, {}).items()
+                    if status != "cancelado"
+                )
+            },
+            "solicitacoes": {
+                "por_status": solicitacoes_status,
+                "pendentes": solicitacoes_status.get("pendente", 0)
+            },
+            "processos_monitorados": doc.get("processos_monitorados", 0),
+            "atualizado_em": doc.get("atualizado_em")
+        }
+
+
+# Instância global
+dashboard_counters = DashboardCounters()
@@ -0,0 +1,77 @@
+"""
+Deduplicação de eventos do webhook pelo messageId do Z-API
+"""
+import logging
+from datetime import datetime, timezone
+from cachetools import TTLCache
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Janela em que retentativas do Z-API são consideradas duplicatas
+DEDUP_TTL_SECONDS = 24 * 60 * 60
+
+
+class MessageDeduplicator:
+    """
+    Descarta entregas repetidas do mesmo messageId
+
+    Um cache em memória responde às retentativas recentes sem I/O; a
+    collection com índice TTL garante a deduplicação entre processos e
+    após reinícios. A inserção com _id = messageId é a "reserva" atômica.
+    """
+
+    def __init__(self, ttl_seconds: int = DEDUP_TTL_SECONDS, max_recent: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self._recent = TTLCache(maxsize=max_recent, ttl=min(ttl_seconds, 60 * 60))
+        self.duplicadas = 0
+
+    async def ensure_indexes(self, collection):
+        """Cria o índice TTL da collection de deduplicação"""
+        await collection.create_index("criado_em", expireAfterSeconds=self.ttl_seconds)
+
+    async def is_duplicate(self, collection, message_id: str) -> bool:
+        """
+        Registra o messageId e informa se ele já tinha sido recebido
+
+        Returns:
+            True se for uma entrega repetida (deve ser descartada)
+        """
+        if message_id in self._recent:
+            self.duplicadas += 1
+            return True
+
+        # Marca antes do await para que requisições simultâneas no mesmo
+        # processo já enxerguem o id
+        self._recent[message_id] = True
+
+        try:
+            await collection.insert_one({
+                "_id": message_id,
+                "criado_em": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            self.duplicadas += 1
+            logger.info(f"Mensagem duplicada descartada: {message_id}")
+            return True
+        except BaseException:
+            # Reserva não gravada: a retentativa do Z-API precisa ser aceita
+            self._recent.pop(message_id, None)
+            raise
+
+        return False
+
+    async def forget(self, collection, message_id: str):
+        """
+        Remove a marca de um messageId cujo processamento não chegou a ser
+        persistido, para que a retentativa do Z-API seja aceita
+        """
+        self._recent.pop(message_id, None)
+        try:
+            await collection.delete_one({"_id": message_id})
+        except Exception as e:
+            logger.error(f"Erro ao remover marca de deduplicação: {str(e)}")
+
+
+# Instância global
+message_deduplicator = MessageDeduplicator()
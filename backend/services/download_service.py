@@ -0,0 +1,258 @@
+"""
+Download de documentos com cache de metadados, GET condicional e Range
+"""
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterator, Optional, Tuple
+from cachetools import TTLCache
+from starlette.responses import FileResponse, Response, StreamingResponse
+from services.auth_service import SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+RANGE_CHUNK_SIZE = 256 * 1024
+
+# Campos do documento necessários para servir o download
+# (user_id para a checagem de acesso: o mesmo cache atende download e links)
+DOWNLOAD_FIELDS = {"_id": 0, "id": 1, "user_id": 1, "filepath": 1, "filename": 1, "file_type": 1,
+                   "file_size": 1, "sha256": 1, "enviado_em": 1}
+
+
+# Validade padrão e máxima dos links assinados (segundos)
+SIGNED_URL_TTL = 300
+SIGNED_URL_MAX_TTL = 24 * 60 * 60
+
+
+class RangeNotSatisfiable(Exception):
+    """Header Range fora do tamanho do arquivo"""
+
+
+class InvalidSignedUrl(Exception):
+    """Link de download com assinatura inválida ou expirado"""
+
+
+class DocumentDownloadService:
+    """
+    Monta as respostas de download a partir dos metadados do documento
+
+    Documentos são imutáveis após o upload, então os metadados ficam em cache
+    e ETag/Last-Modified saem deles: um 304 não consulta o banco nem o disco.
+    """
+
+    def __init__(self, max_cache: int = 4096, ttl_seconds: int = 3600):
+        self._cache = TTLCache(maxsize=max_cache, ttl=ttl_seconds)
+        secret = os.environ.get('DOWNLOAD_URL_SECRET') or SECRET_KEY
+        self._secret = secret.encode('utf-8')
+
+    def sign(self, documento: Dict, ttl_seconds: int = SIGNED_URL_TTL) -> Dict:
+        """
+        Gera token HMAC-SHA256 com caminho, tipo, nome e expiração do arquivo
+
+        O token carrega tudo que o download precisa, então servir o arquivo
+        não consulta o banco.
+
+        Returns:
+            {"token", "expira_em"} - expira_em em epoch (segundos)
+        """
+        expires = int(time.time()) + min(ttl_seconds, SIGNED_URL_MAX_TTL)
+        payload = {
+            "id": documento["id"],
+            "p": documento["filepath"],
+            "t": documento.get("file_type") or "application/octet-stream",
+            "n": documento["filename"],
+            "h": documento.get("sha256"),
+            "d": documento.get("enviado_em"),
+            "e": expires
+        }
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode('utf-8'))
+        signature = _b64encode(hmac.new(self._secret, body.encode('ascii'), hashlib.sha256).digest())
+        return {"token": f"{body}.{signature}", "expira_em": expires}
+
+    def verify(self, token: str) -> Dict:
+        """
+        Valida assinatura e expiração e devolve os metadados do documento
+
+        Raises:
+            InvalidSignedUrl
+        """
+        body, _, signature = token.partition(".")
+        try:
+            expected = _b64encode(hmac.new(self._secret, body.encode('ascii'), hashlib.sha256).digest())
+        except UnicodeEncodeError:
+            raise InvalidSignedUrl("Token malformado")
+        if not signature or not hmac.compare_digest(signature, expected):
+            raise InvalidSignedUrl("Assinatura inválida")
+
+        try:
+            payload = json.loads(_b64decode(body))
+        except ValueError:
+            raise InvalidSignedUrl("Token malformado")
+
+        if payload.get("e", 0) < time.time():
+            raise InvalidSignedUrl("Link expirado")
+
+        return {
+            "id": payload["id"],
+            "filepath": payload["p"],
+            "file_type": payload["t"],
+            "filename": payload["n"],
+            "sha256": payload.get("h"),
+            "enviado_em": payload.get("d")
+        }
+
+    def get_cached(self, documento_id: str) -> Optional[Dict]:
+        return self._cache.get(documento_id)
+
+    def cache(self, documento: Dict):
+        self._cache[documento["id"]] = documento
+
+    def invalidate(self, documento_id: str):
+        self._cache.pop(documento_id, None)
+
+    @staticmethod
+    def etag(documento: Dict) -> str:
+        if documento.get("sha256"):
+            return f'"{documento["sha256"]}"'
+        return f'"{documento["id"]}-{documento.get("file_size", 0)}"'
+
+    @staticmethod
+    def last_modified(documento: Dict) -> Optional[datetime]:
+        try:
+            modified = datetime.fromisoformat(documento["enviado_em"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        return modified.replace(microsecond=0)
+
+    def is_not_modified(self, headers, etag: str, modified: Optional[datetime]) -> bool:
+        """
+        Avalia If-None-Match / If-Modified-Since (RFC 9110)
+        """
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since and modified:
+            try:
+                return modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    @staticmethod
+    def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+        """
+        Interpreta "bytes=inicio-fim" (um único intervalo)
+
+        Returns:
+            (inicio, fim) inclusivos, ou None para enviar o arquivo inteiro
+        """
+        if not header or not header.startswith("bytes=") or "," in header:
+            return None
+
+        start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+        try:
+            if start_text == "":
+                # Sufixo: últimos N bytes
+                length = int(end_text)
+                if length <= 0:
+                    raise RangeNotSatisfiable()
+                return max(size - length, 0), size - 1
+
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        except ValueError:
+            return None
+
+        if start >= size or start > end:
+            raise RangeNotSatisfiable()
+        return start, min(end, size - 1)
+
+    def build_response(self, documento: Dict, headers) -> Response:
+        """
+        Resposta completa (FileResponse, que usa sendfile/pathsend quando o
+        servidor suporta) ou parcial 206 para pedidos com Range
+        """
+        etag = self.etag(documento)
+        modified = self.last_modified(documento)
+
+        base_headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "private, max-age=0, must-revalidate"
+        }
+        if modified:
+            base_headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+
+        if self.is_not_modified(headers, etag, modified):
+            return Response(status_code=304, headers=base_headers)
+
+        path = documento["filepath"]
+        size = os.stat(path).st_size
+
+        # If-Range: só atende o intervalo se o arquivo for o mesmo
+        range_header = headers.get("range")
+        if_range = headers.get("if-range")
+        if if_range and if_range != etag:
+            range_header = None
+
+        try:
+            byte_range = self.parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{size}"})
+
+        if byte_range is None:
+            return FileResponse(
+                path=path,
+                filename=documento["filename"],
+                media_type=documento["file_type"],
+                headers=base_headers
+            )
+
+        start, end = byte_range
+        return StreamingResponse(
+            _iter_file_range(path, start, end),
+            status_code=206,
+            media_type=documento["file_type"],
+            headers={
+                **base_headers,
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1)
+            }
+        )
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    # Iterador síncrono: o StreamingResponse o consome no threadpool
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+# Instância global
+download_service = DocumentDownloadService()
@@ -0,0 +1,193 @@
+"""
+Índice de metadados dos arquivos dos clientes (collection client_files)
+
+O StorageService enfileira cada arquivo gravado; um flush periódico grava o
+lote no Mongo com upserts. A listagem do admin sai do índice (paginada e
+ordenada) sem percorrer diretórios, e um reconciliador sincroniza o índice
+com o disco em segundo plano.
+"""
+import os
+import logging
+import mimetypes
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from pymongo import DeleteOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Subpasta do cliente -> categoria usada na listagem
+CATEGORIAS = {
+    "documentos": "documentos",
+    "whatsapp/audios": "whatsapp_audios",
+    "whatsapp/transcricoes": "whatsapp_transcricoes",
+    "whatsapp/imagens": "whatsapp_imagens",
+    "whatsapp/documentos": "whatsapp_documentos",
+    "reunioes": "reunioes",
+    "atendimentos": "atendimentos",
+}
+
+ORDENACOES = {
+    "recentes": [("mtime", -1)],
+    "antigos": [("mtime", 1)],
+    "nome": [("nome", 1)],
+    "tamanho": [("size", -1)],
+}
+
+
+def describe_file(client_id: str, categoria: str, path: Path, sha256: Optional[str] = None,
+                  stat: Optional[os.stat_result] = None) -> Dict:
+    """Metadados de um arquivo para o índice"""
+    stat = stat or path.stat()
+    return {
+        "client_id": client_id,
+        "categoria": categoria,
+        "nome": path.name,
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat(),
+        "tipo": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+        "sha256": sha256
+    }
+
+
+class FileIndex:
+    """Fila de atualizações do índice + consultas paginadas"""
+
+    def __init__(self):
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def enqueue(self, client_id: str, subfolder: str, path: Path, sha256: Optional[str] = None):
+        """
+        Registra um arquivo recém-gravado (chamado nas threads de I/O)
+        """
+        categoria = CATEGORIAS.get(subfolder)
+        if not categoria:
+            return
+        try:
+            meta = describe_file(client_id, categoria, path, sha256)
+        except OSError as e:
+            logger.error(f"Erro ao indexar {path}: {str(e)}")
+            return
+        with self._lock:
+            self._pending.append(meta)
+
+    async def flush(self, collection) -> int:
+        """
+        Grava as atualizações pendentes em um único bulk_write
+        """
+        with self._lock:
+            lote = list(self._pending)
+            self._pending.clear()
+
+        if not lote:
+            return 0
+
+        now = datetime.now(timezone.utc).isoformat()
+        try:
+            await collection.bulk_write([
+                UpdateOne({"path": meta["path"]}, {"$set": {**meta, "indexado_em": now}}, upsert=True)
+                for meta in lote
+            ], ordered=False)
+        except BaseException:
+            # Devolve o lote à frente da fila (antes das atualizações mais novas)
+            # para a próxima tentativa; upserts já aplicados são idempotentes
+            with self._lock:
+                self._pending.extendleft(reversed(lote))
+            raise
+        return len(lote)
+
+    async def ensure_indexes(self, collection):
+        await collection.create_index("path", unique=True)
+        await collection.create_index([("client_id", 1), ("categoria", 1), ("mtime", -1)])
+        await collection.create_index([("client_id", 1), ("mtime", -1)])
+
+    async def list_files(
+        self,
+        collection,
+        client_id: str,
+        categoria: Optional[str] = None,
+        pagina: int = 1,
+        por_pagina: int = 50,
+        ordem: str = "recentes"
+    ) -> Dict:
+        """
+        Lista paginada dos arquivos do cliente a partir do índice
+        """
+        query = {"client_id": client_id}
+        if categoria:
+            query["categoria"] = categoria
+
+        total = await collection.count_documents(query)
+        arquivos = await collection.find(
+            query,
+            {"_id": 0, "client_id": 0, "indexado_em": 0}
+        ).sort(ORDENACOES.get(ordem, ORDENACOES["recentes"])).skip(
+            (pagina - 1) * por_pagina
+        ).limit(por_pagina).to_list(por_pagina)
+
+        return {"total": total, "arquivos": arquivos}
+
+    def scan_client_folder(self, client_id: str, client_folder: Path) -> List[Dict]:
+        """
+        Lê os metadados do disco com os.scandir (um stat por entrada)
+        """
+        arquivos = []
+        for subfolder, categoria in CATEGORIAS.items():
+            folder = client_folder / subfolder
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    arquivos.append(describe_file(
+                        client_id, categoria, Path(entry.path), stat=entry.stat()
+                    ))
+        return arquivos
+
+    async def reconcile(self, collection, client_id: str, disco: List[Dict]) -> Dict:
+        """
+        Sincroniza o índice do cliente com o que está no disco
+
+        Args:
+            disco: Resultado de scan_client_folder (executado fora do event loop)
+        """
+        indexados = {
+            doc["path"]: doc
+            async for doc in collection.find(
+                {"client_id": client_id},
+                {"_id": 0, "path": 1, "size": 1, "mtime": 1, "camada": 1}
+            )
+        }
+        no_disco = {meta["path"]: meta for meta in disco}
+
+        now = datetime.now(timezone.utc).isoformat()
+        operacoes = []
+        for path, meta in no_disco.items():
+            atual = indexados.get(path)
+            if not atual or atual.get("size") != meta["size"] or atual.get("mtime") != meta["mtime"]:
+                # Arquivo novo ou alterado: o sha256 indexado não vale mais, então
+                # sai do índice quando a varredura não calculou um novo
+                campos = {k: v for k, v in meta.items() if v is not None}
+                update = {"$set": {**campos, "indexado_em": now}}
+                if meta.get("sha256") is None:
+                    update["$unset"] = {"sha256": ""}
+                operacoes.append(UpdateOne({"path": path}, update, upsert=True))
+
+        for path in indexados.keys() - no_disco.keys():
+            # Arquivos na camada fria continuam listados (restaurados no download)
+            if indexados[path].get("camada") != "fria":
+                operacoes.append(DeleteOne({"path": path}))
+
+        if operacoes:
+            await collection.bulk_write(operacoes, ordered=False)
+
+        return {"verificados": len(no_disco), "alterados": len(operacoes)}
+
+
+# Instância global
+file_index = FileIndex()
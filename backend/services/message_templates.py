@@ -0,0 +1,200 @@
+"""
+Templates de mensagens do WhatsApp e normalização de telefones
+"""
+import string
+import logging
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RODAPE_AUTOMATICO = "_Mensagem automática - Consultar Processos_"
+
+
+class TemplateParamsError(ValueError):
+    """Parâmetros ausentes ao renderizar um template"""
+
+
+@lru_cache(maxsize=8192)
+def normalize_phone(phone: str) -> str:
+    """
+    Normaliza telefone para o formato E.164 sem '+' usado pelo Z-API
+    Ex: "(11) 99999-9999" -> "5511999999999"
+    """
+    digits = ''.join(filter(str.isdigit, phone or ''))
+
+    # DDD + número (10 ou 11 dígitos) sempre recebe o código do país,
+    # mesmo quando o DDD é 55 (RS)
+    if len(digits) in (10, 11) or not digits.startswith('55'):
+        digits = '55' + digits
+
+    return digits
+
+
+class MessageTemplate:
+    """Template de mensagem compilado uma única vez na inicialização"""
+
+    def __init__(
+        self,
+        name: str,
+        text: str,
+        context: Optional[Callable[[Dict], Dict]] = None
+    ):
+        self.name = name
+        self.text = text
+        self.context = context
+
+        # Compila o texto em (literal, campo) no carregamento do módulo;
+        # campos com conversão, formato ou acesso a atributo são recusados aqui
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(text):
+            if field is not None and (not field.isidentifier() or format_spec or conversion):
+                raise ValueError(f"Campo não suportado no template {name}: {{{field}}}")
+            self._parts.append((literal, field))
+        self.fields = frozenset(field for _, field in self._parts if field)
+
+    def render(self, **params) -> str:
+        """
+        Renderiza a mensagem com os parâmetros informados
+
+        Raises:
+            TemplateParamsError: algum campo do template não foi informado
+        """
+        if self.context:
+            params = {**params, **self.context(params)}
+        missing = self.fields.difference(params)
+        if missing:
+            raise TemplateParamsError(
+                f"Template {self.name}: parâmetros ausentes: {', '.join(sorted(missing))}"
+            )
+        return "".join(
+            literal + (str(params[field]) if field else "")
+            for literal, field in self._parts
+        )
+
+
+def _contexto_solicitacao(params: Dict) -> Dict:
+    prazo = params.get("prazo")
+    return {"prazo_text": f"\n📅 Prazo: {prazo}" if prazo else ""}
+
+
+def _contexto_agendamento(params: Dict) -> Dict:
+    online = params.get("tipo") == "online"
+    processo = params.get("processo")
+    return {
+        "tipo_emoji": "💻" if online else "🏢",
+        "tipo_text": "Online (Videochamada)" if online else "Presencial (No Escritório)",
+        "processo_text": f"\n📄 Processo: {processo}" if processo else "",
+        "instrucoes": (
+            "O link para a videochamada será enviado próximo ao horário."
+            if online
+            else "O endereço do escritório será confirmado por mensagem."
+        )
+    }
+
+
+TEMPLATES: Dict[str, MessageTemplate] = {
+    template.name: template
+    for template in (
+        MessageTemplate(
+            "solicitacao_documentos",
+            """🔔 *SOLICITAÇÃO DE DOCUMENTOS*
+
+Olá, {nome}!
+
+O escritório solicitou o envio dos seguintes documentos:
+
+📋 *{titulo}*
+
+{descricao}{prazo_text}
+
+Por favor, acesse sua área do cliente em nosso site/app e faça o upload dos documentos solicitados.
+
+Qualquer dúvida, estamos à disposição!
+
+""" + RODAPE_AUTOMATICO,
+            _contexto_solicitacao
+        ),
+        MessageTemplate(
+            "confirmacao_agendamento",
+            """✅ *REUNIÃO AGENDADA*
+
+Olá, {nome}!
+
+Sua consulta foi agendada com sucesso:
+
+📅 Data: {data}
+⏰ Horário: {hora}
+{tipo_emoji} Tipo: {tipo_text}{processo_text}
+
+{instrucoes}
+
+Para reagendar ou cancelar, entre em contato conosco.
+
+Até breve!
+
+""" + RODAPE_AUTOMATICO,
+            _contexto_agendamento
+        ),
+        MessageTemplate(
+            "lembrete_aniversario",
+            """🎂🎉 *FELIZ ANIVERSÁRIO!*
+
+Olá, {nome}!
+
+Toda a equipe do escritório deseja um feliz aniversário! 🎈
+
+Que este novo ano seja repleto de conquistas, alegrias e realizações.
+
+Conte sempre conosco!
+
+Um grande abraço,
+_Equipe Consultar Processos_"""
+        ),
+    )
+}
+
+
+def get_template(name: str) -> MessageTemplate:
+    """
+    Retorna o template registrado ou lança KeyError
+    """
+    try:
+        return TEMPLATES[name]
+    except KeyError:
+        raise KeyError(f"Template de mensagem não registrado: {name}")
+
+
+def render_message(name: str, phone: str, **params) -> Tuple[str, str]:
+    """
+    Renderiza um template para um destinatário
+
+    Returns:
+        (telefone normalizado, mensagem)
+    """
+    return normalize_phone(phone), get_template(name).render(**params)
+
+
+def render_batch(name: str, destinatarios: List[Dict]) -> List[Tuple[str, str]]:
+    """
+    Renderiza o mesmo template para vários destinatários em uma chamada
+
+    Args:
+        name: Nome do template
+        destinatarios: Lista de dicts com "phone" e os parâmetros do template
+
+    Returns:
+        Lista de (telefone normalizado, mensagem) na mesma ordem
+
+    Raises:
+        TemplateParamsError: indica o destinatário com parâmetros ausentes
+    """
+    template = get_template(name)
+    render = template.render
+    mensagens = []
+    for i, dest in enumerate(destinatarios):
+        try:
+            mensagens.append((normalize_phone(dest.get("phone", "")), render(**dest)))
+        except TemplateParamsError as e:
+            raise TemplateParamsError(f"Destinatário {i} ({dest.get('phone', '')}): {e}") from e
+    return mensagens
@@ -0,0 +1,140 @@
+"""
+Pub/sub em processo para notificações do admin (push via SSE)
+
+Toda gravação em notifications recebe um número de sequência crescente
+(collection counters), usado como id do evento SSE: o cliente reconecta
+com Last-Event-ID e recebe do banco só o que perdeu, depois segue pelos
+eventos publicados aqui em memória.
+
+O contador de não lidas de cada admin (notification_counters) é mantido
+com $inc na criação e na leitura, então o badge do painel é a leitura de
+um único documento; uma reconciliação periódica corrige desvios (ex:
+notificações lidas por outro admin que expiraram pelo TTL).
+"""
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Notificações lidas são removidas (índice TTL em expira_em) após este prazo
+READ_TTL_DAYS = int(os.environ.get('NOTIFICATION_READ_TTL_DAYS', '30'))
+
+# Mensagens mantidas na prévia de uma notificação agrupada
+PREVIEW_SIZE = 5
+
+
+def read_expiry() -> datetime:
+    """Data de expiração de uma notificação marcada como lida agora"""
+    return datetime.now(timezone.utc) + timedelta(days=READ_TTL_DAYS)
+
+
+class Subscription:
+    """Fila de um stream conectado"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Fila estourou: o stream relê do banco a partir do seu cursor
+        self.overflowed = False
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class NotificationHub:
+    """Distribui notificações para os streams conectados"""
+
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self.publicadas = 0
+
+    @property
+    def conectados(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription()
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, notification: Dict):
+        """Entrega a notificação a todos os streams sem bloquear"""
+        self.publicadas += 1
+        for subscription in self._subscribers:
+            try:
+                subscription.queue.put_nowait(notification)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+    async def next_seq(self, counters, quantidade: int = 1) -> int:
+        """
+        Próximo número de sequência das notificações
+
+        Com quantidade > 1 reserva um bloco com um único $inc e retorna o
+        último número do bloco (o primeiro é o retorno - quantidade + 1)
+        """
+        doc = await counters.find_one_and_update(
+            {"_id": "notifications"},
+            {"$inc": {"seq": quantidade}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["seq"]
+
+
+class UnreadCounters:
+    """Contadores de notificações não lidas por admin"""
+
+    async def increment(self, collection, total: int = 1):
+        """Nova notificação: não lida para todos os admins"""
+        await collection.update_many({}, {"$inc": {"nao_lidas": total}})
+
+    async def decrement(self, collection, admin_id: str, total: int = 1):
+        if total:
+            await collection.update_one({"_id": admin_id}, {"$inc": {"nao_lidas": -total}})
+
+    async def get(self, collection, notifications, admin_id: str) -> int:
+        """
+        Leitura do contador; criado com uma contagem na primeira consulta do admin
+        """
+        doc = await collection.find_one({"_id": admin_id})
+        if doc:
+            return max(doc["nao_lidas"], 0)
+        total = await notifications.count_documents({"lida_por": {"$ne": admin_id}})
+        await collection.update_one({"_id": admin_id}, {"$set": {"nao_lidas": total}}, upsert=True)
+        return total
+
+    async def reconcile(self, collection, notifications) -> List[Dict]:
+        """Recalcula os contadores com count_documents"""
+        ajustes = []
+        async for doc in collection.find({}):
+            total = await notifications.count_documents({"lida_por": {"$ne": doc["_id"]}})
+            if total != doc.get("nao_lidas"):
+                await collection.update_one({"_id": doc["_id"]}, {"$set": {"nao_lidas": total}})
+                ajustes.append({"admin_id": doc["_id"], "antes": doc.get("nao_lidas"), "depois": total})
+        return ajustes
+
+
+def format_sse(notification: Dict, admin_id: Optional[str] = None) -> str:
+    """
+    Evento SSE com o estado de leitura do admin conectado
+    """
+    payload = {k: v for k, v in notification.items() if k not in ("_id", "lida_por", "expira_em")}
+    payload["lida"] = admin_id in notification.get("lida_por", [])
+    return f"id: {notification['seq']}\nevent: notificacao\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+# Instâncias globais
+notification_hub = NotificationHub()
+unread_counters = UnreadCounters()
@@ -0,0 +1,148 @@
+"""
+Pipeline assíncrono em estágios com concorrência limitada por estágio
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Handler recebe o job e retorna (próximo estágio, job) ou None para encerrar
+StageResult = Optional[tuple]
+StageHandler = Callable[[Dict], Awaitable[StageResult]]
+
+
+class Stage:
+    """Estágio do pipeline: fila limitada + N workers"""
+
+    def __init__(self, name: str, handler: StageHandler, concurrency: int = 1, max_queue: int = 100):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.processados = 0
+        self.falhas = 0
+
+
+class Pipeline:
+    """
+    Executa jobs passando por estágios independentes
+
+    Cada estágio tem sua própria fila e número de workers, então um estágio
+    lento (ex: transcrição) não bloqueia os demais. A fila cheia de um estágio
+    segura os workers do estágio anterior (back-pressure).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, Stage] = {}
+        self.first_stage: Optional[str] = None
+        self.in_flight: set = set()
+        self.on_error: Optional[Callable[[Dict, str, Exception], Awaitable[Any]]] = None
+        self.on_done: Optional[Callable[[Dict], Awaitable[Any]]] = None
+        self.running = False
+
+    def add_stage(self, name: str, handler: StageHandler, concurrency: int = 1, max_queue: int = 100):
+        """
+        Registra um estágio; o primeiro registrado recebe os jobs de submit()
+        """
+        self.stages[name] = Stage(name, handler, concurrency, max_queue)
+        if self.first_stage is None:
+            self.first_stage = name
+
+    async def start(self):
+        """Cria as filas e inicia os workers de cada estágio"""
+        if self.running:
+            return
+        for stage in self.stages.values():
+            stage.queue = asyncio.Queue(maxsize=stage.max_queue)
+            stage.workers = [
+                asyncio.create_task(self._worker(stage))
+                for _ in range(stage.concurrency)
+            ]
+        self.running = True
+        logger.info(f"Pipeline {self.name} iniciado com estágios: {', '.join(self.stages)}")
+
+    async def stop(self):
+        """Cancela os workers (jobs pendentes continuam persistidos na origem)"""
+        for stage in self.stages.values():
+            for worker in stage.workers:
+                worker.cancel()
+            await asyncio.gather(*stage.workers, return_exceptions=True)
+            stage.workers = []
+        self.running = False
+
+    def submit(self, job: Dict, stage: Optional[str] = None) -> bool:
+        """
+        Enfileira um job no primeiro estágio (ou em `stage`, ao retomar um
+        job que falhou no meio) sem bloquear
+
+        Returns:
+            False se o job já está em processamento ou a fila está cheia
+        """
+        job_id = job.get("id")
+        if not self.running or job_id in self.in_flight:
+            return False
+
+        stage = stage or self.first_stage
+        try:
+            self.stages[stage].queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning(f"Pipeline {self.name}: fila {stage} cheia, job {job_id} adiado")
+            return False
+
+        self.in_flight.add(job_id)
+        return True
+
+    async def _worker(self, stage: Stage):
+        while True:
+            job = await stage.queue.get()
+            try:
+                try:
+                    result = await stage.handler(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    stage.falhas += 1
+                    self.in_flight.discard(job.get("id"))
+                    logger.error(f"Pipeline {self.name}: erro no estágio {stage.name}: {str(e)}")
+                    if self.on_error:
+                        try:
+                            await self.on_error(job, stage.name, e)
+                        except Exception as err:
+                            logger.error(f"Pipeline {self.name}: erro ao registrar falha: {str(err)}")
+                    continue
+
+                stage.processados += 1
+                if result:
+                    next_stage, next_job = result
+                    # Bloqueia se o próximo estágio estiver cheio (back-pressure)
+                    await self.stages[next_stage].queue.put(next_job)
+                    continue
+
+                self.in_flight.discard(job.get("id"))
+                # Fora do try do estágio: um erro aqui não transforma um job
+                # concluído em falha (nem agenda retentativa)
+                if self.on_done:
+                    try:
+                        await self.on_done(job)
+                    except Exception as e:
+                        logger.error(f"Pipeline {self.name}: erro ao concluir job {job.get('id')}: {str(e)}")
+            finally:
+                stage.queue.task_done()
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Retorna tamanho de fila e contadores por estágio
+        """
+        return {
+            name: {
+                "fila": stage.queue.qsize() if stage.queue else 0,
+                "workers": stage.concurrency,
+                "processados": stage.processados,
+                "falhas": stage.falhas
+            }
+            for name, stage in self.stages.items()
+        }
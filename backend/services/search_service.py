@@ -0,0 +1,152 @@
+"""
+Busca textual em transcrições, mensagens e solicitações de documento
+
+Cada item pesquisável vira um documento na collection search_index, com
+índice de texto do Mongo em português (stemming: "contrato" encontra
+"contratos"/"contratual"; índice de texto v3 ignora acentos). O índice é
+atualizado no próprio caminho de ingestão com upserts, e um reindex
+completo reconstrói tudo a partir das collections de origem.
+"""
+import re
+import logging
+import unicodedata
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Tipos de item indexados
+TIPOS_BUSCA = ("mensagem", "transcricao", "solicitacao")
+
+SNIPPET_CHARS = 160
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """
+    Minúsculas sem acentos, caractere a caractere (mesmo comprimento do
+    texto original, para recortar o trecho nas mesmas posições)
+    """
+    return "".join(
+        unicodedata.normalize("NFKD", ch)[0] for ch in text.lower()
+    )
+
+
+def snippet(texto: str, q: str, size: int = SNIPPET_CHARS) -> str:
+    """
+    Trecho do texto em volta do primeiro termo da busca encontrado
+    """
+    if len(texto) <= size:
+        return texto
+
+    folded = fold(texto)
+    posicoes = []
+    for termo in _TERM_RE.findall(fold(q)):
+        # Prefixo aproxima o radical (contrato -> contratual)
+        pos = folded.find(termo[:max(4, len(termo) - 2)])
+        if pos >= 0:
+            posicoes.append(pos)
+
+    inicio = max(min(posicoes) - size // 3, 0) if posicoes else 0
+    if inicio > 0:
+        # Começa o trecho numa palavra inteira
+        espaco = texto.find(" ", inicio, inicio + 20)
+        if espaco >= 0:
+            inicio = espaco + 1
+    fim = min(inicio + size, len(texto))
+    trecho = texto[inicio:fim].strip()
+    return f"{'…' if inicio > 0 else ''}{trecho}{'…' if fim < len(texto) else ''}"
+
+
+def search_entry(
+    tipo: str,
+    ref: str,
+    client_id: Optional[str],
+    client_name: Optional[str],
+    titulo: str,
+    texto: str,
+    data: Optional[str] = None
+) -> Dict:
+    """Documento do índice para um item pesquisável"""
+    return {
+        "_id": f"{tipo}:{ref}",
+        "tipo": tipo,
+        "ref": ref,
+        "client_id": client_id,
+        "client_name": client_name,
+        "titulo": titulo,
+        "texto": texto,
+        "data": data or datetime.now(timezone.utc).isoformat()
+    }
+
+
+class SearchService:
+    """Indexação incremental e consulta ranqueada"""
+
+    async def ensure_indexes(self, collection):
+        await collection.create_index(
+            [("titulo", "text"), ("texto", "text"), ("client_name", "text")],
+            name="busca_texto",
+            default_language="portuguese",
+            # Campo inexistente: impede que um campo "language" mude o idioma
+            language_override="idioma_busca",
+            weights={"titulo": 5, "client_name": 3, "texto": 1}
+        )
+        await collection.create_index([("client_id", 1), ("data", -1)])
+
+    async def index(self, collection, entry: Dict):
+        """Indexa (ou reindexa) um item"""
+        await collection.replace_one({"_id": entry["_id"]}, entry, upsert=True)
+
+    async def index_many(self, collection, entries: Iterable[Dict]) -> int:
+        operacoes = [
+            UpdateOne({"_id": entry["_id"]}, {"$set": entry}, upsert=True)
+            for entry in entries
+        ]
+        if operacoes:
+            await collection.bulk_write(operacoes, ordered=False)
+        return len(operacoes)
+
+    async def search(
+        self,
+        collection,
+        q: str,
+        pagina: int = 1,
+        por_pagina: int = 20,
+        tipo: Optional[str] = None,
+        client_id: Optional[str] = None
+    ) -> Dict:
+        """
+        Busca ranqueada pela relevância do índice de texto
+
+        Returns:
+            {"total", "resultados"} - cada resultado com score e trecho
+        """
+        query: Dict = {"$text": {"$search": q}}
+        if tipo:
+            query["tipo"] = tipo
+        if client_id:
+            query["client_id"] = client_id
+
+        total = await collection.count_documents(query)
+        docs = await collection.find(
+            query,
+            {"_id": 0, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"}), ("data", -1)]).skip(
+            (pagina - 1) * por_pagina
+        ).limit(por_pagina).to_list(por_pagina)
+
+        resultados: List[Dict] = []
+        for doc in docs:
+            texto = doc.pop("texto", "")
+            doc["trecho"] = snippet(texto, q)
+            doc["score"] = round(doc.get("score", 0), 3)
+            resultados.append(doc)
+
+        return {"total": total, "resultados": resultados}
+
+
+# Instância global
+search_service = SearchService()
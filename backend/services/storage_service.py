@@ -2,42 +2,111 @@
 Serviço de armazenamento e organização de arquivos por cliente
 """
 import os
+import re
 import logging
+import threading
+import unicodedata
+import uuid
 from pathlib import Path
 from datetime import datetime
 import shutil
 import json
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, Optional, Union
+from cachetools import LRUCache
+from services.conversation_log import conversation_log
+from services.blob_store import blob_store
+from services.file_index import file_index
 
 logger = logging.getLogger(__name__)
 
+# Regex de normalização compiladas uma única vez
+_NON_WORD_RE = re.compile(r'[^\w\s-]')
+_MULTI_UNDERSCORE_RE = re.compile(r'_+')
+
+# Subpastas criadas para cada cliente
+CLIENT_SUBFOLDERS = (
+    "documentos",
+    "whatsapp/audios",
+    "whatsapp/transcricoes",
+    "whatsapp/imagens",
+    "whatsapp/documentos",
+    "reunioes",
+    "atendimentos",
+    "backup_conversas",
+)
+
+# Conteúdo em memória, arquivo aberto ou blob já gravado (retorno de blob_store.put)
+MediaSource = Union[bytes, BinaryIO, Dict]
+
+
+def _store_media(media: MediaSource, dest: Path) -> Dict:
+    """
+    Grava a mídia no blob store e liga a dest; um blob já gravado (ex: download
+    em streaming) só ganha o hardlink, sem copiar os bytes de novo
+    """
+    if isinstance(media, dict):
+        blob_store.link(media["sha256"], dest)
+        return media
+    return blob_store.store(media, dest)
+
+
+def atomic_write(path: Path, data) -> int:
+    """
+    Grava em arquivo temporário na mesma pasta e renomeia ao final,
+    para que leitores nunca vejam um arquivo pela metade
+
+    Args:
+        data: bytes, str ou objeto de arquivo (copiado em streaming)
+
+    Returns:
+        Tamanho gravado em bytes
+    """
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            if isinstance(data, str):
+                f.write(data.encode('utf-8'))
+            elif isinstance(data, (bytes, bytearray, memoryview)):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f, 1024 * 1024)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(temp_path, path)
+        return size
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
 class StorageService:
     """Gerencia armazenamento de arquivos por cliente"""
     
     def __init__(self):
         self.base_dir = Path("/app/backend/storage")
         self.base_dir.mkdir(exist_ok=True)
+        
+        # client_id -> pasta já criada
+        self._folder_cache = LRUCache(maxsize=2048)
+        self._folder_lock = threading.Lock()
     
     def _normalize_name(self, name: str) -> str:
         """
         Normaliza nome para usar como nome de pasta
         Remove caracteres especiais e substitui espaços
         """
-        import unicodedata
-        import re
-        
         # Remove acentos
         name = unicodedata.normalize('NFKD', name)
         name = name.encode('ASCII', 'ignore').decode('ASCII')
         
         # Remove caracteres especiais, mantém apenas letras, números e espaços
-        name = re.sub(r'[^\w\s-]', '', name)
+        name = _NON_WORD_RE.sub('', name)
         
         # Substitui espaços por underscores
         name = name.replace(' ', '_')
         
         # Remove múltiplos underscores
-        name = re.sub(r'_+', '_', name)
+        name = _MULTI_UNDERSCORE_RE.sub('_', name)
         
         return name.lower()
     
@@ -45,63 +114,89 @@ class StorageService:
         """
         Retorna ou cria a pasta do cliente
         Formato: storage/{client_id}_{nome_normalizado}/
+        
+        A pasta é identificada só pelo client_id: o nome entra apenas na
+        criação e a pasta nunca é renomeada (caminhos gravados em client_files,
+        cold_files, transcription_jobs e no log de conversas continuam válidos
+        se o cliente mudar de nome). A árvore de subpastas é criada só na
+        primeira resolução; as seguintes saem do cache sem syscalls.
+        """
+        client_folder = self._folder_cache.get(client_id)
+        if client_folder is not None:
+            return client_folder
+        
+        with self._folder_lock:
+            client_folder = self._folder_cache.get(client_id)
+            if client_folder is not None:
+                return client_folder
+            
+            client_folder = self._find_client_folder(client_id, client_name)
+            
+            for subfolder in CLIENT_SUBFOLDERS:
+                (client_folder / subfolder).mkdir(parents=True, exist_ok=True)
+            
+            self._folder_cache[client_id] = client_folder
+            return client_folder
+    
+    def _find_client_folder(self, client_id: str, client_name: str) -> Path:
+        """
+        Pasta existente do cliente (qualquer nome) ou a pasta nova com o nome atual
         """
-        folder_name = f"{client_id}_{self._normalize_name(client_name)}"
-        client_folder = self.base_dir / folder_name
-        client_folder.mkdir(exist_ok=True)
-        
-        # Criar subpastas
-        (client_folder / "documentos").mkdir(exist_ok=True)
-        (client_folder / "whatsapp").mkdir(exist_ok=True)
-        (client_folder / "whatsapp" / "audios").mkdir(exist_ok=True)
-        (client_folder / "whatsapp" / "transcricoes").mkdir(exist_ok=True)
-        (client_folder / "whatsapp" / "imagens").mkdir(exist_ok=True)
-        (client_folder / "whatsapp" / "documentos").mkdir(exist_ok=True)
-        (client_folder / "reunioes").mkdir(exist_ok=True)
-        (client_folder / "atendimentos").mkdir(exist_ok=True)
-        (client_folder / "backup_conversas").mkdir(exist_ok=True)
-        
-        return client_folder
+        preferida = self.base_dir / f"{client_id}_{self._normalize_name(client_name)}"
+        if preferida.is_dir():
+            return preferida
+        
+        existentes = sorted(p for p in self.base_dir.glob(f"{client_id}_*") if p.is_dir())
+        if len(existentes) > 1:
+            logger.warning(
+                f"Várias pastas para o cliente {client_id}; usando {existentes[0].name}"
+            )
+        return existentes[0] if existentes else preferida
     
     def save_whatsapp_message(
         self, 
         client_id: str, 
         client_name: str, 
-        message_data: Dict
+        message_data: Dict,
+        timestamp: Optional[datetime] = None
     ) -> str:
         """
         Salva mensagem do WhatsApp no backup de conversas
+        
+        Args:
+            timestamp: Horário gravado no log (padrão: agora, hora local)
         """
         client_folder = self.get_client_folder(client_id, client_name)
         backup_folder = client_folder / "backup_conversas"
         
-        # Arquivo de backup (JSON com todas as mensagens)
-        backup_file = backup_folder / "conversas.json"
-        
-        # Carregar conversas existentes
-        conversas = []
-        if backup_file.exists():
-            with open(backup_file, 'r', encoding='utf-8') as f:
-                conversas = json.load(f)
-        
-        # Adicionar nova mensagem
-        conversas.append({
-            "timestamp": datetime.now().isoformat(),
-            "data": message_data
-        })
-        
-        # Salvar
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(conversas, f, ensure_ascii=False, indent=2)
+        # Log append-only segmentado por mês (ver conversation_log)
+        segment = conversation_log.append(backup_folder, message_data, timestamp)
         
         logger.info(f"Mensagem salva no backup de {client_name}")
-        return str(backup_file)
+        return str(segment)
+    
+    def read_whatsapp_messages(
+        self,
+        client_id: str,
+        client_name: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 50,
+        before: Optional[str] = None
+    ) -> Dict:
+        """
+        Lê o histórico de conversas do período, da mensagem mais recente para a mais antiga
+        """
+        client_folder = self.get_client_folder(client_id, client_name)
+        return conversation_log.read_page(
+            client_folder / "backup_conversas", start, end, limit, before
+        )
     
     def save_whatsapp_audio(
         self, 
         client_id: str, 
         client_name: str, 
-        audio_data: bytes,
+        audio_data: MediaSource,
         filename: str,
         transcription: Optional[str] = None
     ) -> Dict[str, str]:
@@ -116,36 +211,56 @@ class StorageService:
         audio_filename = f"{timestamp}_{filename}"
         audio_path = audio_folder / audio_filename
         
-        with open(audio_path, 'wb') as f:
-            f.write(audio_data)
+        blob = _store_media(audio_data, audio_path)
+        file_index.enqueue(client_id, "whatsapp/audios", audio_path, blob["sha256"])
         
         result = {
             "audio_path": str(audio_path),
+            "sha256": blob["sha256"],
             "transcription_path": None
         }
         
         # Salvar transcrição se disponível
         if transcription:
-            transcription_folder = client_folder / "whatsapp" / "transcricoes"
-            transcription_filename = f"{timestamp}_{Path(filename).stem}.txt"
-            transcription_path = transcription_folder / transcription_filename
-            
-            with open(transcription_path, 'w', encoding='utf-8') as f:
-                f.write(f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-                f.write(f"Arquivo de áudio: {audio_filename}\n")
-                f.write("=" * 50 + "\n\n")
-                f.write(transcription)
-            
-            result["transcription_path"] = str(transcription_path)
-            logger.info(f"Áudio transcrito e salvo para {client_name}")
+            result["transcription_path"] = self.save_audio_transcription(
+                client_id, client_name, str(audio_path), transcription
+            )
         
         return result
     
+    def save_audio_transcription(
+        self,
+        client_id: str,
+        client_name: str,
+        audio_path: str,
+        transcription: str
+    ) -> str:
+        """
+        Salva a transcrição de um áudio já gravado (mesmo prefixo de data do áudio)
+        """
+        client_folder = self.get_client_folder(client_id, client_name)
+        audio_filename = Path(audio_path).name
+        
+        transcription_folder = client_folder / "whatsapp" / "transcricoes"
+        transcription_path = transcription_folder / f"{Path(audio_filename).stem}.txt"
+        
+        atomic_write(
+            transcription_path,
+            f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n"
+            f"Arquivo de áudio: {audio_filename}\n"
+            + "=" * 50 + "\n\n"
+            + transcription
+        )
+        
+        file_index.enqueue(client_id, "whatsapp/transcricoes", transcription_path)
+        logger.info(f"Áudio transcrito e salvo para {client_name}")
+        return str(transcription_path)
+    
     def save_whatsapp_image(
         self, 
         client_id: str, 
         client_name: str, 
-        image_data: bytes,
+        image_data: MediaSource,
         filename: str
     ) -> str:
         """
@@ -158,8 +273,8 @@ class StorageService:
         image_filename = f"{timestamp}_{filename}"
         image_path = image_folder / image_filename
         
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
+        blob = _store_media(image_data, image_path)
+        file_index.enqueue(client_id, "whatsapp/imagens", image_path, blob["sha256"])
         
         logger.info(f"Imagem salva para {client_name}: {image_filename}")
         return str(image_path)
@@ -168,7 +283,7 @@ class StorageService:
         self, 
         client_id: str, 
         client_name: str, 
-        document_data: bytes,
+        document_data: MediaSource,
         filename: str
     ) -> str:
         """
@@ -181,8 +296,8 @@ class StorageService:
         doc_filename = f"{timestamp}_{filename}"
         doc_path = doc_folder / doc_filename
         
-        with open(doc_path, 'wb') as f:
-            f.write(document_data)
+        blob = _store_media(document_data, doc_path)
+        file_index.enqueue(client_id, "whatsapp/documentos", doc_path, blob["sha256"])
         
         logger.info(f"Documento salvo para {client_name}: {doc_filename}")
         return str(doc_path)
@@ -202,12 +317,20 @@ class StorageService:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         meeting_file = meeting_folder / f"reuniao_{timestamp}.json"
         
-        with open(meeting_file, 'w', encoding='utf-8') as f:
-            json.dump(meeting_data, f, ensure_ascii=False, indent=2)
+        atomic_write(meeting_file, json.dumps(meeting_data, ensure_ascii=False, indent=2))
+        file_index.enqueue(client_id, "reunioes", meeting_file)
         
         logger.info(f"Registro de reunião salvo para {client_name}")
         return str(meeting_file)
     
+    def iter_client_folders(self):
+        """
+        Percorre as pastas de clientes existentes: (client_id, pasta)
+        """
+        for entry in os.scandir(self.base_dir):
+            if entry.is_dir() and "_" in entry.name:
+                yield entry.name.split("_", 1)[0], Path(entry.path)
+    
     def list_client_files(self, client_id: str, client_name: str) -> Dict[str, List[str]]:
         """
         Lista todos os arquivos de um cliente organizados por tipo
@@ -227,7 +350,7 @@ class StorageService:
         # Listar documentos
         doc_folder = client_folder / "documentos"
         if doc_folder.exists():
-            result["documentos"] = [f.name for f in doc_folder.iterdir() if f.is_file()]
+            result["documentos"] = [f.name for f in doc_folder.iterdir() if f.is_file() and not f.name.startswith('.')]
         
         # Listar WhatsApp
         whatsapp_folders = {
@@ -240,17 +363,17 @@ class StorageService:
         for folder_name, result_key in whatsapp_folders.items():
             folder = client_folder / "whatsapp" / folder_name
             if folder.exists():
-                result[result_key] = [f.name for f in folder.iterdir() if f.is_file()]
+                result[result_key] = [f.name for f in folder.iterdir() if f.is_file() and not f.name.startswith('.')]
         
         # Listar reuniões
         meeting_folder = client_folder / "reunioes"
         if meeting_folder.exists():
-            result["reunioes"] = [f.name for f in meeting_folder.iterdir() if f.is_file()]
+            result["reunioes"] = [f.name for f in meeting_folder.iterdir() if f.is_file() and not f.name.startswith('.')]
         
         # Listar atendimentos
         atendimento_folder = client_folder / "atendimentos"
         if atendimento_folder.exists():
-            result["atendimentos"] = [f.name for f in atendimento_folder.iterdir() if f.is_file()]
+            result["atendimentos"] = [f.name for f in atendimento_folder.iterdir() if f.is_file() and not f.name.startswith('.')]
         
         return result
 
@@ -0,0 +1,359 @@
+"""
+Armazenamento em camadas: arquivos frios vão para um arquivo compactado
+
+Arquivos sem acesso há N dias (COLD_TIER_DAYS) saem do disco quente e são
+compactados em um pacote por cliente (COLD_STORAGE_DIR/{client_id}.pack,
+frames independentes com offset registrado em cold_files) ou, se
+COLD_STORAGE_S3_BUCKET estiver definido, em objetos de um bucket S3/MinIO.
+Na leitura, o arquivo é restaurado para o caminho original (read-through)
+pelo blob store, preservando a deduplicação por SHA-256. O registro em
+cold_files fica marcado como restaurado (restaurado_em) em vez de removido:
+se o mesmo conteúdo esfriar de novo, o frame já gravado é reaproveitado e o
+pacote não cresce a cada ciclo de restauração/migração.
+
+Compressão: zstd quando o pacote `zstandard` está instalado, senão gzip.
+"""
+import os
+import zlib
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from services.blob_store import blob_store, CHUNK_SIZE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Pastas que recebem escrita contínua e nunca vão para a camada fria
+HOT_ONLY_FOLDERS = {"backup_conversas"}
+
+
+def _compressor(codec: str):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compressobj()
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def _decompressor(codec: str):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+class LocalArchiveBackend:
+    """Pacote por cliente com frames compactados anexados ao final"""
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, client_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(client_id, threading.Lock())
+
+    def put(self, client_id: str, source: Path, codec: str) -> Dict:
+        archive = self.base_dir / f"{client_id}.pack"
+        compressor = _compressor(codec)
+
+        with self._lock_for(client_id), open(archive, 'ab') as out, open(source, 'rb') as f:
+            offset = out.tell()
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                out.write(compressor.compress(chunk))
+            out.write(compressor.flush())
+            out.flush()
+            os.fsync(out.fileno())
+            length = out.tell() - offset
+
+        return {"backend": "local", "archive": str(archive), "offset": offset, "length": length}
+
+    def restore(self, ref: Dict, dest, codec: str):
+        decompressor = _decompressor(codec)
+        with open(ref["archive"], 'rb') as f:
+            f.seek(ref["offset"])
+            remaining = ref["length"]
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                dest.write(decompressor.decompress(chunk))
+        if hasattr(decompressor, "flush"):
+            dest.write(decompressor.flush())
+
+
+class S3Backend:
+    """Um objeto compactado por arquivo em bucket S3 (ou MinIO local)"""
+
+    def __init__(self, bucket: str, prefix: str = "cold/"):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=os.environ.get('COLD_STORAGE_S3_ENDPOINT') or None
+        )
+
+    def put(self, client_id: str, source: Path, codec: str) -> Dict:
+        key = f"{self.prefix}{client_id}/{uuid.uuid4().hex}_{source.name}.{codec}"
+        temp_path = source.with_name(f".{source.name}.{uuid.uuid4().hex}.cold")
+        compressor = _compressor(codec)
+        try:
+            with open(source, 'rb') as f, open(temp_path, 'wb') as out:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    out.write(compressor.compress(chunk))
+                out.write(compressor.flush())
+            self.client.upload_file(str(temp_path), self.bucket, key)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return {"backend": "s3", "bucket": self.bucket, "key": key}
+
+    def restore(self, ref: Dict, dest, codec: str):
+        decompressor = _decompressor(codec)
+        body = self.client.get_object(Bucket=ref["bucket"], Key=ref["key"])["Body"]
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+            dest.write(decompressor.decompress(chunk))
+        if hasattr(decompressor, "flush"):
+            dest.write(decompressor.flush())
+
+
+class TieringService:
+    """Move arquivos frios para a camada compactada e os restaura sob demanda"""
+
+    def __init__(self):
+        self.cold_days = int(os.environ.get('COLD_TIER_DAYS', '90'))
+        self.codec = "zstd" if zstandard else "gzip"
+        self._backend = None
+        # caminho -> [trava, requisições usando a trava]
+        self._restore_locks: Dict[str, list] = {}
+
+    @property
+    def backend(self):
+        # Criado sob demanda para não exigir boto3/S3 quando o tiering não é usado
+        if self._backend is None:
+            bucket = os.environ.get('COLD_STORAGE_S3_BUCKET')
+            if bucket:
+                self._backend = S3Backend(bucket)
+            else:
+                self._backend = LocalArchiveBackend(
+                    Path(os.environ.get('COLD_STORAGE_DIR', '/app/backend/cold'))
+                )
+        return self._backend
+
+    def find_cold_files(self, roots: Iterable[Tuple[str, Path]], days: Optional[int] = None) -> List[Tuple[str, Path]]:
+        """
+        Lista (client_id, caminho) dos arquivos sem acesso há `days` dias
+
+        Args:
+            roots: Pares (client_id, pasta do cliente)
+        """
+        limite = time.time() - (days or self.cold_days) * 86400
+        frios = []
+
+        for client_id, root in roots:
+            stack = [root]
+            while stack:
+                folder = stack.pop()
+                try:
+                    entries = list(os.scandir(folder))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    if entry.name.startswith('.') or entry.name in HOT_ONLY_FOLDERS:
+                        continue
+                    if entry.is_dir():
+                        stack.append(Path(entry.path))
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        if max(stat.st_atime, stat.st_mtime) < limite:
+                            frios.append((client_id, Path(entry.path)))
+
+        return frios
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def archive_file(self, client_id: str, path: Path, sha256: str) -> Dict:
+        """
+        Compacta o arquivo na camada fria (a cópia quente é removida por migrate)
+
+        Returns:
+            Registro para a collection cold_files
+        """
+        stat = path.stat()
+        ref = self.backend.put(client_id, path, self.codec)
+        return {
+            "path": str(path),
+            "client_id": client_id,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "codec": self.codec,
+            "ref": ref,
+            "migrado_em": datetime.now(timezone.utc).isoformat()
+        }
+
+    def restore_file(self, record: Dict) -> Path:
+        """
+        Descompacta o arquivo e o devolve ao caminho original via blob store
+        (se o conteúdo ainda existe em outro caminho, só recria o hardlink)
+        """
+        path = Path(record["path"])
+        sha256 = record["sha256"]
+
+        try:
+            blob_store.link(sha256, path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        temp_path = blob_store.tmp_dir / uuid.uuid4().hex
+        try:
+            with open(temp_path, 'wb') as out:
+                self.backend.restore(record["ref"], out, record["codec"])
+            if not blob_store.verify(sha256, temp_path):
+                raise IOError(f"Conteúdo restaurado não confere com o SHA-256 de {path.name}")
+            blob_store.adopt(temp_path, sha256, record["size"], path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return path
+
+    async def migrate(
+        self,
+        collection,
+        roots: Iterable[Tuple[str, Path]],
+        days: Optional[int] = None,
+        files_collection=None,
+        blobs_collection=None,
+        on_archived: Optional[Callable[[str, str], Awaitable[None]]] = None
+    ) -> Dict:
+        """
+        Executa um ciclo de migração para a camada fria
+
+        Args:
+            collection: cold_files (localização de cada arquivo arquivado)
+            files_collection: client_files, para manter os arquivos frios na listagem
+            blobs_collection: blobs, consultada pela coleta de lixo
+            on_archived: Chamado com (caminho, sha256) de cada arquivo que saiu
+                do disco quente (ex: liberar a referência do documento ao blob)
+        """
+        frios = await asyncio.to_thread(self.find_cold_files, list(roots), days)
+        resumo = {"candidatos": len(frios), "migrados": 0, "bytes": 0, "erros": 0}
+
+        for client_id, path in frios:
+            try:
+                sha256 = await asyncio.to_thread(self._hash_file, path)
+                # Mesmo conteúdo já arquivado para o cliente (inclusive registros
+                # restaurados, cujo frame continua no pacote): reaproveita o frame
+                existente = await collection.find_one(
+                    {"client_id": client_id, "sha256": sha256, "codec": self.codec},
+                    {"_id": 0, "ref": 1}
+                )
+                if existente:
+                    record = {
+                        "path": str(path), "client_id": client_id,
+                        "size": (await asyncio.to_thread(path.stat)).st_size,
+                        "sha256": sha256, "codec": self.codec, "ref": existente["ref"],
+                        "migrado_em": datetime.now(timezone.utc).isoformat()
+                    }
+                else:
+                    record = await asyncio.to_thread(self.archive_file, client_id, path, sha256)
+
+                await collection.update_one(
+                    {"path": record["path"]},
+                    {"$set": record, "$unset": {"restaurado_em": ""}},
+                    upsert=True
+                )
+                if files_collection is not None:
+                    await files_collection.update_one({"path": record["path"]}, {"$set": {"camada": "fria"}})
+                # Só remove a cópia quente depois que o registro está salvo
+                await asyncio.to_thread(path.unlink)
+                if on_archived is not None:
+                    await on_archived(record["path"], sha256)
+                resumo["migrados"] += 1
+                resumo["bytes"] += record["size"]
+            except Exception as e:
+                resumo["erros"] += 1
+                logger.error(f"Erro ao migrar {path} para a camada fria: {str(e)}")
+
+        # Blobs cujo último hardlink foi para a camada fria
+        if blobs_collection is not None:
+            resumo["blobs_removidos"] = await blob_store.collect(blobs_collection)
+        else:
+            resumo["blobs_removidos"] = len(await asyncio.to_thread(blob_store.collect_garbage))
+
+        logger.info(f"Tiering: {resumo}")
+        return resumo
+
+    async def read_through(
+        self,
+        collection,
+        path: str,
+        files_collection=None,
+        on_restored: Optional[Callable[[str, str, int], Awaitable[None]]] = None
+    ) -> bool:
+        """
+        Restaura o arquivo se ele estiver na camada fria
+
+        Args:
+            on_restored: Chamado com (caminho, sha256, tamanho) depois que o
+                arquivo volta ao disco quente
+
+        Returns:
+            True se o arquivo foi restaurado
+        """
+        entrada = self._restore_locks.setdefault(str(path), [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                if await asyncio.to_thread(os.path.exists, path):
+                    # Restaurado por outra requisição enquanto esta aguardava
+                    return True
+
+                record = await collection.find_one(
+                    {"path": str(path), "restaurado_em": {"$exists": False}}, {"_id": 0}
+                )
+                if not record:
+                    return False
+
+                await asyncio.to_thread(self.restore_file, record)
+                # Mantém o registro (e o frame) para reaproveitar em uma nova migração
+                await collection.update_one(
+                    {"path": str(path)},
+                    {"$set": {"restaurado_em": datetime.now(timezone.utc).isoformat()}}
+                )
+                if files_collection is not None:
+                    await files_collection.update_one({"path": str(path)}, {"$unset": {"camada": ""}})
+                if on_restored is not None:
+                    await on_restored(str(path), record["sha256"], record["size"])
+                logger.info(f"Arquivo restaurado da camada fria: {path}")
+                return True
+        finally:
+            # Só descarta a trava quando ninguém mais está esperando por ela
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                self._restore_locks.pop(str(path), None)
+
+    async def ensure_indexes(self, collection):
+        await collection.create_index("path", unique=True)
+        await collection.create_index([("client_id", 1), ("sha256", 1)])
+
+
+# Instância global
+tiering_service = TieringService()
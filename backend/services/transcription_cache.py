@@ -0,0 +1,106 @@
+"""
+Cache de transcrições por conteúdo (collection transcription_cache)
+
+A chave é SHA-256 do áudio + modelo + idioma: áudios encaminhados ou
+reenviados pelo webhook custam uma consulta, não uma nova transcrição.
+Um LRU em memória fica na frente do Mongo, e pedidos simultâneos da mesma
+chave aguardam a mesma execução (single-flight).
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionCache:
+    """LRU em memória + Mongo, com coalescência de pedidos em andamento"""
+
+    def __init__(self, max_memory: int = 2048):
+        self._memory = LRUCache(maxsize=max_memory)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits_memoria = 0
+        self.hits_banco = 0
+        self.misses = 0
+        self.coalescidos = 0
+
+    @staticmethod
+    def make_key(sha256: str, model: str, language: str) -> str:
+        return f"{sha256}:{model}:{language}"
+
+    async def get(self, collection, key: str) -> Optional[str]:
+        text = self._memory.get(key)
+        if text is not None:
+            self.hits_memoria += 1
+            return text
+
+        doc = await collection.find_one({"_id": key}, {"transcription": 1})
+        if doc:
+            self.hits_banco += 1
+            self._memory[key] = doc["transcription"]
+            return doc["transcription"]
+
+        return None
+
+    async def put(self, collection, key: str, text: str):
+        self._memory[key] = text
+        await collection.update_one(
+            {"_id": key},
+            {
+                "$set": {"transcription": text},
+                "$setOnInsert": {"criado_em": datetime.now(timezone.utc).isoformat()}
+            },
+            upsert=True
+        )
+
+    async def get_or_compute(
+        self,
+        collection,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[str]]]
+    ) -> Optional[str]:
+        """
+        Retorna a transcrição em cache ou executa `compute` uma única vez
+
+        Resultados None (falha) não são gravados, para que a próxima
+        tentativa transcreva de novo.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalescidos += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            text = await self.get(collection, key)
+            if text is None:
+                self.misses += 1
+                text = await compute()
+                if text is not None:
+                    await self.put(collection, key, text)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            # Cancelamento deste worker não deve cancelar quem está aguardando
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Transcrição interrompida"))
+            # Marca a exceção como lida caso ninguém mais esteja aguardando
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_banco": self.hits_banco,
+            "misses": self.misses,
+            "coalescidos": self.coalescidos,
+            "em_andamento": len(self._inflight)
+        }
+
+
+# Instância global
+transcription_cache = TranscriptionCache()
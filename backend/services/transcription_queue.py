@@ -0,0 +1,293 @@
+"""
+Fila persistente de transcrições (collection transcription_jobs)
+
+Cada áudio vira um job no Mongo; workers assíncronos reivindicam os jobs
+com find_one_and_update, chamam o serviço de transcrição fora do event loop
+e reagendam falhas com backoff exponencial. O status de cada job pode ser
+consultado pelo painel, e enqueue() aguarda quando o backlog passa do limite
+(back-pressure até o pipeline do webhook).
+"""
+import os
+import uuid
+import hashlib
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pymongo import ReturnDocument
+from services.transcription_service import transcription_service
+from services.transcription_cache import transcription_cache
+from services.blob_store import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Status de um job
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+FALHOU = "falhou"
+
+
+class TranscriptionQueue:
+    """Workers de transcrição sobre uma collection do Mongo"""
+
+    def __init__(self):
+        self.workers = int(os.environ.get('TRANSCRIPTION_WORKERS', '2'))
+        self.max_pending = int(os.environ.get('TRANSCRIPTION_MAX_PENDING', '200'))
+        self.max_attempts = int(os.environ.get('TRANSCRIPTION_MAX_ATTEMPTS', '5'))
+        self.base_delay = float(os.environ.get('TRANSCRIPTION_RETRY_BASE_SECONDS', '10'))
+        self.max_delay = 15 * 60
+        # Job em "processando" há mais tempo que isso é considerado abandonado
+        self.lease_seconds = 10 * 60
+        self.collection = None
+        self.cache_collection = None
+        self.on_complete: Optional[Callable[[Dict], Awaitable[Any]]] = None
+        self.on_failed: Optional[Callable[[Dict], Awaitable[Any]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.concluidos = 0
+        self.falhas = 0
+
+    async def ensure_indexes(self, collection):
+        await collection.create_index("id", unique=True)
+        await collection.create_index([("status", 1), ("proxima_tentativa", 1)])
+
+    async def start(self, collection, cache_collection=None):
+        """Recupera jobs abandonados e inicia os workers"""
+        self.collection = collection
+        self.cache_collection = cache_collection
+        self._wakeup = asyncio.Event()
+
+        # Jobs em "processando" podem ser de workers vivos de outras
+        # instâncias: só volta para a fila quem está com o lease vencido
+        await self._recover_expired()
+
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Fila de transcrição iniciada com {self.workers} workers")
+
+    async def _recover(self, filtro: Dict) -> int:
+        """Devolve para a fila os jobs em "processando" que casam com o filtro"""
+        recuperados = await self.collection.update_many(
+            filtro,
+            {"$set": {"status": PENDENTE, "atualizado_em": datetime.now(timezone.utc).isoformat()}}
+        )
+        if recuperados.modified_count:
+            logger.info(f"{recuperados.modified_count} transcrições abandonadas voltaram para a fila")
+            if self._wakeup:
+                self._wakeup.set()
+        return recuperados.modified_count
+
+    async def _recover_expired(self) -> int:
+        """Jobs com lease vencido (worker travado ou outra instância que caiu)"""
+        now = datetime.now(timezone.utc)
+        limite = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+        return await self._recover({
+            "status": PROCESSANDO,
+            "$or": [
+                {"lease_ate": {"$lt": now.isoformat()}},
+                # Jobs reivindicados antes de existir lease_ate
+                {"lease_ate": {"$exists": False}, "iniciado_em": {"$lte": limite}}
+            ]
+        })
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def pending_count(self) -> int:
+        return await self.collection.count_documents({"status": {"$in": [PENDENTE, PROCESSANDO]}})
+
+    async def enqueue(
+        self,
+        audio_path: str,
+        contexto: Optional[Dict] = None,
+        max_wait: float = 30.0,
+        audio_sha256: Optional[str] = None
+    ) -> Dict:
+        """
+        Cria um job de transcrição
+
+        Se o backlog estiver acima de TRANSCRIPTION_MAX_PENDING, aguarda até
+        `max_wait` segundos para que os workers esvaziem a fila antes de gravar.
+
+        Args:
+            audio_path: Arquivo de áudio já gravado no armazenamento
+            contexto: Dados repassados a on_complete (cliente, notificação etc.)
+            audio_sha256: Hash do áudio (chave do cache); calculado no worker se ausente
+        """
+        espera = 0.5
+        aguardado = 0.0
+        while aguardado < max_wait and await self.pending_count() >= self.max_pending:
+            await asyncio.sleep(espera)
+            aguardado += espera
+            espera = min(espera * 2, 5.0)
+
+        now = datetime.now(timezone.utc).isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "audio_path": audio_path,
+            "audio_sha256": audio_sha256,
+            "contexto": contexto or {},
+            "status": PENDENTE,
+            "tentativas": 0,
+            "proxima_tentativa": now,
+            "criado_em": now,
+            "atualizado_em": now,
+            "transcription": None,
+            "ultimo_erro": None
+        }
+        await self.collection.insert_one(dict(job))
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def get_stats(self) -> Dict:
+        """Quantidade de jobs por status"""
+        por_status = {
+            item["_id"]: item["total"]
+            async for item in self.collection.aggregate([
+                {"$group": {"_id": "$status", "total": {"$sum": 1}}}
+            ])
+        }
+        return {
+            "workers": self.workers,
+            "limite_backlog": self.max_pending,
+            "por_status": por_status,
+            "concluidos": self.concluidos,
+            "falhas": self.falhas,
+            "cache": transcription_cache.get_stats()
+        }
+
+    async def _claim(self) -> Optional[Dict]:
+        agora = datetime.now(timezone.utc)
+        now = agora.isoformat()
+        lease_ate = (agora + timedelta(seconds=self.lease_seconds)).isoformat()
+        job = await self.collection.find_one_and_update(
+            {"status": PENDENTE, "proxima_tentativa": {"$lte": now}},
+            {"$set": {"status": PROCESSANDO, "iniciado_em": now, "lease_ate": lease_ate,
+                      "atualizado_em": now},
+             "$inc": {"tentativas": 1}},
+            sort=[("proxima_tentativa", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            job.pop("_id", None)
+        return job
+
+    def retry_delay(self, tentativas: int) -> float:
+        """Backoff exponencial com jitter: base * 2^(n-1), até 15 minutos"""
+        delay = min(self.base_delay * (2 ** (tentativas - 1)), self.max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _worker(self, numero: int):
+        loop = asyncio.get_running_loop()
+        proxima_varredura = loop.time() + self.lease_seconds
+        while True:
+            try:
+                # Um único worker varre os leases vencidos
+                if numero == 0 and loop.time() >= proxima_varredura:
+                    proxima_varredura = loop.time() + self.lease_seconds
+                    await self._recover_expired()
+
+                job = await self._claim()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no worker de transcrição {numero}: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _transcribe(self, job: Dict) -> Optional[str]:
+        """Transcreve pelo cache de conteúdo quando ele está configurado"""
+        def compute():
+            return asyncio.to_thread(transcription_service.transcribe_audio, job["audio_path"])
+
+        if self.cache_collection is None:
+            return await compute()
+
+        sha256 = job.get("audio_sha256") or await asyncio.to_thread(_hash_file, job["audio_path"])
+        key = transcription_service.cache_key(sha256)
+        if key is None:
+            return await compute()
+        return await transcription_cache.get_or_compute(self.cache_collection, key, compute)
+
+    async def _process(self, job: Dict):
+        inicio = datetime.now(timezone.utc)
+        try:
+            transcription = await self._transcribe(job)
+            erro = None if transcription is not None else "Falha na transcrição"
+        except Exception as e:
+            transcription = None
+            erro = str(e)
+
+        if erro is None and self.on_complete:
+            # O job só conclui depois que o resultado foi aplicado; se
+            # on_complete falhar, a nova tentativa sai do cache de transcrições
+            try:
+                await self.on_complete({**job, "status": CONCLUIDO, "transcription": transcription})
+            except Exception as e:
+                erro = f"Erro ao aplicar a transcrição: {str(e)}"
+
+        now = datetime.now(timezone.utc)
+        if erro is None:
+            job.update(status=CONCLUIDO, transcription=transcription)
+            await self.collection.update_one({"id": job["id"]}, {"$set": {
+                "status": CONCLUIDO,
+                "transcription": transcription,
+                "ultimo_erro": None,
+                "concluido_em": now.isoformat(),
+                "atualizado_em": now.isoformat(),
+                "duracao_ms": int((now - inicio).total_seconds() * 1000)
+            }})
+            self.concluidos += 1
+            return
+
+        if job["tentativas"] < self.max_attempts:
+            proxima = now + timedelta(seconds=self.retry_delay(job["tentativas"]))
+            await self.collection.update_one({"id": job["id"]}, {"$set": {
+                "status": PENDENTE,
+                "ultimo_erro": erro,
+                "proxima_tentativa": proxima.isoformat(),
+                "atualizado_em": now.isoformat()
+            }})
+            logger.warning(
+                f"Transcrição {job['id']} falhou (tentativa {job['tentativas']}), "
+                f"nova tentativa às {proxima.strftime('%H:%M:%S')}"
+            )
+            return
+
+        job.update(status=FALHOU, ultimo_erro=erro)
+        await self.collection.update_one({"id": job["id"]}, {"$set": {
+            "status": FALHOU,
+            "ultimo_erro": erro,
+            "atualizado_em": now.isoformat()
+        }})
+        self.falhas += 1
+        logger.error(f"Transcrição {job['id']} desistida após {job['tentativas']} tentativas: {erro}")
+        if self.on_failed:
+            await self.on_failed(job)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Instância global
+transcription_queue = TranscriptionQueue()
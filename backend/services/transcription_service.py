@@ -1,29 +1,264 @@
 """
 Serviço de transcrição de áudio
-Suporta OpenAI Whisper, Google Speech-to-Text, ou serviço local
+Suporta OpenAI Whisper (API) ou modelo local (faster-whisper / CTranslate2)
+
+O backend é escolhido por implantação com TRANSCRIPTION_BACKEND:
+    openai  - API da OpenAI (OPENAI_API_KEY ou EMERGENT_LLM_KEY)
+    local   - faster-whisper em CPU, int8, em um pool de processos
+    auto    - (padrão) openai se houver chave, senão simulado
+
+Com ffmpeg disponível, o áudio passa antes pelo pré-processamento
+(16 kHz mono, sem silêncio, trechos com sobreposição transcritos em paralelo).
 """
 import os
+import abc
+import json
 import logging
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import Optional
 import requests
+from services.audio_preprocessing import audio_preprocessor, merge_transcripts
+from services.transcription_cache import transcription_cache
 
 logger = logging.getLogger(__name__)
 
+
+class TranscriptionBackend(abc.ABC):
+    """Interface dos motores de transcrição"""
+
+    name = "base"
+    model: Optional[str] = None
+    language = "pt"
+
+    @abc.abstractmethod
+    def transcribe(self, audio_file_path: str) -> Optional[str]:
+        """Retorna o texto transcrito ou None se falhar"""
+
+    def shutdown(self):
+        pass
+
+
+class SimulatedBackend(TranscriptionBackend):
+    """Usado quando nenhum motor está configurado"""
+
+    name = "simulado"
+
+    def transcribe(self, audio_file_path: str) -> Optional[str]:
+        logger.info("[SIMULADO] Transcrição de áudio não disponível")
+        return "[Transcrição não disponível - Configure OPENAI_API_KEY ou EMERGENT_LLM_KEY]"
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Whisper pela API HTTP da OpenAI"""
+
+    name = "openai"
+    url = "https://api.openai.com/v1/audio/transcriptions"
+
+    def __init__(self, api_key: str, model: str = "whisper-1", language: str = "pt"):
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+
+    def transcribe(self, audio_file_path: str) -> Optional[str]:
+        try:
+            headers = {
+                "Authorization": f"Bearer {self.api_key}"
+            }
+
+            with open(audio_file_path, 'rb') as audio_file:
+                files = {
+                    'file': audio_file,
+                    'model': (None, self.model),
+                    'language': (None, self.language)
+                }
+
+                response = requests.post(self.url, headers=headers, files=files, timeout=60)
+                response.raise_for_status()
+
+                return response.json().get('text', '')
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Erro ao transcrever áudio: {str(e)}")
+            return None
+
+
+# Modelo carregado uma vez em cada processo do pool local
+_worker_model = None
+
+
+def _init_local_worker(model_name: str, device: str, compute_type: str, cpu_threads: int):
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(
+        model_name,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads
+    )
+
+
+def _transcribe_in_worker(audio_file_path: str, language: str, beam_size: int) -> str:
+    segments, _ = _worker_model.transcribe(audio_file_path, language=language, beam_size=beam_size)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    faster-whisper (CTranslate2) em um pool de processos
+
+    Cada processo carrega o modelo uma única vez no initializer; o pool é
+    criado no primeiro uso com contexto spawn (seguro com as threads do
+    servidor). Threads por processo = núcleos / processos, para não competir.
+    Os trechos de um áudio são transcritos em paralelo por várias threads:
+    criação, shutdown e encerramento do pool são serializados por uma trava.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.model_name = os.environ.get('WHISPER_MODEL', 'small')
+        self.device = os.environ.get('WHISPER_DEVICE', 'cpu')
+        self.compute_type = os.environ.get('WHISPER_COMPUTE_TYPE', 'int8')
+        self.language = os.environ.get('WHISPER_LANGUAGE', 'pt')
+        self.beam_size = int(os.environ.get('WHISPER_BEAM_SIZE', '1'))
+        self.processes = int(os.environ.get('TRANSCRIPTION_PROCESSES', '1'))
+        self.cpu_threads = int(os.environ.get(
+            'WHISPER_CPU_THREADS', str(max(1, (os.cpu_count() or 1) // self.processes))
+        ))
+        self.timeout = int(os.environ.get('TRANSCRIPTION_TIMEOUT_SECONDS', '600'))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return f"faster-whisper-{self.model_name}-{self.compute_type}"
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_local_worker,
+                    initargs=(self.model_name, self.device, self.compute_type, self.cpu_threads)
+                )
+                logger.info(
+                    f"Pool de transcrição local: {self.processes} processos x {self.cpu_threads} threads "
+                    f"({self.model_name}, {self.compute_type})"
+                )
+            return self._pool
+
+    def _detach(self, pool: Optional[ProcessPoolExecutor] = None) -> Optional[ProcessPoolExecutor]:
+        """
+        Tira o pool de uso (o próximo acesso cria outro)
+
+        Com `pool` informado, só o retira se ele ainda for o atual: outra
+        thread pode já ter encerrado esse pool e criado um novo.
+        """
+        with self._pool_lock:
+            if pool is not None and pool is not self._pool:
+                return None
+            pool, self._pool = self._pool, None
+            return pool
+
+    def transcribe(self, audio_file_path: str) -> Optional[str]:
+        pool = None
+        try:
+            pool = self.pool
+            future = pool.submit(_transcribe_in_worker, audio_file_path, self.language, self.beam_size)
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # future.cancel() não interrompe um processo que já está transcrevendo:
+            # encerra o pool para liberar a CPU (transcrições em andamento nos
+            # outros processos falham e voltam pela fila) e recria no próximo uso
+            logger.error(f"Transcrição local excedeu {self.timeout}s: {Path(audio_file_path).name}")
+            self._terminate(pool)
+            return None
+        except BrokenProcessPool as e:
+            # Processo morreu (ex: falta de memória ao carregar o modelo): recria no próximo uso
+            logger.error(f"Pool de transcrição local interrompido: {str(e)}")
+            self.shutdown(pool)
+            return None
+        except Exception as e:
+            logger.error(f"Erro na transcrição local: {str(e)}")
+            return None
+
+    def shutdown(self, pool: Optional[ProcessPoolExecutor] = None):
+        pool = self._detach(pool)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _terminate(self, pool: Optional[ProcessPoolExecutor] = None):
+        pool = self._detach(pool)
+        if pool is None:
+            return
+        # ProcessPoolExecutor não expõe os processos; _processes é estável desde o 3.3
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_backend(name: Optional[str] = None) -> TranscriptionBackend:
+    """
+    Instancia o backend configurado (ou o informado, ex: no benchmark)
+    """
+    name = (name or os.environ.get('TRANSCRIPTION_BACKEND', 'auto')).lower()
+    api_key = os.environ.get('EMERGENT_LLM_KEY', '') or os.environ.get('OPENAI_API_KEY', '')
+
+    if name == "local":
+        return LocalWhisperBackend()
+    if name == "openai" or (name == "auto" and api_key):
+        if not api_key:
+            logger.warning("TRANSCRIPTION_BACKEND=openai sem OPENAI_API_KEY/EMERGENT_LLM_KEY")
+        return OpenAIWhisperBackend(api_key)
+    if name not in ("auto", "simulado"):
+        logger.warning(f"Backend de transcrição desconhecido: {name}")
+    return SimulatedBackend()
+
+
+def audio_duration(audio_file_path: str) -> Optional[float]:
+    """
+    Duração do áudio em segundos via ffprobe (None se indisponível)
+    """
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", audio_file_path],
+            capture_output=True, text=True, timeout=30, check=True
+        )
+        return float(json.loads(result.stdout)["format"]["duration"])
+    except (OSError, subprocess.SubprocessError, KeyError, ValueError):
+        return None
+
+
 class TranscriptionService:
     """Serviço para transcrever áudios"""
     
     def __init__(self):
-        self.openai_api_key = os.environ.get('OPENAI_API_KEY', '')
-        self.emergent_api_key = os.environ.get('EMERGENT_LLM_KEY', '')
-        self.use_openai = bool(self.openai_api_key or self.emergent_api_key)
+        self.backend = create_backend()
+        self.chunk_parallelism = int(os.environ.get('TRANSCRIPTION_CHUNK_PARALLELISM', '4'))
         
-        if not self.use_openai:
+        if isinstance(self.backend, SimulatedBackend):
             logger.warning("API de transcrição não configurada. Transcrições não serão realizadas.")
     
+    def cache_key(self, sha256: str) -> Optional[str]:
+        """
+        Chave do cache de transcrições (None para o backend simulado)
+        """
+        if not self.backend.model:
+            return None
+        return transcription_cache.make_key(sha256, self.backend.model, self.backend.language)
+    
     def transcribe_audio(self, audio_file_path: str) -> Optional[str]:
         """
-        Transcreve áudio usando OpenAI Whisper API
+        Transcreve áudio usando o backend configurado
         
         Args:
             audio_file_path: Caminho do arquivo de áudio
@@ -31,43 +266,42 @@ class TranscriptionService:
         Returns:
             Texto transcrito ou None se falhar
         """
-        if not self.use_openai:
-            logger.info("[SIMULADO] Transcrição de áudio não disponível")
-            return "[Transcrição não disponível - Configure OPENAI_API_KEY ou EMERGENT_LLM_KEY]"
-        
         try:
-            # Usar Emergent LLM Key se disponível, senão OpenAI direta
-            api_key = self.emergent_api_key if self.emergent_api_key else self.openai_api_key
-            
-            url = "https://api.openai.com/v1/audio/transcriptions"
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            with open(audio_file_path, 'rb') as audio_file:
-                files = {
-                    'file': audio_file,
-                    'model': (None, 'whisper-1'),
-                    'language': (None, 'pt')  # Português
-                }
-                
-                response = requests.post(url, headers=headers, files=files, timeout=60)
-                response.raise_for_status()
-                
-                result = response.json()
-                transcription = result.get('text', '')
-                
-                logger.info(f"Áudio transcrito com sucesso: {Path(audio_file_path).name}")
-                return transcription
-        
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro ao transcrever áudio: {str(e)}")
-            return None
+            if audio_preprocessor.available and not isinstance(self.backend, SimulatedBackend):
+                transcription = self._transcribe_chunks(audio_file_path)
+            else:
+                transcription = self.backend.transcribe(audio_file_path)
+            if transcription is not None:
+                logger.info(f"Áudio transcrito com sucesso ({self.backend.name}): {Path(audio_file_path).name}")
+            return transcription
         except Exception as e:
             logger.error(f"Erro inesperado na transcrição: {str(e)}")
             return None
     
+    def _transcribe_chunks(self, audio_file_path: str) -> Optional[str]:
+        """
+        Pré-processa o áudio e transcreve os trechos em paralelo
+
+        Qualquer trecho com falha invalida o resultado (a fila tenta de novo).
+        """
+        with tempfile.TemporaryDirectory(prefix="transcricao_") as workdir:
+            try:
+                chunks = audio_preprocessor.prepare(audio_file_path, Path(workdir))
+            except subprocess.SubprocessError as e:
+                logger.warning(f"Pré-processamento falhou, enviando o áudio original: {str(e)}")
+                return self.backend.transcribe(audio_file_path)
+            if not chunks:
+                return ""
+            if len(chunks) == 1:
+                return self.backend.transcribe(str(chunks[0]))
+
+            with ThreadPoolExecutor(max_workers=min(self.chunk_parallelism, len(chunks))) as pool:
+                texts = list(pool.map(self.backend.transcribe, [str(chunk) for chunk in chunks]))
+
+        if any(text is None for text in texts):
+            return None
+        return merge_transcripts(texts)
+    
     def transcribe_with_metadata(self, audio_file_path: str) -> dict:
         """
         Transcreve áudio e retorna com metadados
@@ -81,9 +315,13 @@ class TranscriptionService:
             "transcription": transcription,
             "filename": file_path.name,
             "file_size": file_path.stat().st_size if file_path.exists() else 0,
+            "backend": self.backend.name,
             "error": None if transcription else "Falha na transcrição"
         }
 
+    def shutdown(self):
+        self.backend.shutdown()
+
 
 # Instância global
 transcription_service = TranscriptionService()
@@ -0,0 +1,405 @@
+"""
+Uploads em streaming com limite por tipo e retomada (estilo tus)
+
+O cliente cria uma sessão informando o tamanho total, envia o arquivo em
+partes (PATCH com Upload-Offset) e pode retomar do último offset gravado
+depois de uma queda de conexão. Cada parte é gravada direto no arquivo
+parcial dentro do blob store, com o SHA-256 calculado incrementalmente.
+
+O upload simples (multipart) também é lido do socket em streaming: a parte
+do arquivo vai direto para o blob store, com o limite do content-type dela
+aplicado assim que os headers da parte chegam.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Collection, Dict, List, Optional, Tuple
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from services.blob_store import BlobStore, BlobTooLarge, BlobWriter, blob_store, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Limites por tipo de conteúdo (prefixo do content-type)
+UPLOAD_LIMITS = {
+    "application/pdf": 50 * MB,
+    "image/": 20 * MB,
+    "audio/": 50 * MB,
+    "video/": 200 * MB,
+}
+DEFAULT_UPLOAD_LIMIT = int(os.environ.get('UPLOAD_MAX_MB', '25')) * MB
+
+# Folga para os campos e delimitadores do multipart além do arquivo
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Tamanho máximo de cada campo de texto do multipart
+MULTIPART_FIELD_MAX = 16 * 1024
+
+# Arquivos parciais sem sessão só são removidos depois dessa idade
+# (a sessão é gravada no banco logo depois de criar o arquivo)
+ABANDONED_UPLOAD_GRACE_SECONDS = 60 * 60
+
+
+class MultipartError(ValueError):
+    """Corpo multipart malformado ou sem a parte do arquivo"""
+
+
+class UploadOffsetMismatch(Exception):
+    """Parte enviada não começa no offset atual da sessão"""
+
+    def __init__(self, expected: int):
+        self.expected = expected
+        super().__init__(f"Offset esperado: {expected}")
+
+
+def max_upload_size(content_type: Optional[str]) -> int:
+    """
+    Retorna o tamanho máximo aceito para o content-type
+    """
+    content_type = (content_type or "").lower()
+    for prefix, limit in UPLOAD_LIMITS.items():
+        if content_type.startswith(prefix):
+            return limit
+    return DEFAULT_UPLOAD_LIMIT
+
+
+def check_upload_size(size: Optional[int], content_type: Optional[str]):
+    """
+    Rejeita cedo uploads cujo tamanho declarado excede o limite do tipo
+    """
+    limit = max_upload_size(content_type)
+    if size is not None and size > limit:
+        raise BlobTooLarge(limit)
+
+
+def check_request_size(content_length: Optional[str]) -> int:
+    """
+    Valida o Content-Length de um upload multipart antes de ler o corpo
+
+    Filtro grosso pelo maior limite entre os tipos; o limite do tipo do
+    arquivo é aplicado por receive_multipart quando os headers da parte chegam.
+
+    Raises:
+        ValueError: Content-Length ausente ou inválido
+        BlobTooLarge: corpo maior que qualquer upload aceito
+    """
+    size = int(content_length or "")
+    limit = max(DEFAULT_UPLOAD_LIMIT, *UPLOAD_LIMITS.values())
+    if size > limit + MULTIPART_OVERHEAD:
+        raise BlobTooLarge(limit)
+    return size
+
+
+class _MultipartCollector:
+    """Callbacks do parser: campos em memória, dados do arquivo em buffer"""
+
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_type: Optional[str] = None
+        # Cabeçalhos do arquivo lidos: o chamador já pode aplicar o limite do tipo
+        self.file_started = False
+        self.file_buffer = bytearray()
+        self._headers: List[Tuple[bytes, bytes]] = []
+        self._field = b""
+        self._value = b""
+        self._name: Optional[str] = None
+        self._in_file = False
+        self._data = bytearray()
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = []
+        self._field = self._value = b""
+        self._data = bytearray()
+        self._in_file = False
+
+    def _header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers.append((self._field.lower(), self._value))
+        self._field = self._value = b""
+
+    def _headers_finished(self):
+        headers = dict(self._headers)
+        _, opcoes = parse_options_header(headers.get(b"content-disposition", b""))
+        self._name = opcoes.get(b"name", b"").decode("utf-8", "replace")
+        if self._name == self.file_field and b"filename" in opcoes:
+            if self.file_started:
+                raise MultipartError(f"Mais de uma parte '{self.file_field}' no upload")
+            self._in_file = True
+            self.file_started = True
+            self.filename = opcoes[b"filename"].decode("utf-8", "replace")
+            self.file_type = headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.file_buffer.extend(data[start:end])
+            return
+        if len(self._data) + end - start > MULTIPART_FIELD_MAX:
+            raise MultipartError(f"Campo {self._name} excede {MULTIPART_FIELD_MAX} bytes")
+        self._data.extend(data[start:end])
+
+    def _part_end(self):
+        if not self._in_file and self._name:
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+
+
+class StreamedUpload:
+    """Arquivo de um multipart já gravado em tmp/ do blob store"""
+
+    def __init__(self, store: BlobStore, fields: Dict[str, str], filename: str,
+                 content_type: Optional[str], temp: Tuple[Path, str, int]):
+        self.store = store
+        self.fields = fields
+        self.filename = filename
+        self.content_type = content_type
+        self._temp_path, self.sha256, self.size = temp
+
+    def commit(self, dest: Path) -> Dict:
+        """Move para o blob store e liga a dest"""
+        return self.store.adopt(self._temp_path, self.sha256, self.size, dest)
+
+    def discard(self):
+        self._temp_path.unlink(missing_ok=True)
+
+
+async def receive_multipart(
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str],
+    content_length: Optional[int] = None,
+    file_field: str = "file",
+    store: BlobStore = blob_store
+) -> StreamedUpload:
+    """
+    Lê um corpo multipart/form-data do socket sem spool intermediário
+
+    A parte `file_field` é gravada direto em tmp/ do blob store (hash
+    calculado na escrita); assim que os headers dela chegam, o limite do
+    content-type declarado é aplicado ao Content-Length e aos bytes lidos.
+
+    Raises:
+        MultipartError: corpo malformado ou sem o arquivo
+        BlobTooLarge: arquivo acima do limite do tipo
+    """
+    tipo, opcoes = parse_options_header(content_type or "")
+    boundary = opcoes.get(b"boundary")
+    if tipo != b"multipart/form-data" or not boundary:
+        raise MultipartError("Content-Type multipart/form-data com boundary obrigatório")
+
+    coletor = _MultipartCollector(file_field)
+    parser = MultipartParser(boundary, coletor.callbacks())
+    writer: Optional[BlobWriter] = None
+    try:
+        async for chunk in chunks:
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise MultipartError(f"Multipart malformado: {e}") from e
+            if coletor.file_started and writer is None:
+                limite = max_upload_size(coletor.file_type)
+                if content_length is not None and content_length > limite + MULTIPART_OVERHEAD:
+                    raise BlobTooLarge(limite)
+                writer = await asyncio.to_thread(store.writer, limite)
+            if writer is not None and len(coletor.file_buffer) >= CHUNK_SIZE:
+                dados = bytes(coletor.file_buffer)
+                coletor.file_buffer.clear()
+                await asyncio.to_thread(writer.write, dados)
+        try:
+            parser.finalize()
+        except MultipartParseError as e:
+            raise MultipartError(f"Multipart malformado: {e}") from e
+
+        if writer is None:
+            raise MultipartError(f"Parte '{file_field}' ausente no upload")
+        if coletor.file_buffer:
+            await asyncio.to_thread(writer.write, bytes(coletor.file_buffer))
+        temp = await asyncio.to_thread(writer.finish)
+    except BaseException:
+        if writer is not None:
+            await asyncio.to_thread(writer.abort)
+        raise
+
+    return StreamedUpload(store, coletor.fields, coletor.filename, coletor.file_type, temp)
+
+
+class ResumableUploadService:
+    """Grava as partes das sessões de upload e finaliza no blob store"""
+
+    def __init__(self, store: BlobStore):
+        self.store = store
+        # upload_id -> (offset já incluído no hash, hasher)
+        self._hashers: Dict[str, tuple] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def partial_path(self, upload_id: str) -> Path:
+        return self.store.tmp_dir / f"upload_{upload_id}.part"
+
+    def create(self, upload_id: str):
+        """Cria o arquivo parcial vazio da sessão"""
+        self.partial_path(upload_id).touch()
+        self._hashers[upload_id] = (0, hashlib.sha256())
+
+    def current_offset(self, upload_id: str) -> int:
+        """Offset real gravado em disco (fonte da verdade para retomada)"""
+        path = self.partial_path(upload_id)
+        return path.stat().st_size if path.exists() else 0
+
+    async def write_chunks(
+        self,
+        upload_id: str,
+        offset: int,
+        total_size: int,
+        chunks: AsyncIterator[bytes]
+    ) -> int:
+        """
+        Grava as partes recebidas a partir de `offset`
+
+        Os dados são reagrupados em blocos de CHUNK_SIZE antes de ir para o
+        disco, então a memória usada por upload é constante.
+
+        Returns:
+            Novo offset da sessão
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            current = await asyncio.to_thread(self.current_offset, upload_id)
+            if offset != current:
+                raise UploadOffsetMismatch(current)
+
+            hashed_offset, hasher = self._hashers.get(upload_id, (None, None))
+            if hashed_offset != current:
+                # Processo reiniciado ou hash fora de sincronia: recalcula no final
+                hasher = None
+
+            f = await asyncio.to_thread(open, self.partial_path(upload_id), 'ab')
+            buffer = bytearray()
+            try:
+                async for chunk in chunks:
+                    if current + len(buffer) + len(chunk) > total_size:
+                        raise BlobTooLarge(total_size)
+                    buffer.extend(chunk)
+                    if len(buffer) >= CHUNK_SIZE:
+                        current += await self._flush(f, buffer, hasher)
+                        buffer = bytearray()
+                if buffer:
+                    current += await self._flush(f, buffer, hasher)
+            finally:
+                await asyncio.to_thread(f.close)
+                # Mantém o hash parcial mesmo se a conexão cair no meio
+                if hasher is not None:
+                    self._hashers[upload_id] = (current, hasher)
+                else:
+                    self._hashers.pop(upload_id, None)
+
+            return current
+
+    @staticmethod
+    async def _flush(f, buffer: bytearray, hasher) -> int:
+        data = bytes(buffer)
+        if hasher is not None:
+            hasher.update(data)
+        await asyncio.to_thread(f.write, data)
+        return len(data)
+
+    async def finalize(self, upload_id: str, total_size: int, dest: Path) -> Dict:
+        """
+        Move o arquivo completo para o blob store e liga a dest
+
+        Roda sob a trava da sessão: de dois PATCH finais concorrentes só um
+        finaliza, o outro recebe UploadOffsetMismatch.
+
+        Returns:
+            {"sha256", "size", "path", "novo"}
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            current = await asyncio.to_thread(self.current_offset, upload_id)
+            if current != total_size:
+                raise UploadOffsetMismatch(current)
+            blob = await asyncio.to_thread(self._finalize, upload_id, dest)
+            self._locks.pop(upload_id, None)
+            return blob
+
+    def _finalize(self, upload_id: str, dest: Path) -> Dict:
+        path = self.partial_path(upload_id)
+        size = path.stat().st_size
+
+        hashed_offset, hasher = self._hashers.pop(upload_id, (None, None))
+        if hasher is not None and hashed_offset == size:
+            sha256 = hasher.hexdigest()
+        else:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            sha256 = digest.hexdigest()
+
+        return self.store.adopt(path, sha256, size, dest)
+
+    def discard(self, upload_id: str):
+        """Remove o arquivo parcial de uma sessão abandonada"""
+        self.partial_path(upload_id).unlink(missing_ok=True)
+        self._hashers.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+
+    async def sweep(self, active_ids: Collection[str]) -> int:
+        """
+        Remove arquivos parciais e estado em memória de sessões que não
+        existem mais (ex: expiradas pelo índice TTL de upload_sessions)
+
+        Returns:
+            Quantidade de arquivos parciais removidos
+        """
+        removidos = await asyncio.to_thread(self._sweep_files, active_ids)
+
+        for upload_id in [u for u in self._hashers if u not in active_ids]:
+            if not self.partial_path(upload_id).exists():
+                self._hashers.pop(upload_id, None)
+        for upload_id in [u for u in self._locks if u not in active_ids]:
+            if not self._locks[upload_id].locked() and not self.partial_path(upload_id).exists():
+                self._locks.pop(upload_id, None)
+
+        if removidos:
+            logger.info(f"{removidos} uploads abandonados removidos")
+        return removidos
+
+    def _sweep_files(self, active_ids: Collection[str]) -> int:
+        limite = time.time() - ABANDONED_UPLOAD_GRACE_SECONDS
+        removidos = 0
+        for path in self.store.tmp_dir.glob("upload_*.part"):
+            upload_id = path.name[len("upload_"):-len(".part")]
+            if upload_id in active_ids:
+                continue
+            try:
+                if path.stat().st_mtime >= limite:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removidos += 1
+        return removidos
+
+
+# Instância global
+resumable_uploads = ResumableUploadService(blob_store)
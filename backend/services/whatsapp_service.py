@@ -2,9 +2,12 @@
 Serviço para integração com Z-API WhatsApp Business
 """
 import os
+import time
+import threading
 import requests
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
+from services.message_templates import render_message, render_batch
 
 logger = logging.getLogger(__name__)
 
@@ -17,24 +20,72 @@ class WhatsAppService:
         self.api_token = os.environ.get('ZAPI_TOKEN', '')
         self.enabled = bool(self.api_url and self.instance_id and self.api_token)
         
+        # Contadores por template: envios, falhas e latência (ms)
+        self._metrics: Dict[str, Dict] = {}
+        self._metrics_lock = threading.Lock()
+        
         if not self.enabled:
             logger.warning("Z-API WhatsApp não configurado. Mensagens não serão enviadas.")
     
-    def _send_message(self, phone: str, message: str) -> bool:
+    def _record_metrics(self, template: str, success: bool, latency_ms: float):
+        """Atualiza os contadores de envio do template"""
+        with self._metrics_lock:
+            stats = self._metrics.setdefault(template, {
+                "enviadas": 0,
+                "falhas": 0,
+                "latencia_total_ms": 0.0,
+                "latencia_max_ms": 0.0
+            })
+            stats["enviadas"] += 1
+            if not success:
+                stats["falhas"] += 1
+            stats["latencia_total_ms"] += latency_ms
+            stats["latencia_max_ms"] = max(stats["latencia_max_ms"], latency_ms)
+    
+    def get_metrics(self) -> Dict[str, Dict]:
+        """
+        Retorna os contadores de envio por template
+        """
+        with self._metrics_lock:
+            snapshot = {}
+            for template, stats in self._metrics.items():
+                snapshot[template] = {
+                    **stats,
+                    "latencia_media_ms": round(stats["latencia_total_ms"] / stats["enviadas"], 2)
+                        if stats["enviadas"] else 0.0
+                }
+            return snapshot
+    
+    def _send_message(self, phone: str, message: str, template: str = "texto") -> Dict:
         """
         Envia mensagem de texto via Z-API
         
         Args:
             phone: Número do WhatsApp (formato: 5511999999999)
             message: Texto da mensagem
+            template: Nome do template usado (para métricas)
             
         Returns:
-            True se enviado com sucesso, False caso contrário
+            Registro do envio com success, message_id (Z-API) e latência
         """
+        result = {
+            "success": False,
+            "phone": phone,
+            "template": template,
+            "message_id": None,
+            "zaap_id": None,
+            "simulado": not self.enabled,
+            "latency_ms": 0.0,
+            "error": None
+        }
+        
         if not self.enabled:
             logger.info(f"[SIMULADO] Mensagem para {phone}: {message}")
-            return True
+            result["success"] = True
+            self._record_metrics(template, True, 0.0)
+            return result
         
+        start = time.perf_counter()
         try:
             url = f"{self.api_url}/send-text"
             
@@ -51,46 +102,60 @@ class WhatsAppService:
             response = requests.post(url, json=payload, headers=headers, timeout=10)
             response.raise_for_status()
             
+            # Z-API retorna {"zaapId": ..., "messageId": ..., "id": ...}
+            data = response.json() if response.content else {}
+            result["message_id"] = data.get("messageId") or data.get("id")
+            result["zaap_id"] = data.get("zaapId")
+            result["success"] = True
+            
             logger.info(f"Mensagem enviada com sucesso para {phone}")
-            return True
         
         except requests.exceptions.RequestException as e:
             logger.error(f"Erro ao enviar mensagem WhatsApp: {str(e)}")
-            return False
+            result["error"] = str(e)
         except Exception as e:
             logger.error(f"Erro inesperado ao enviar WhatsApp: {str(e)}")
-            return False
+            result["error"] = str(e)
+        
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        self._record_metrics(template, result["success"], result["latency_ms"])
+        return result
     
-    def enviar_solicitacao_documentos(self, nome: str, phone: str, titulo: str, descricao: str, prazo: Optional[str] = None) -> bool:
+    def enviar_template(self, template: str, phone: str, **params) -> Dict:
         """
-        Envia notificação de solicitação de documentos
+        Renderiza um template registrado e envia para o telefone
         """
-        # Remove caracteres não numéricos do telefone
-        phone_clean = ''.join(filter(str.isdigit, phone))
-        
-        # Adicionar código do país se não tiver
-        if not phone_clean.startswith('55'):
-            phone_clean = '55' + phone_clean
-        
-        prazo_text = f"\n📅 Prazo: {prazo}" if prazo else ""
-        
-        message = f"""🔔 *SOLICITAÇÃO DE DOCUMENTOS*
-
-Olá, {nome}!
-
-O escritório solicitou o envio dos seguintes documentos:
-
-📋 *{titulo}*
-
-{descricao}{prazo_text}
-
-Por favor, acesse sua área do cliente em nosso site/app e faça o upload dos documentos solicitados.
-
-Qualquer dúvida, estamos à disposição!
-
-_Mensagem automática - Consultar Processos_"""
+        phone_clean, message = render_message(template, phone, **params)
+        return self._send_message(phone_clean, message, template)
+    
+    def enviar_em_lote(self, template: str, destinatarios: List[Dict]) -> List[Dict]:
+        """
+        Envia o mesmo template para vários destinatários
         
-        return self._send_message(phone_clean, message)
+        Args:
+            template: Nome do template registrado
+            destinatarios: Lista de dicts com "phone" e os parâmetros do template
+            
+        Returns:
+            Registros de envio na mesma ordem dos destinatários
+        """
+        return [
+            self._send_message(phone_clean, message, template)
+            for phone_clean, message in render_batch(template, destinatarios)
+        ]
+    
+    def enviar_solicitacao_documentos(self, nome: str, phone: str, titulo: str, descricao: str, prazo: Optional[str] = None) -> Dict:
+        """
+        Envia notificação de solicitação de documentos
+        """
+        return self.enviar_template(
+            "solicitacao_documentos",
+            phone,
+            nome=nome,
+            titulo=titulo,
+            descricao=descricao,
+            prazo=prazo
+        )
     
     def enviar_confirmacao_agendamento(
         self, 
@@ -100,67 +165,25 @@ _Mensagem automática - Consultar Processos_"""
         hora: str, 
         tipo: str,
         processo: Optional[str] = None
-    ) -> bool:
+    ) -> Dict:
         """
         Envia confirmação de agendamento de reunião
         """
-        # Remove caracteres não numéricos do telefone
-        phone_clean = ''.join(filter(str.isdigit, phone))
-        
-        # Adicionar código do país se não tiver
-        if not phone_clean.startswith('55'):
-            phone_clean = '55' + phone_clean
-        
-        tipo_emoji = "💻" if tipo == "online" else "🏢"
-        tipo_text = "Online (Videochamada)" if tipo == "online" else "Presencial (No Escritório)"
-        
-        processo_text = f"\n📄 Processo: {processo}" if processo else ""
-        
-        message = f"""✅ *REUNIÃO AGENDADA*
-
-Olá, {nome}!
-
-Sua consulta foi agendada com sucesso:
-
-📅 Data: {data}
-⏰ Horário: {hora}
-{tipo_emoji} Tipo: {tipo_text}{processo_text}
-
-{"O link para a videochamada será enviado próximo ao horário." if tipo == "online" else "O endereço do escritório será confirmado por mensagem."}
-
-Para reagendar ou cancelar, entre em contato conosco.
-
-Até breve!
-
-_Mensagem automática - Consultar Processos_"""
-        
-        return self._send_message(phone_clean, message)
+        return self.enviar_template(
+            "confirmacao_agendamento",
+            phone,
+            nome=nome,
+            data=data,
+            hora=hora,
+            tipo=tipo,
+            processo=processo
+        )
     
-    def enviar_lembrete_aniversario(self, nome: str, phone: str) -> bool:
+    def enviar_lembrete_aniversario(self, nome: str, phone: str) -> Dict:
         """
         Envia mensagem de parabéns de aniversário
         """
-        # Remove caracteres não numéricos do telefone
-        phone_clean = ''.join(filter(str.isdigit, phone))
-        
-        # Adicionar código do país se não tiver
-        if not phone_clean.startswith('55'):
-            phone_clean = '55' + phone_clean
-        
-        message = f"""🎂🎉 *FELIZ ANIVERSÁRIO!*
-
-Olá, {nome}!
-
-Toda a equipe do escritório deseja um feliz aniversário! 🎈
-
-Que este novo ano seja repleto de conquistas, alegrias e realizações.
-
-Conte sempre conosco!
-
-Um grande abraço,
-_Equipe Consultar Processos_"""
-        
-        return self._send_message(phone_clean, message)
+        return self.enviar_template("lembrete_aniversario", phone, nome=nome)
 
 
 # Instância global do serviço
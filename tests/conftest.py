@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Instâncias globais dos serviços criam diretórios no import: fora de /app nos testes
+os.environ.setdefault("BLOB_DIR", tempfile.mkdtemp(prefix="blobs-"))
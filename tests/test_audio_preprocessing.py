@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from services.audio_preprocessing import SAMPLE_RATE, AudioPreprocessor, merge_transcripts, split_chunks
+
+
+def _audio(seconds):
+    return np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_split_chunks_audio_curto_volta_inteiro():
+    samples = _audio(10)
+
+    chunks = split_chunks(samples, 30, 2)
+
+    assert len(chunks) == 1
+    assert chunks[0] is samples
+
+
+def test_split_chunks_exatamente_um_trecho():
+    assert len(split_chunks(_audio(30), 30, 2)) == 1
+
+
+def test_split_chunks_sobreposicao_entre_trechos():
+    samples = _audio(65)
+
+    chunks = split_chunks(samples, 30, 2)
+
+    assert [len(c) / SAMPLE_RATE for c in chunks] == [30, 30, 9]
+    overlap = 2 * SAMPLE_RATE
+    for anterior, proximo in zip(chunks, chunks[1:]):
+        np.testing.assert_array_equal(anterior[-overlap:], proximo[:overlap])
+    assert chunks[-1][-1] == samples[-1]
+
+
+def test_split_chunks_sem_sobreposicao_cobre_o_audio():
+    samples = _audio(60)
+
+    chunks = split_chunks(samples, 30, 0)
+
+    np.testing.assert_array_equal(np.concatenate(chunks), samples)
+
+
+@pytest.mark.parametrize("chunk, overlap", [(30, 30), (30, 45), (30, -1), (0, 0)])
+def test_split_chunks_rejeita_parametros_que_nao_avancam(chunk, overlap):
+    with pytest.raises(ValueError):
+        split_chunks(_audio(120), chunk, overlap)
+
+
+@pytest.mark.parametrize("overlap, esperado", [("30", 15.0), ("40", 15.0), ("-3", 0.0), ("2", 2.0)])
+def test_config_mantem_sobreposicao_abaixo_do_trecho(monkeypatch, overlap, esperado):
+    monkeypatch.setenv("TRANSCRIPTION_CHUNK_SECONDS", "30")
+    monkeypatch.setenv("TRANSCRIPTION_CHUNK_OVERLAP_SECONDS", overlap)
+
+    assert AudioPreprocessor().overlap_seconds == esperado
+
+
+def test_merge_transcripts_remove_palavras_repetidas():
+    assert merge_transcripts(["bom dia doutor", "Doutor, tudo bem"]) == "bom dia doutor tudo bem"
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+from services.blob_store import BlobStore, BlobTooLarge
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_store_deduplica_por_conteudo(store, tmp_path):
+    a = store.store(b"mesmo conteudo", tmp_path / "c1" / "a.pdf")
+    b = store.store(b"mesmo conteudo", tmp_path / "c2" / "b.pdf")
+
+    assert a["novo"] and not b["novo"]
+    assert a["sha256"] == b["sha256"] == _sha(b"mesmo conteudo")
+    assert os.stat(store.blob_path(a["sha256"])).st_nlink == 3
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+def test_adopt_com_blob_existente_descarta_o_temporario(store, tmp_path):
+    store.put(b"abc")
+    temp, sha, size = store._write_temp(b"abc")
+
+    blob = store.adopt(temp, sha, size, tmp_path / "dest.txt")
+
+    assert not blob["novo"]
+    assert not temp.exists()
+    assert (tmp_path / "dest.txt").read_bytes() == b"abc"
+
+
+def test_writer_acima_do_limite_nao_deixa_temporario(store):
+    with pytest.raises(BlobTooLarge):
+        store.put(b"x" * 11, max_size=10)
+
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+def test_link_de_blob_removido_nao_deixa_hardlink_temporario(store, tmp_path):
+    dest = tmp_path / "c1" / "a.pdf"
+
+    with pytest.raises(FileNotFoundError):
+        store.link("00" * 32, dest)
+
+    assert list(dest.parent.iterdir()) == []
+
+
+def test_coleta_remove_so_blobs_sem_hardlink_nem_referencia(store, tmp_path):
+    ligado = store.store(b"ligado", tmp_path / "a.txt")["sha256"]
+    referenciado = store.put(b"referenciado")["sha256"]
+    solto = store.put(b"solto")["sha256"]
+
+    removidos = store.collect_garbage(referenced={referenciado}, min_age_seconds=0)
+
+    assert removidos == [solto]
+    assert store.blob_path(ligado).exists()
+    assert store.blob_path(referenciado).exists()
+
+
+def test_coleta_respeita_a_carencia(store):
+    sha = store.put(b"recente")["sha256"]
+
+    assert store.collect_garbage(min_age_seconds=3600) == []
+    assert store.blob_path(sha).exists()
+
+
+def test_coleta_concorrente_com_adopt_nao_perde_o_blob(store, tmp_path):
+    data = b"conteudo disputado"
+    parar = threading.Event()
+
+    def coletar():
+        while not parar.is_set():
+            store.collect_garbage(min_age_seconds=0)
+
+    coletor = threading.Thread(target=coletar)
+    coletor.start()
+    try:
+        for i in range(200):
+            dest = tmp_path / f"dest_{i}.txt"
+            store.store(data, dest)
+            # Com o hardlink criado sob a trava, o blob nunca fica solto
+            assert dest.read_bytes() == data
+            dest.unlink()
+    finally:
+        parar.set()
+        coletor.join()
+
+    assert list(store.tmp_dir.iterdir()) == []
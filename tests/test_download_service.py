@@ -0,0 +1,72 @@
+import pytest
+
+from services import download_service as modulo
+from services.download_service import DocumentDownloadService, InvalidSignedUrl
+
+DOCUMENTO = {
+    "id": "d1",
+    "filepath": "/app/backend/uploads/u1/a.pdf",
+    "file_type": "application/pdf",
+    "filename": "contrato.pdf",
+    "sha256": "ab" * 32,
+    "enviado_em": "2026-01-01T00:00:00+00:00",
+}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("DOWNLOAD_URL_SECRET", "segredo-de-teste")
+    return DocumentDownloadService()
+
+
+def test_link_assinado_devolve_os_metadados(service):
+    link = service.sign(DOCUMENTO)
+
+    assert service.verify(link["token"]) == DOCUMENTO
+
+
+def test_link_com_corpo_alterado_e_recusado(service):
+    body, _, signature = service.sign(DOCUMENTO)["token"].partition(".")
+    outro_body = service.sign({**DOCUMENTO, "filepath": "/etc/passwd"})["token"].partition(".")[0]
+
+    with pytest.raises(InvalidSignedUrl, match="Assinatura"):
+        service.verify(f"{outro_body}.{signature}")
+
+
+def test_link_com_assinatura_alterada_e_recusado(service):
+    token = service.sign(DOCUMENTO)["token"]
+    adulterado = token[:-1] + ("A" if token[-1] != "A" else "B")
+
+    with pytest.raises(InvalidSignedUrl):
+        service.verify(adulterado)
+
+
+def test_link_de_outro_segredo_e_recusado(service, monkeypatch):
+    monkeypatch.setenv("DOWNLOAD_URL_SECRET", "outro-segredo")
+    token = DocumentDownloadService().sign(DOCUMENTO)["token"]
+
+    with pytest.raises(InvalidSignedUrl, match="Assinatura"):
+        service.verify(token)
+
+
+@pytest.mark.parametrize("token", ["", "sem-ponto", "ção.ção", "abc."])
+def test_token_malformado_e_recusado(service, token):
+    with pytest.raises(InvalidSignedUrl):
+        service.verify(token)
+
+
+def test_link_expirado_e_recusado(service, monkeypatch):
+    link = service.sign(DOCUMENTO, ttl_seconds=60)
+
+    monkeypatch.setattr(modulo.time, "time", lambda: link["expira_em"] + 1)
+
+    with pytest.raises(InvalidSignedUrl, match="expirado"):
+        service.verify(link["token"])
+
+
+def test_validade_limitada_ao_maximo(service, monkeypatch):
+    monkeypatch.setattr(modulo.time, "time", lambda: 1000)
+
+    link = service.sign(DOCUMENTO, ttl_seconds=10 * modulo.SIGNED_URL_MAX_TTL)
+
+    assert link["expira_em"] == 1000 + modulo.SIGNED_URL_MAX_TTL
@@ -0,0 +1,68 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from services.file_index import FileIndex
+
+
+def _meta(path, size=10, mtime="2026-01-01T00:00:00+00:00", sha256=None):
+    return {
+        "client_id": "c1",
+        "categoria": "documentos",
+        "nome": path.rsplit("/", 1)[-1],
+        "path": path,
+        "size": size,
+        "mtime": mtime,
+        "tipo": "application/pdf",
+        "sha256": sha256,
+    }
+
+
+def _reconcile(collection, disco):
+    return asyncio.run(FileIndex().reconcile(collection, "c1", disco))
+
+
+def _docs(collection):
+    async def listar():
+        return {d["path"]: d async for d in collection.find({}, {"_id": 0})}
+    return asyncio.run(listar())
+
+
+def test_reconcile_indexa_arquivos_novos():
+    collection = AsyncMongoMockClient()["t"]["client_files"]
+
+    resultado = _reconcile(collection, [_meta("/c1/a.pdf", sha256="aa")])
+
+    assert resultado == {"verificados": 1, "alterados": 1}
+    assert _docs(collection)["/c1/a.pdf"]["sha256"] == "aa"
+
+
+def test_reconcile_sem_mudancas_nao_grava():
+    collection = AsyncMongoMockClient()["t"]["client_files"]
+    _reconcile(collection, [_meta("/c1/a.pdf", sha256="aa")])
+
+    resultado = _reconcile(collection, [_meta("/c1/a.pdf")])
+
+    assert resultado["alterados"] == 0
+    assert _docs(collection)["/c1/a.pdf"]["sha256"] == "aa"
+
+
+def test_reconcile_remove_sha256_de_arquivo_alterado():
+    collection = AsyncMongoMockClient()["t"]["client_files"]
+    _reconcile(collection, [_meta("/c1/a.pdf", sha256="aa")])
+
+    _reconcile(collection, [_meta("/c1/a.pdf", size=20)])
+
+    doc = _docs(collection)["/c1/a.pdf"]
+    assert doc["size"] == 20
+    assert "sha256" not in doc
+
+
+def test_reconcile_remove_ausentes_e_preserva_camada_fria():
+    collection = AsyncMongoMockClient()["t"]["client_files"]
+    _reconcile(collection, [_meta("/c1/a.pdf"), _meta("/c1/b.pdf")])
+    asyncio.run(collection.update_one({"path": "/c1/b.pdf"}, {"$set": {"camada": "fria"}}))
+
+    _reconcile(collection, [])
+
+    assert list(_docs(collection)) == ["/c1/b.pdf"]